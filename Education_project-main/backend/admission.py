@@ -0,0 +1,159 @@
+"""Token-bucket admission control for the LLM routes.
+
+Each request takes one token from the student's bucket and one from a
+global bucket before any profile read or model call. A request that finds
+either bucket empty is refused with the time until a token is available,
+so the route can answer 429 with Retry-After instead of queueing behind
+the LLM gateway. The student bucket is checked first (a noisy student is
+shed without touching the shared budget) and refunded if the global bucket
+then refuses.
+
+Buckets live in process memory by default. MongoBucketStore keeps them in
+a collection so all workers share one budget; each take is a single atomic
+pipeline update (MongoDB 4.2+). Select it with ADMISSION_STORE=mongo.
+"""
+import os
+import time
+from datetime import datetime, timezone, timedelta
+from typing import Any, Dict, Tuple
+
+from pymongo import ReturnDocument
+
+
+class AdmissionDenied(Exception):
+    def __init__(self, scope: str, retry_after: float):
+        super().__init__(f"{scope} rate limit exceeded")
+        self.scope = scope
+        self.retry_after = retry_after
+
+
+class MemoryBucketStore:
+    def __init__(self, max_buckets: int = 100000):
+        self.max_buckets = max_buckets
+        # key -> (tokens, updated, rate, burst); each bucket keeps its own refill
+        self._buckets: Dict[str, Tuple[float, float, float, float]] = {}
+
+    async def take(self, key: str, rate: float, burst: float, cost: float = 1.0) -> Tuple[bool, float]:
+        now = time.monotonic()
+        tokens, updated, _, _ = self._buckets.get(key, (burst, now, rate, burst))
+        tokens = min(burst, tokens + (now - updated) * rate)
+        granted = tokens >= cost
+        if granted:
+            tokens -= cost
+        if key not in self._buckets and len(self._buckets) >= self.max_buckets:
+            self._prune(now)
+        self._buckets[key] = (tokens, now, rate, burst)
+        return granted, tokens
+
+    async def refund(self, key: str, burst: float, cost: float = 1.0):
+        if key in self._buckets:
+            tokens, updated, rate, burst = self._buckets[key]
+            self._buckets[key] = (min(burst, tokens + cost), updated, rate, burst)
+
+    def _prune(self, now: float):
+        # Buckets that have refilled completely carry no state worth keeping
+        full = [
+            k for k, (tokens, updated, rate, burst) in self._buckets.items()
+            if tokens + (now - updated) * rate >= burst
+        ]
+        for key in full:
+            del self._buckets[key]
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class MongoBucketStore:
+    def __init__(self, collection, idle_ttl: float = 3600.0):
+        # Documents carry expires_at for the TTL index in indexes.py
+        self.collection = collection
+        self.idle_ttl = idle_ttl
+
+    async def take(self, key: str, rate: float, burst: float, cost: float = 1.0) -> Tuple[bool, float]:
+        now = time.time()
+        refilled = {"$min": [burst, {"$add": [
+            {"$ifNull": ["$tokens", burst]},
+            {"$multiply": [{"$subtract": [now, {"$ifNull": ["$updated_at", now]}]}, rate]},
+        ]}]}
+        bucket = await self.collection.find_one_and_update(
+            {"_id": key},
+            [
+                {"$set": {"tokens": refilled, "updated_at": now}},
+                {"$set": {"granted": {"$gte": ["$tokens", cost]}}},
+                {"$set": {
+                    "tokens": {"$cond": ["$granted", {"$subtract": ["$tokens", cost]}, "$tokens"]},
+                    "expires_at": datetime.now(timezone.utc) + timedelta(seconds=self.idle_ttl),
+                }},
+            ],
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        return bucket["granted"], bucket["tokens"]
+
+    async def refund(self, key: str, burst: float, cost: float = 1.0):
+        await self.collection.update_one(
+            {"_id": key}, [{"$set": {"tokens": {"$min": [burst, {"$add": ["$tokens", cost]}]}}}]
+        )
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        store,
+        student_rate: float = 0.5,
+        student_burst: float = 10.0,
+        global_rate: float = 20.0,
+        global_burst: float = 40.0,
+    ):
+        # A rate of 0 or less disables that bucket
+        self.store = store
+        self.student_rate = student_rate
+        self.student_burst = student_burst
+        self.global_rate = global_rate
+        self.global_burst = global_burst
+        self.admitted = 0
+        self.rejected = {"student": 0, "global": 0}
+
+    def _retry_after(self, tokens: float, rate: float) -> float:
+        return max(0.0, (1.0 - tokens) / rate)
+
+    async def admit(self, student_id: str):
+        student_key = f"student:{student_id}"
+        if self.student_rate > 0:
+            granted, tokens = await self.store.take(student_key, self.student_rate, self.student_burst)
+            if not granted:
+                self.rejected["student"] += 1
+                raise AdmissionDenied("student", self._retry_after(tokens, self.student_rate))
+        if self.global_rate > 0:
+            granted, tokens = await self.store.take("global", self.global_rate, self.global_burst)
+            if not granted:
+                if self.student_rate > 0:
+                    await self.store.refund(student_key, self.student_burst)
+                self.rejected["global"] += 1
+                raise AdmissionDenied("global", self._retry_after(tokens, self.global_rate))
+        self.admitted += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "store": type(self.store).__name__,
+            "student_rate": self.student_rate,
+            "student_burst": self.student_burst,
+            "global_rate": self.global_rate,
+            "global_burst": self.global_burst,
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+        }
+
+
+def create_admission_from_env(collection) -> AdmissionController:
+    if os.environ.get("ADMISSION_STORE", "memory") == "mongo":
+        store = MongoBucketStore(collection)
+    else:
+        store = MemoryBucketStore()
+    return AdmissionController(
+        store,
+        student_rate=float(os.environ.get("ADMISSION_STUDENT_RATE", "0.5")),
+        student_burst=float(os.environ.get("ADMISSION_STUDENT_BURST", "10")),
+        global_rate=float(os.environ.get("ADMISSION_GLOBAL_RATE", "20")),
+        global_burst=float(os.environ.get("ADMISSION_GLOBAL_BURST", "40")),
+    )
@@ -0,0 +1,198 @@
+"""Cohort analytics rollups.
+
+Aggregation pipelines summarize `students` into one rollup collection each
+(`rollup_<name>`), written with `$out` so readers never see a half-built
+rollup. Average acceptance probability per university is computed from a
+(gpa, achievement count) histogram of students: Mongo groups the students,
+and the catalog scorer scores each distinct pair once, weighted by count.
+
+A scheduled task refreshes the rollups every ANALYTICS_REFRESH_SECONDS,
+but only when something they depend on changed: the newest `updated_at`,
+the student count or the catalog version. Groups are not patched in
+place, because an edit that moves a student between groups cannot be
+undone without the old values; a refresh that runs rebuilds each rollup
+in one server-side pass. Every worker then loads the small rollup
+collections into memory, and requests are served from that snapshot.
+
+Only one worker rebuilds at a time: a refresh first takes a lease document
+in `analytics_meta` with one atomic upsert, which fails with a duplicate
+key while another worker holds an unexpired lease. Other workers just
+reload the snapshot. The leader renews the lease on every refresh and
+releases it on shutdown; if it dies, another worker takes over once
+ANALYTICS_LEASE_SECONDS pass, so the lease must outlast one refresh.
+"""
+import uuid
+import asyncio
+import logging
+from datetime import datetime, timezone, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_META_ID = "rollups"
+LEASE_ID = "refresh_lease"
+
+PIPELINES = {
+    "gpa_by_faculty": [
+        {"$group": {
+            "_id": "$faculty",
+            "students": {"$sum": 1},
+            "avg_gpa": {"$avg": "$gpa"},
+            "min_gpa": {"$min": "$gpa"},
+            "max_gpa": {"$max": "$gpa"},
+        }},
+    ],
+    "country_demand": [
+        {"$unwind": "$preferred_countries"},
+        {"$group": {"_id": "$preferred_countries", "students": {"$sum": 1}, "avg_gpa": {"$avg": "$gpa"}}},
+    ],
+    "financial_situation": [
+        {"$group": {"_id": "$financial_situation", "students": {"$sum": 1}}},
+    ],
+}
+
+ACCEPTANCE_HISTOGRAM = [
+    {"$group": {
+        "_id": {"gpa": "$gpa", "achievements": {"$size": {"$ifNull": ["$achievements", []]}}},
+        "students": {"$sum": 1},
+    }},
+]
+
+ROLLUPS = [*PIPELINES, "acceptance_by_university"]
+
+# Served order; every other rollup is largest group first
+ROLLUP_SORT = {"acceptance_by_university": "avg_probability"}
+
+
+class AnalyticsRollups:
+    def __init__(self, db, interval: float = 300.0, lease: float = 600.0):
+        self.db = db
+        self.interval = interval
+        self.lease = lease
+        self.worker_id = uuid.uuid4().hex
+        self.leader = False
+        self.snapshot: Dict[str, List[Dict[str, Any]]] = {name: [] for name in ROLLUPS}
+        self.refreshed_at: Optional[datetime] = None
+        self._task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+        self.refreshes = 0
+        self.skipped = 0
+
+    async def _marker(self, catalog_version) -> Dict[str, Any]:
+        latest = await self.db.students.find_one({}, {"_id": 0, "updated_at": 1}, sort=[("updated_at", -1), ("id", -1)])
+        return {
+            "latest_update": latest.get("updated_at") if latest else None,
+            "students": await self.db.students.estimated_document_count(),
+            "catalog_version": catalog_version,
+        }
+
+    async def _acquire_lease(self) -> bool:
+        now = datetime.now(timezone.utc)
+        try:
+            await self.db.analytics_meta.update_one(
+                {"_id": LEASE_ID, "$or": [{"holder": self.worker_id}, {"expires_at": {"$lt": now}}]},
+                {"$set": {"holder": self.worker_id, "expires_at": now + timedelta(seconds=self.lease)}},
+                upsert=True,
+            )
+            self.leader = True
+        except DuplicateKeyError:
+            # The filter missed, so another worker holds an unexpired lease
+            self.leader = False
+        return self.leader
+
+    async def refresh(self, scorer_factory: Callable[[], Any], catalog_version=None, force: bool = False) -> bool:
+        async with self._lock:
+            if not await self._acquire_lease():
+                self.skipped += 1
+                await self.load()
+                return False
+            marker = await self._marker(catalog_version)
+            meta = await self.db.analytics_meta.find_one({"_id": ROLLUP_META_ID})
+            if not force and meta and meta.get("marker") == marker:
+                self.skipped += 1
+                await self.load()
+                return False
+
+            for name, pipeline in PIPELINES.items():
+                await self.db.students.aggregate([*pipeline, {"$out": f"rollup_{name}"}]).to_list(None)
+            await self._refresh_acceptance(scorer_factory())
+
+            now = datetime.now(timezone.utc)
+            await self.db.analytics_meta.update_one(
+                {"_id": ROLLUP_META_ID}, {"$set": {"marker": marker, "refreshed_at": now}}, upsert=True
+            )
+            self.refreshes += 1
+            await self.load()
+            return True
+
+    async def _refresh_acceptance(self, scorer):
+        histogram = await self.db.students.aggregate(ACCEPTANCE_HISTOGRAM).to_list(None)
+        rows = []
+        if histogram and len(scorer):
+            counts = np.array([h["students"] for h in histogram], dtype=np.float64)
+            scores = scorer.score_matrix(
+                [h["_id"]["gpa"] for h in histogram], [h["_id"]["achievements"] for h in histogram]
+            )
+            averages = counts @ scores / counts.sum()
+            rows = [
+                {
+                    "_id": university["id"],
+                    "name": university["name"],
+                    "country": university["country"],
+                    "avg_probability": round(float(average), 2),
+                    "students": int(counts.sum()),
+                }
+                for university, average in zip(scorer.universities, averages)
+            ]
+        # Build aside, then swap in with one rename so readers see old or new
+        staging = self.db.rollup_acceptance_by_university_staging
+        await staging.drop()
+        if rows:
+            await staging.insert_many(rows)
+            await staging.rename("rollup_acceptance_by_university", dropTarget=True)
+        else:
+            await self.db.rollup_acceptance_by_university.drop()
+
+    async def load(self):
+        snapshot = {}
+        for name in ROLLUPS:
+            docs = await self.db[f"rollup_{name}"].find({}).sort(ROLLUP_SORT.get(name, "students"), -1).to_list(None)
+            snapshot[name] = [{"key": doc.pop("_id"), **doc} for doc in docs]
+        meta = await self.db.analytics_meta.find_one({"_id": ROLLUP_META_ID})
+        self.snapshot = snapshot
+        self.refreshed_at = meta.get("refreshed_at") if meta else None
+
+    def start(self, refresh: Callable[[], Any]):
+        async def loop():
+            while True:
+                try:
+                    await refresh()
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"Analytics refresh failed: {str(e)}")
+                await asyncio.sleep(self.interval)
+        self._task = asyncio.create_task(loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self.leader:
+            # Hand over now rather than when the lease runs out
+            await self.db.analytics_meta.delete_one({"_id": LEASE_ID, "holder": self.worker_id})
+            self.leader = False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "interval_seconds": self.interval,
+            "leader": self.leader,
+            "refreshed_at": self.refreshed_at,
+            "refreshes": self.refreshes,
+            "skipped": self.skipped,
+            "groups": {name: len(rows) for name, rows in self.snapshot.items()},
+        }
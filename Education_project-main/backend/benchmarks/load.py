@@ -0,0 +1,293 @@
+"""Load test: concurrent mixed workload against the app, in-process.
+
+Boots server.app behind an httpx ASGI transport with the stub LLM provider
+(LLM_BACKEND=stub) and a throwaway database, seeds a pool of students, then
+runs closed-loop workers that each pick a weighted operation until the
+duration elapses. Reports throughput and p50/p95/p99 per operation and
+compares them against a stored baseline.
+
+Run from the backend directory:
+
+    python -m benchmarks.load [--concurrency 32] [--duration 20]
+    python -m benchmarks.load --in-memory          # mongomock-motor, no Mongo
+    python -m benchmarks.load --save-baseline      # record benchmarks/baseline.json
+    python -m benchmarks.load --fail-on-regression 20
+
+Latency is end-to-end through the ASGI stack, so it includes routing,
+validation and serialization but no network. Baselines are only comparable
+for the same config; a mismatch is reported before the comparison.
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import asyncio
+import argparse
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+BASELINE_PATH = Path(__file__).parent / "baseline.json"
+
+# Operation weights; override with --mix "chat=5,get_student=40"
+DEFAULT_MIX = {
+    "create_student": 5,
+    "get_student": 30,
+    "update_student": 10,
+    "list_universities": 15,
+    "list_scholarships": 10,
+    "chat": 15,
+    "recommendations": 5,
+    "acceptance": 10,
+}
+
+COUNTRIES = ["USA", "UK", "Germany", "Canada"]
+FACULTIES = ["Computer Science", "Engineering", "Business", "Medicine"]
+
+
+def student_payload(rng: random.Random) -> Dict[str, Any]:
+    return {
+        "name": f"Bench Student {rng.randrange(10 ** 6)}",
+        "email": f"bench{rng.randrange(10 ** 6)}@example.com",
+        "university": "Bench University",
+        "faculty": rng.choice(FACULTIES),
+        "gpa": round(rng.uniform(2.5, 4.0), 2),
+        "total_credits": 120,
+        "completed_credits": rng.randrange(30, 120),
+        "achievements": rng.sample(["Dean's List", "Hackathon winner", "Research assistant"], 2),
+        "extracurriculars": ["Robotics club"],
+        "preferred_countries": rng.sample(COUNTRIES, 2),
+        "financial_situation": rng.choice(["excellent", "good", "needs_scholarship", "limited"]),
+        "career_goals": "Graduate studies in my field",
+    }
+
+
+class Workload:
+    def __init__(self, client, rng: random.Random):
+        self.client = client
+        self.rng = rng
+        self.students: List[str] = []
+
+    async def seed(self, count: int):
+        for _ in range(count):
+            await self.create_student()
+
+    async def create_student(self):
+        response = await self.client.post("/api/students", json=student_payload(self.rng))
+        if response.status_code == 200:
+            self.students.append(response.json()["id"])
+        return response
+
+    async def get_student(self):
+        return await self.client.get(f"/api/students/{self.rng.choice(self.students)}")
+
+    async def update_student(self):
+        return await self.client.put(
+            f"/api/students/{self.rng.choice(self.students)}",
+            json={"gpa": round(self.rng.uniform(2.5, 4.0), 2)},
+        )
+
+    async def list_universities(self):
+        return await self.client.get("/api/universities", params={"country": self.rng.choice(COUNTRIES)})
+
+    async def list_scholarships(self):
+        return await self.client.get("/api/scholarships", params={"field": "engineering"})
+
+    async def chat(self):
+        return await self.client.post("/api/chat", json={
+            "student_id": self.rng.choice(self.students),
+            "message": f"Which universities fit me? ({self.rng.randrange(1000)})",
+        })
+
+    async def recommendations(self):
+        return await self.client.post(f"/api/recommendations/{self.rng.choice(self.students)}")
+
+    async def acceptance(self):
+        return await self.client.get(f"/api/students/{self.rng.choice(self.students)}/acceptance")
+
+
+def percentile(ordered: List[float], q: float) -> Optional[float]:
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def summarize(samples: Dict[str, List[float]], errors: Dict[str, int], elapsed: float) -> Dict[str, Any]:
+    results = {}
+    for name in sorted(set(samples) | set(errors)):
+        ordered = sorted(samples.get(name, []))
+        results[name] = {
+            "requests": len(ordered) + errors.get(name, 0),
+            "errors": errors.get(name, 0),
+            "throughput_rps": round(len(ordered) / elapsed, 2),
+            "p50_ms": round(percentile(ordered, 0.50) * 1000, 2) if ordered else None,
+            "p95_ms": round(percentile(ordered, 0.95) * 1000, 2) if ordered else None,
+            "p99_ms": round(percentile(ordered, 0.99) * 1000, 2) if ordered else None,
+        }
+    return results
+
+
+async def run(args, mix: Dict[str, int]) -> Dict[str, Any]:
+    import httpx
+
+    if args.in_memory:
+        try:
+            import mongomock_motor
+        except ImportError:
+            sys.exit("--in-memory needs mongomock-motor (pip install mongomock-motor)")
+        import motor.motor_asyncio
+        motor.motor_asyncio.AsyncIOMotorClient = mongomock_motor.AsyncMongoMockClient
+
+    # server reads its configuration at import time
+    import server
+
+    app = server.app
+    await app.router.startup()
+    transport = httpx.ASGITransport(app=app)
+    samples: Dict[str, List[float]] = {name: [] for name in mix}
+    errors: Dict[str, int] = {}
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+            workload = Workload(client, random.Random(args.seed))
+            await workload.seed(args.students)
+
+            names, weights = list(mix), list(mix.values())
+            deadline = time.perf_counter() + args.duration
+
+            async def worker(worker_id: int):
+                rng = random.Random(args.seed + worker_id)
+                while time.perf_counter() < deadline:
+                    name = rng.choices(names, weights)[0]
+                    start = time.perf_counter()
+                    try:
+                        response = await getattr(workload, name)()
+                        ok = response.status_code < 400
+                    except Exception:
+                        ok = False
+                    if ok:
+                        samples[name].append(time.perf_counter() - start)
+                    else:
+                        errors[name] = errors.get(name, 0) + 1
+
+            started = time.perf_counter()
+            await asyncio.gather(*(worker(i) for i in range(args.concurrency)))
+            elapsed = time.perf_counter() - started
+    finally:
+        await app.router.shutdown()
+        if not args.in_memory:
+            # Fresh client: the app's own was closed on shutdown
+            from motor.motor_asyncio import AsyncIOMotorClient
+            cleanup = AsyncIOMotorClient(os.environ["MONGO_URL"])
+            await cleanup.drop_database(os.environ["DB_NAME"])
+            cleanup.close()
+
+    total = sum(len(s) for s in samples.values())
+    return {
+        "config": {
+            "concurrency": args.concurrency,
+            "duration": args.duration,
+            "students": args.students,
+            "llm_latency": args.llm_latency,
+            "in_memory": args.in_memory,
+            "mix": mix,
+        },
+        "elapsed_seconds": round(elapsed, 2),
+        "throughput_rps": round(total / elapsed, 2),
+        "operations": summarize(samples, errors, elapsed),
+    }
+
+
+def _delta(current: Optional[float], baseline: Optional[float]) -> str:
+    if current is None or not baseline:
+        return "     n/a"
+    return f"{(current - baseline) / baseline * 100:+7.1f}%"
+
+
+def report(result: Dict[str, Any], baseline: Optional[Dict[str, Any]]):
+    print(f"\n{'operation':<18}{'reqs':>7}{'err':>6}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}", end="")
+    print(f"{'p95 vs base':>13}{'rps vs base':>13}" if baseline else "")
+    for name, op in result["operations"].items():
+        line = (
+            f"{name:<18}{op['requests']:>7}{op['errors']:>6}{op['throughput_rps']:>9}"
+            f"{op['p50_ms'] or 0:>10}{op['p95_ms'] or 0:>10}{op['p99_ms'] or 0:>10}"
+        )
+        if baseline:
+            base = baseline["operations"].get(name, {})
+            line += f"{_delta(op['p95_ms'], base.get('p95_ms')):>13}{_delta(op['throughput_rps'], base.get('throughput_rps')):>13}"
+        print(line)
+    print(f"\ntotal: {result['throughput_rps']} req/s over {result['elapsed_seconds']} s")
+
+
+def regressions(result: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    failed = []
+    for name, op in result["operations"].items():
+        base = baseline["operations"].get(name)
+        if not base or not base.get("p95_ms") or op["p95_ms"] is None:
+            continue
+        if (op["p95_ms"] - base["p95_ms"]) / base["p95_ms"] * 100 > threshold:
+            failed.append(name)
+        elif (base["throughput_rps"] - op["throughput_rps"]) / base["throughput_rps"] * 100 > threshold:
+            failed.append(name)
+    return failed
+
+
+def parse_mix(value: Optional[str]) -> Dict[str, int]:
+    if not value:
+        return dict(DEFAULT_MIX)
+    mix = {}
+    for item in value.split(","):
+        name, weight = item.split("=", 1)
+        if name.strip() not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f"Unknown operation: {name}")
+        mix[name.strip()] = int(weight)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds of load")
+    parser.add_argument("--students", type=int, default=50, help="students seeded before the run")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="stub LLM latency in seconds")
+    parser.add_argument("--mix", type=parse_mix, default=None, help='e.g. "chat=5,get_student=40"')
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--in-memory", action="store_true", help="use mongomock-motor instead of Mongo")
+    parser.add_argument("--mongo-url", default=os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--json", type=Path, help="also write the results here")
+    parser.add_argument("--fail-on-regression", type=float, metavar="PERCENT",
+                        help="exit 1 if any p95 or throughput is this much worse than the baseline")
+    args = parser.parse_args()
+    mix = args.mix or dict(DEFAULT_MIX)
+
+    os.environ["LLM_BACKEND"] = "stub"
+    os.environ["LLM_STUB_LATENCY_SECONDS"] = str(args.llm_latency)
+    os.environ["MONGO_URL"] = args.mongo_url
+    os.environ["DB_NAME"] = f"bench_{uuid.uuid4().hex[:8]}"
+    # Measure the app rather than the rate limiter unless asked to
+    os.environ.setdefault("ADMISSION_STUDENT_RATE", "0")
+    os.environ.setdefault("ADMISSION_GLOBAL_RATE", "0")
+
+    result = asyncio.run(run(args, mix))
+
+    baseline = json.loads(args.baseline.read_text()) if args.baseline.exists() and not args.save_baseline else None
+    if baseline and baseline["config"] != result["config"]:
+        print(f"note: baseline config differs: {baseline['config']}")
+    report(result, baseline)
+
+    if args.json:
+        args.json.write_text(json.dumps(result, indent=2) + "\n")
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps(result, indent=2) + "\n")
+        print(f"baseline saved to {args.baseline}")
+    elif baseline and args.fail_on_regression is not None:
+        failed = regressions(result, baseline, args.fail_on_regression)
+        if failed:
+            print(f"regressed beyond {args.fail_on_regression}%: {', '.join(failed)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""Microbenchmark: validated vs trusted response serialization.
+
+Compares the old list-route path (build models from raw documents, let
+FastAPI validate them against response_model, jsonable_encoder, stdlib
+json) with TrustedJSONResponse on the same synthetic documents.
+
+Run from the backend directory:
+
+    python -m benchmarks.serialization [--rows 1000] [--repeat 50]
+"""
+import json
+import uuid
+import time
+import argparse
+from datetime import datetime, timezone, timedelta
+from typing import List
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+
+from fast_json import TrustedJSONResponse, orjson
+from server import University, ChatMessage
+
+
+def make_universities(rows: int) -> List[dict]:
+    return [
+        {
+            "id": str(uuid.uuid4()),
+            "name": f"University {i}",
+            "country": ["USA", "UK", "Germany", "Canada"][i % 4],
+            "ranking": i + 1,
+            "programs": ["Computer Science", "Engineering", "Business"],
+            "acceptance_rate": 0.1 + (i % 50) / 100,
+            "tuition_fee": 10000.0 + i,
+            "scholarships_available": i % 2 == 0,
+            "language_requirements": ["English"],
+            "min_gpa": 3.0 + (i % 10) / 10,
+            "application_deadline": "January 1",
+        }
+        for i in range(rows)
+    ]
+
+
+def make_messages(rows: int) -> List[dict]:
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    return [
+        {
+            "id": str(uuid.uuid4()),
+            "student_id": "student",
+            "message": "What are my chances for a master's in AI?" * 2,
+            "response": "Here is some detailed advice about your applications. " * 20,
+            "timestamp": start + timedelta(seconds=i),
+        }
+        for i in range(rows)
+    ]
+
+
+def validated_path(model, docs: List[dict]) -> bytes:
+    # What the list routes used to do: model per document, then FastAPI's
+    # response_model validation and encoding
+    adapter = TypeAdapter(List[model])
+    models = adapter.validate_python([model(**doc) for doc in docs])
+    return json.dumps(jsonable_encoder(adapter.dump_python(models, mode="json"))).encode("utf-8")
+
+
+def trusted_path(docs: List[dict]) -> bytes:
+    return TrustedJSONResponse(docs).body
+
+
+def measure(fn, repeat: int) -> float:
+    fn()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    print(f"encoder: {'orjson' if orjson is not None else 'stdlib json'}, rows: {args.rows}")
+    for label, model, docs in (
+        ("universities", University, make_universities(args.rows)),
+        ("chat history", ChatMessage, make_messages(args.rows)),
+    ):
+        validated = measure(lambda: validated_path(model, docs), args.repeat)
+        trusted = measure(lambda: trusted_path(docs), args.repeat)
+        print(
+            f"{label:>14}: validated {validated:8.2f} ms  trusted {trusted:8.2f} ms  "
+            f"speedup {validated / trusted:5.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""Process-local catalog engine for universities and scholarships.
+
+The catalog is small and read-heavy, so each engine loads its collection
+once and answers filters from normalized inverted indexes. Filters keep the
+old case-insensitive substring semantics: a query term is matched against
+the distinct indexed values, and the postings of every matching value are
+unioned before the per-filter results are intersected.
+
+Writers bump the version document in `catalog_meta`; engines poll it at most
+every CATALOG_VERSION_CHECK_SECONDS and reload when it changes.
+"""
+import os
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Set, Tuple, Callable
+
+from pymongo import ReturnDocument
+
+logger = logging.getLogger(__name__)
+
+CATALOG_META_ID = "catalog"
+VERSION_CHECK_SECONDS = float(os.environ.get("CATALOG_VERSION_CHECK_SECONDS", "30"))
+# Terms come from clients, so the per-term match cache is an LRU
+TERM_CACHE_SIZE = int(os.environ.get("CATALOG_TERM_CACHE_SIZE", "1024"))
+
+
+def normalize(value: str) -> str:
+    return " ".join(str(value).lower().split())
+
+
+async def get_catalog_version(db) -> Optional[int]:
+    meta = await db.catalog_meta.find_one({"_id": CATALOG_META_ID})
+    return meta["version"] if meta else None
+
+
+async def bump_catalog_version(db) -> int:
+    meta = await db.catalog_meta.find_one_and_update(
+        {"_id": CATALOG_META_ID},
+        {"$inc": {"version": 1}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    return meta["version"]
+
+
+class CatalogEngine:
+    def __init__(
+        self, collection: str, indexed_fields: Dict[str, str], projection: Optional[Dict[str, int]] = None
+    ):
+        # indexed_fields maps a filter name to the document field it indexes,
+        # e.g. {"country": "countries"}; list-valued fields index every item.
+        # projection limits the loaded documents to the fields served.
+        self.collection = collection
+        self.indexed_fields = indexed_fields
+        self.projection = projection or {"_id": 0}
+        self.documents: List[Dict[str, Any]] = []
+        self.postings: Dict[str, Dict[str, Set[int]]] = {}
+        self.version: Optional[int] = None
+        self.loaded = False
+        self._checked_at = 0.0
+        self._term_cache: "OrderedDict[Tuple[str, str], Set[int]]" = OrderedDict()
+        self._derived: Dict[str, Any] = {}
+        self._lock = asyncio.Lock()
+
+    def build(self, documents: List[Dict[str, Any]]):
+        postings = {name: {} for name in self.indexed_fields}
+        for position, doc in enumerate(documents):
+            for name, field in self.indexed_fields.items():
+                values = doc.get(field) or []
+                if not isinstance(values, list):
+                    values = [values]
+                for value in values:
+                    postings[name].setdefault(normalize(value), set()).add(position)
+        self.documents = documents
+        self.postings = postings
+        self._term_cache = OrderedDict()
+        self._derived = {}
+        self.loaded = True
+
+    async def load(self, db):
+        documents = await self._fetch(db)
+        self.build(documents)
+        logger.info(f"Loaded {len(documents)} {self.collection} into catalog (version {self.version})")
+
+    async def _fetch(self, db) -> List[Dict[str, Any]]:
+        return await db[self.collection].find({}, self.projection).to_list(None)
+
+    def invalidate(self):
+        self.loaded = False
+
+    async def ensure_fresh(self, db):
+        now = time.monotonic()
+        if self.loaded and now - self._checked_at < VERSION_CHECK_SECONDS:
+            return
+        async with self._lock:
+            if self.loaded and now - self._checked_at < VERSION_CHECK_SECONDS:
+                return
+            version = await get_catalog_version(db)
+            if not self.loaded or version != self.version:
+                self.version = version
+                await self.load(db)
+            self._checked_at = time.monotonic()
+
+    def derived(self, name: str, factory: Callable[[List[Dict[str, Any]]], Any]) -> Any:
+        # Structures built from the loaded documents, rebuilt after each reload
+        if name not in self._derived:
+            self._derived[name] = factory(self.documents)
+        return self._derived[name]
+
+    def _match_term(self, name: str, term: str) -> Set[int]:
+        key = (name, normalize(term))
+        matched = self._term_cache.get(key)
+        if matched is not None:
+            self._term_cache.move_to_end(key)
+            return matched
+        matched = set()
+        for value, positions in self.postings[name].items():
+            if key[1] in value:
+                matched |= positions
+        self._term_cache[key] = matched
+        if len(self._term_cache) > TERM_CACHE_SIZE:
+            self._term_cache.popitem(last=False)
+        return matched
+
+    def query(
+        self, filters: Dict[str, Optional[str]], skip: int = 0, limit: int = 100
+    ) -> Tuple[int, List[Dict[str, Any]]]:
+        active = [(name, term) for name, term in filters.items() if term]
+        if not active:
+            return len(self.documents), self.documents[skip:skip + limit]
+
+        # Intersect starting from the smallest posting set
+        sets = sorted((self._match_term(name, term) for name, term in active), key=len)
+        matched = set(sets[0])
+        for positions in sets[1:]:
+            matched &= positions
+        ordered = sorted(matched)
+        return len(ordered), [self.documents[i] for i in ordered[skip:skip + limit]]
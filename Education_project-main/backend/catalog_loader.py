@@ -0,0 +1,194 @@
+"""Bulk catalog loader for universities and scholarships.
+
+Imports JSON, NDJSON or CSV files with batched, unordered upserts keyed on
+each collection's natural key, so re-running a load never duplicates
+documents. The hash of each collection's source file is recorded in
+`catalog_meta` per collection, and every collection is compared against
+its own hash only:
+
+- `source_hashes` holds the last file loaded into the collection, from any
+  source; an out-of-band load skips a file that is already loaded;
+- `bundled_hashes` holds the last bundled CATALOG_DIR file loaded at
+  startup. Startup skips a collection whose bundled file is unchanged,
+  which makes it one load per deploy across all workers, and leaves
+  records loaded out of band in place until that bundled file changes.
+
+Run from the backend directory to refresh the catalog out of band:
+
+    python catalog_loader.py [--universities PATH] [--scholarships PATH] [--force]
+"""
+import os
+import csv
+import json
+import uuid
+import asyncio
+import hashlib
+import logging
+import argparse
+from pathlib import Path
+from typing import List, Dict, Any, Optional
+
+from pymongo import UpdateOne
+
+from catalog import CATALOG_META_ID, bump_catalog_version
+
+logger = logging.getLogger(__name__)
+
+CATALOG_DIR = Path(os.environ.get("CATALOG_DIR", Path(__file__).parent / "catalog_data"))
+BATCH_SIZE = int(os.environ.get("CATALOG_BATCH_SIZE", "1000"))
+
+NATURAL_KEYS = {
+    "universities": ["name", "country"],
+    "scholarships": ["name", "provider"],
+}
+
+# Column types used to coerce CSV cells; list cells are "|"-separated
+FIELD_TYPES = {
+    "universities": {
+        "ranking": int,
+        "acceptance_rate": float,
+        "tuition_fee": float,
+        "min_gpa": float,
+        "scholarships_available": bool,
+        "programs": list,
+        "language_requirements": list,
+    },
+    "scholarships": {
+        "amount": float,
+        "countries": list,
+        "fields": list,
+        "requirements": list,
+    },
+}
+
+
+def _coerce(value: str, kind):
+    value = value.strip()
+    if kind is list:
+        return [item.strip() for item in value.split("|") if item.strip()]
+    if kind is bool:
+        return value.lower() in ("1", "true", "yes", "y")
+    if kind is int:
+        return int(float(value))
+    return kind(value)
+
+
+def read_records(path: Path, collection: str) -> List[Dict[str, Any]]:
+    suffix = path.suffix.lower()
+    with open(path, encoding="utf-8") as f:
+        if suffix == ".json":
+            return json.load(f)
+        if suffix in (".ndjson", ".jsonl"):
+            return [json.loads(line) for line in f if line.strip()]
+        if suffix == ".csv":
+            types = FIELD_TYPES[collection]
+            return [
+                {k: _coerce(v, types.get(k, str)) for k, v in row.items() if v is not None}
+                for row in csv.DictReader(f)
+            ]
+    raise ValueError(f"Unsupported catalog file format: {path}")
+
+
+def find_source(collection: str, directory: Path = CATALOG_DIR) -> Optional[Path]:
+    for suffix in (".json", ".ndjson", ".jsonl", ".csv"):
+        path = directory / f"{collection}{suffix}"
+        if path.exists():
+            return path
+    return None
+
+
+def _source_hash(path: Path) -> str:
+    return hashlib.sha256(path.read_bytes()).hexdigest()
+
+
+async def upsert_records(db, collection: str, records: List[Dict[str, Any]], batch_size: int = BATCH_SIZE) -> Dict[str, int]:
+    key_fields = NATURAL_KEYS[collection]
+    totals = {"matched": 0, "upserted": 0, "modified": 0}
+    for start in range(0, len(records), batch_size):
+        operations = []
+        for record in records[start:start + batch_size]:
+            record = {k: v for k, v in record.items() if k not in ("_id", "id")}
+            missing = [k for k in key_fields if not record.get(k)]
+            if missing:
+                raise ValueError(f"{collection} record missing natural key {missing}: {record}")
+            operations.append(UpdateOne(
+                {k: record[k] for k in key_fields},
+                {"$set": record, "$setOnInsert": {"id": str(uuid.uuid4())}},
+                upsert=True,
+            ))
+        result = await db[collection].bulk_write(operations, ordered=False)
+        totals["matched"] += result.matched_count
+        totals["upserted"] += result.upserted_count
+        totals["modified"] += result.modified_count
+    return totals
+
+
+async def load_catalog(
+    db,
+    sources: Optional[Dict[str, Path]] = None,
+    force: bool = False,
+    batch_size: int = BATCH_SIZE,
+) -> Dict[str, Any]:
+    # Without explicit sources this is the bundled catalog loaded at startup
+    bundled = sources is None
+    if bundled:
+        sources = {c: find_source(c) for c in NATURAL_KEYS}
+    sources = {c: p for c, p in sources.items() if p is not None}
+    if not sources:
+        logger.info("No catalog sources found, skipping catalog load")
+        return {"loaded": False}
+
+    meta = await db.catalog_meta.find_one({"_id": CATALOG_META_ID}) or {}
+    previous = meta.get("bundled_hashes" if bundled else "source_hashes") or {}
+    hashes, results = {}, {}
+    for collection, path in sources.items():
+        hashes[collection] = _source_hash(path)
+        if not force and previous.get(collection) == hashes[collection]:
+            continue
+        records = read_records(path, collection)
+        results[collection] = await upsert_records(db, collection, records, batch_size)
+        logger.info(f"Catalog load {collection} from {path}: {results[collection]}")
+        recorded = {f"source_hashes.{collection}": hashes[collection]}
+        if bundled:
+            recorded[f"bundled_hashes.{collection}"] = hashes[collection]
+        await db.catalog_meta.update_one({"_id": CATALOG_META_ID}, {"$set": recorded}, upsert=True)
+
+    if not results:
+        return {"loaded": False, "source_hashes": hashes}
+    version = await bump_catalog_version(db)
+    return {"loaded": True, "source_hashes": hashes, "version": version, "results": results}
+
+
+def main():
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    parser = argparse.ArgumentParser(description="Bulk-load the university and scholarship catalog")
+    parser.add_argument("--universities", type=Path, help="JSON, NDJSON or CSV file")
+    parser.add_argument("--scholarships", type=Path, help="JSON, NDJSON or CSV file")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--force", action="store_true", help="Load even if the sources are unchanged")
+    args = parser.parse_args()
+
+    load_dotenv(Path(__file__).parent / '.env')
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    sources = None
+    if args.universities or args.scholarships:
+        sources = {"universities": args.universities, "scholarships": args.scholarships}
+
+    async def run():
+        client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+        try:
+            result = await load_catalog(
+                client[os.environ['DB_NAME']], sources, force=args.force, batch_size=args.batch_size
+            )
+            print(json.dumps(result, indent=2))
+        finally:
+            client.close()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
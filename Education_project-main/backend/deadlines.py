@@ -0,0 +1,137 @@
+"""Sorted index of recurring catalog deadlines.
+
+Deadlines are stored as free strings ("January 1", "Oct 15"). At catalog
+load they are parsed once into a day-of-year ordinal and kept sorted per
+country, so "what is due in the next N days" is two bisects per country
+instead of an LLM question. Ordinals do not depend on today's date, so the
+index stays valid across midnight; the concrete next-occurrence date is
+computed per result. Unparseable deadlines ("Rolling") are skipped.
+"""
+import re
+import bisect
+import calendar
+from datetime import date
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from catalog import normalize
+
+# Which fields hold the deadline and the countries for each catalog
+DEADLINE_FIELDS = {
+    "universities": ("application_deadline", "country"),
+    "scholarships": ("deadline", "countries"),
+}
+
+MONTHS = {name.lower(): i for i, name in enumerate(calendar.month_name) if name}
+MONTHS.update({name.lower(): i for i, name in enumerate(calendar.month_abbr) if name})
+MONTHS["sept"] = 9
+
+MONTH_DAY_RE = re.compile(r"(?P<month>[a-z]+)\.?\s+(?P<day>\d{1,2})(?:st|nd|rd|th)?\b", re.IGNORECASE)
+DAY_MONTH_RE = re.compile(r"\b(?P<day>\d{1,2})(?:st|nd|rd|th)?\s+(?P<month>[a-z]+)", re.IGNORECASE)
+
+# Ordinals are taken in a leap year so February 29 has a slot
+_LEAP_YEAR = 2000
+
+
+def parse_deadline(text: str) -> Optional[Tuple[int, int]]:
+    for pattern in (MONTH_DAY_RE, DAY_MONTH_RE):
+        match = pattern.search(text or "")
+        if match:
+            month = MONTHS.get(match.group("month").lower())
+            day = int(match.group("day"))
+            if month and 1 <= day <= calendar.monthrange(_LEAP_YEAR, month)[1]:
+                return month, day
+    return None
+
+
+def _ordinal(month: int, day: int) -> int:
+    return date(_LEAP_YEAR, month, day).timetuple().tm_yday
+
+
+def next_occurrence(month: int, day: int, today: date) -> date:
+    for year in (today.year, today.year + 1):
+        # February 29 falls back to February 28 outside leap years
+        due = date(year, month, min(day, calendar.monthrange(year, month)[1]))
+        if due >= today:
+            return due
+    raise ValueError(f"No occurrence for {month}/{day}")
+
+
+class DeadlineIndex:
+    def __init__(self, documents: List[Dict[str, Any]], kind: str):
+        self.kind = kind
+        deadline_field, countries_field = DEADLINE_FIELDS[kind]
+        self.entries: Dict[str, List[Tuple[int, int]]] = {}
+        self.documents: List[Dict[str, Any]] = []
+        self.unparsed = 0
+
+        for doc in documents:
+            parsed = parse_deadline(doc.get(deadline_field, ""))
+            if parsed is None:
+                self.unparsed += 1
+                continue
+            countries = doc.get(countries_field) or []
+            if not isinstance(countries, list):
+                countries = [countries]
+            position = len(self.documents)
+            self.documents.append({
+                "kind": kind,
+                "id": doc["id"],
+                "name": doc["name"],
+                "countries": countries,
+                "deadline": doc[deadline_field],
+                "month_day": parsed,
+            })
+            for country in {normalize(c) for c in countries}:
+                self.entries.setdefault(country, []).append((_ordinal(*parsed), position))
+        for entries in self.entries.values():
+            entries.sort()
+        self._ordinals = {country: [o for o, _ in entries] for country, entries in self.entries.items()}
+
+    def __len__(self):
+        return len(self.documents)
+
+    def _range(self, country: str, start: int, end: int) -> List[Tuple[int, int]]:
+        ordinals = self._ordinals.get(country, [])
+        return self.entries.get(country, [])[bisect.bisect_left(ordinals, start):bisect.bisect_right(ordinals, end)]
+
+    def upcoming(
+        self, days: int, countries: Optional[Sequence[str]] = None, today: Optional[date] = None
+    ) -> List[Dict[str, Any]]:
+        today = today or date.today()
+        days = min(days, 365)
+        start = _ordinal(today.month, today.day)
+        # One spare day covers the unused February 29 slot in common years;
+        # days_left is checked exactly below
+        end = start + days + 1
+        keys = self.entries if countries is None else {normalize(c) for c in countries}
+
+        # The window may wrap past December 31 into next year's ordinals
+        windows = [(start, min(end, 366))]
+        if end > 366:
+            windows.append((1, end - 366))
+
+        results, seen = [], set()
+        for country in keys:
+            for low, high in windows:
+                for _, position in self._range(country, low, high):
+                    if position in seen:
+                        continue
+                    seen.add(position)
+                    doc = self.documents[position]
+                    due = next_occurrence(*doc["month_day"], today)
+                    days_left = (due - today).days
+                    if days_left <= days:
+                        results.append((due, doc["name"], doc, days_left))
+
+        return [
+            {
+                "kind": doc["kind"],
+                "id": doc["id"],
+                "name": doc["name"],
+                "countries": doc["countries"],
+                "deadline": doc["deadline"],
+                "due_date": due,
+                "days_left": days_left,
+            }
+            for due, _, doc, days_left in sorted(results, key=lambda r: (r[0], r[1]))
+        ]
@@ -0,0 +1,187 @@
+"""Compiled scholarship eligibility rules.
+
+Free-text `Scholarship.requirements` are parsed once per catalog load:
+
+- numeric rules ("GPA > 3.5", "Minimum GPA 3.0", "90 credits") become hard
+  thresholds over `gpa` / `completed_credits`;
+- known phrases ("Leadership Experience", "Research Experience", ...) become
+  keyword checks over achievements and extracurriculars, reported as met
+  when evidence is found and as unverified otherwise;
+- anything else (e.g. language proficiency, which the profile does not
+  record) is carried through as unverified.
+
+Keywords and fields are compared on whole words, so "lab" does not match
+"collaborate" and "top" does not match "laptop". Countries, fields and
+thresholds are packed into NumPy arrays so a student is checked against every
+scholarship in one pass; the field mask is cached per faculty.
+"""
+import re
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+GPA_RE = re.compile(
+    r"(?P<min>minimum|min\.?|at least)?\s*gpa\s*(?P<op>>=|≥|>|of|:)?\s*(?P<value>\d(?:\.\d+)?)\s*(?P<plus>\+)?",
+    re.IGNORECASE,
+)
+CREDITS_RE = re.compile(r"(?P<value>\d+)\s*(?:\+\s*)?(?:completed\s+)?credits", re.IGNORECASE)
+
+KEYWORD_RULES: List[Tuple[str, Sequence[str]]] = [
+    ("leadership", ("lead", "president", "captain", "chair", "founder", "government", "head")),
+    ("research", ("research", "publication", "paper", "lab", "thesis")),
+    ("academic record", ("dean", "honor", "honour", "award", "scholar", "valedictorian", "top")),
+    ("volunteer", ("volunteer", "community", "charity", "ngo")),
+]
+
+# Inflections accepted after a keyword stem ("lead" -> "leader", "leadership")
+KEYWORD_SUFFIXES = r"(?:s|es|ed|er|ers|ing|ership|ship|ships)?"
+WORD_RE = re.compile(r"[a-z0-9]+")
+
+ALL_FIELDS = "all"
+FIELD_MASK_CACHE_SIZE = 1024
+
+
+def _normalize(value: str) -> str:
+    return " ".join(value.lower().split())
+
+
+def _tokens(value: str) -> Tuple[str, ...]:
+    return tuple(WORD_RE.findall(value.lower()))
+
+
+def _contains(tokens: Tuple[str, ...], phrase: Tuple[str, ...]) -> bool:
+    # True when `phrase` occurs in `tokens` as a run of whole words
+    if not phrase or len(phrase) > len(tokens):
+        return False
+    return any(tokens[i:i + len(phrase)] == phrase for i in range(len(tokens) - len(phrase) + 1))
+
+
+def _keyword_pattern(keywords: Sequence[str]) -> "re.Pattern[str]":
+    alternatives = "|".join(map(re.escape, keywords))
+    return re.compile(rf"\b(?:{alternatives}){KEYWORD_SUFFIXES}\b")
+
+
+def parse_requirement(requirement: str) -> Dict[str, Any]:
+    match = GPA_RE.search(requirement)
+    if match:
+        return {
+            "kind": "gpa",
+            "value": float(match.group("value")),
+            "strict": match.group("op") == ">" and not match.group("min"),
+            "text": requirement,
+        }
+    match = CREDITS_RE.search(requirement)
+    if match:
+        return {"kind": "credits", "value": int(match.group("value")), "text": requirement}
+    lowered = requirement.lower()
+    for phrase, keywords in KEYWORD_RULES:
+        if phrase in lowered:
+            return {
+                "kind": "keywords",
+                "keywords": keywords,
+                "pattern": _keyword_pattern(keywords),
+                "text": requirement,
+            }
+    return {"kind": "unverified", "text": requirement}
+
+
+class EligibilityMatcher:
+    def __init__(self, scholarships: List[Dict[str, Any]]):
+        self.scholarships = scholarships
+        n = len(scholarships)
+        self.gpa_min = np.full(n, -np.inf)
+        self.credits_min = np.zeros(n)
+        self.rules: List[List[Dict[str, Any]]] = []
+
+        countries = sorted({_normalize(c) for s in scholarships for c in s.get("countries", [])})
+        self.country_index = {c: i for i, c in enumerate(countries)}
+        self.country_matrix = np.zeros((n, len(countries)), dtype=bool)
+        field_names = sorted({_normalize(f) for s in scholarships for f in s.get("fields", [])} - {ALL_FIELDS})
+        self.field_index = {f: i for i, f in enumerate(field_names)}
+        self.field_tokens = [_tokens(f) for f in field_names]
+        self.field_matrix = np.zeros((n, len(field_names)), dtype=bool)
+        self.all_fields = np.zeros(n, dtype=bool)
+        self._field_masks: "OrderedDict[Tuple[str, ...], np.ndarray]" = OrderedDict()
+
+        for row, scholarship in enumerate(scholarships):
+            for country in scholarship.get("countries", []):
+                self.country_matrix[row, self.country_index[_normalize(country)]] = True
+            fields = [_normalize(f) for f in scholarship.get("fields", [])]
+            self.all_fields[row] = not fields or ALL_FIELDS in fields
+            for field in fields:
+                if field != ALL_FIELDS:
+                    self.field_matrix[row, self.field_index[field]] = True
+
+            rules = [parse_requirement(r) for r in scholarship.get("requirements", [])]
+            for rule in rules:
+                if rule["kind"] == "gpa":
+                    # A strict "> x" threshold becomes the next float above x
+                    threshold = np.nextafter(rule["value"], np.inf) if rule["strict"] else rule["value"]
+                    self.gpa_min[row] = max(self.gpa_min[row], threshold)
+                elif rule["kind"] == "credits":
+                    self.credits_min[row] = max(self.credits_min[row], rule["value"])
+            self.rules.append(rules)
+
+    def __len__(self):
+        return len(self.scholarships)
+
+    def _field_mask(self, faculty: str) -> np.ndarray:
+        # A field matches when either name contains the other as whole words,
+        # e.g. "engineering" and "mechanical engineering"; no faculty, no filter
+        key = _tokens(faculty)
+        if not key:
+            return np.ones(len(self), dtype=bool)
+        mask = self._field_masks.get(key)
+        if mask is not None:
+            self._field_masks.move_to_end(key)
+            return mask
+        columns = [i for i, field in enumerate(self.field_tokens) if _contains(key, field) or _contains(field, key)]
+        mask = self.all_fields | self.field_matrix[:, columns].any(axis=1)
+        self._field_masks[key] = mask
+        if len(self._field_masks) > FIELD_MASK_CACHE_SIZE:
+            self._field_masks.popitem(last=False)
+        return mask
+
+    def _country_mask(self, countries: Optional[Sequence[str]]) -> np.ndarray:
+        if countries is None:
+            return np.ones(len(self), dtype=bool)
+        columns = [self.country_index[c] for c in map(_normalize, countries) if c in self.country_index]
+        if not columns:
+            return np.zeros(len(self), dtype=bool)
+        return self.country_matrix[:, columns].any(axis=1)
+
+    def match(self, student: Dict[str, Any], preferred_only: bool = True) -> List[Dict[str, Any]]:
+        if not len(self):
+            return []
+        mask = (
+            (self.gpa_min <= student["gpa"])
+            & (self.credits_min <= student["completed_credits"])
+            & self._country_mask(student["preferred_countries"] if preferred_only else None)
+            & self._field_mask(student["faculty"])
+        )
+
+        evidence = " ".join(student.get("achievements", []) + student.get("extracurriculars", [])).lower()
+        matches = []
+        for row in np.flatnonzero(mask):
+            scholarship = self.scholarships[row]
+            met, unverified = [], []
+            for rule in self.rules[row]:
+                if rule["kind"] in ("gpa", "credits"):
+                    met.append(rule["text"])
+                elif rule["kind"] == "keywords" and rule["pattern"].search(evidence):
+                    met.append(rule["text"])
+                else:
+                    unverified.append(rule["text"])
+            matches.append({
+                "scholarship_id": scholarship["id"],
+                "name": scholarship["name"],
+                "provider": scholarship["provider"],
+                "amount": scholarship["amount"],
+                "deadline": scholarship["deadline"],
+                "met_requirements": met,
+                "unverified_requirements": unverified,
+            })
+        # Fully verified matches first, then by award size
+        matches.sort(key=lambda m: (len(m["unverified_requirements"]), -m["amount"]))
+        return matches
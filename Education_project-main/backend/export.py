@@ -0,0 +1,122 @@
+"""Streaming NDJSON export of students, chat messages and recommendations.
+
+Documents are read from a Motor cursor in `batch_size` batches, encoded one
+per line and yielded batch by batch, so memory stays constant whatever the
+collection size. Output can be gzip-compressed on the fly.
+
+Exports are incremental over a per-collection watermark field. Each export
+covers `since < field <= until`, where `until` is fixed when the export
+starts and lags the clock by EXPORT_WATERMARK_LAG_SECONDS, so rows still
+sitting in a write-behind buffer are not skipped. Pass the returned `until`
+as the next `since`.
+
+Rows are stamped from the app server clock just before they are written;
+bulk patches stamp each chunk right before sending it, never the whole
+request up front. A row is therefore missed only if it becomes visible
+more than the lag after its stamp: the lag has to cover the write-behind
+flush interval, one bulk chunk write and clock skew between app servers,
+not the length of a bulk request.
+
+CLI, from the backend directory:
+
+    python export.py students [--since 2025-01-01T00:00:00Z] [--gzip] [-o students.ndjson.gz]
+"""
+import os
+import sys
+import zlib
+import asyncio
+import argparse
+from pathlib import Path
+from datetime import datetime, timezone, timedelta
+from typing import AsyncIterator, Optional
+
+from fast_json import dumps
+
+# Collection -> watermark field
+EXPORTS = {
+    "students": "updated_at",
+    "chat_messages": "timestamp",
+    "recommendations": "generated_at",
+}
+
+BATCH_SIZE = 1000
+WATERMARK_LAG_SECONDS = float(os.environ.get("EXPORT_WATERMARK_LAG_SECONDS", "5"))
+
+
+def export_upper_bound() -> datetime:
+    return datetime.now(timezone.utc) - timedelta(seconds=WATERMARK_LAG_SECONDS)
+
+
+async def export_ndjson(
+    db,
+    collection: str,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    batch_size: int = BATCH_SIZE,
+) -> AsyncIterator[bytes]:
+    field = EXPORTS[collection]
+    window = {"$lte": until or export_upper_bound()}
+    if since is not None:
+        window["$gt"] = since
+    cursor = db[collection].find({field: window}, {"_id": 0}).sort([(field, 1), ("id", 1)]).batch_size(batch_size)
+
+    lines = []
+    async for doc in cursor:
+        lines.append(dumps(doc))
+        if len(lines) >= batch_size:
+            yield b"\n".join(lines) + b"\n"
+            lines = []
+    if lines:
+        yield b"\n".join(lines) + b"\n"
+
+
+async def gzip_stream(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    compressor = zlib.compressobj(wbits=31)  # 31 = gzip container
+    async for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def parse_watermark(value: str) -> datetime:
+    watermark = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return watermark if watermark.tzinfo else watermark.replace(tzinfo=timezone.utc)
+
+
+def main():
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    parser = argparse.ArgumentParser(description="Export a collection as NDJSON")
+    parser.add_argument("collection", choices=sorted(EXPORTS))
+    parser.add_argument("--since", type=parse_watermark, help="only documents after this ISO watermark")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--gzip", action="store_true")
+    parser.add_argument("-o", "--output", type=Path, help="defaults to stdout")
+    args = parser.parse_args()
+
+    load_dotenv(Path(__file__).parent / '.env')
+
+    async def run():
+        client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+        until = export_upper_bound()
+        out = args.output.open("wb") if args.output else sys.stdout.buffer
+        try:
+            chunks = export_ndjson(client[os.environ['DB_NAME']], args.collection, args.since, until, args.batch_size)
+            if args.gzip:
+                chunks = gzip_stream(chunks)
+            async for chunk in chunks:
+                out.write(chunk)
+        finally:
+            if args.output:
+                out.close()
+            client.close()
+        # The next incremental run starts here
+        print(f"watermark: {until.isoformat()}", file=sys.stderr)
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""Trusted-data JSON responses.
+
+Catalog and chat documents are written by this server, so list routes can
+hand them straight to the encoder instead of rebuilding Pydantic models and
+letting FastAPI validate them a second time against `response_model`.
+Returning a Response bypasses that step, including its filtering of extra
+fields, so routes must read documents with `model_projection` of their
+response model; the `response_model` stays on the route for the OpenAPI
+schema.
+
+orjson is used when installed, with the stdlib encoder as a fallback.
+"""
+import json
+from typing import Any, Dict, Type
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel
+from starlette.responses import Response
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(
+        jsonable_encoder(content), ensure_ascii=False, allow_nan=False, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def model_projection(model: Type[BaseModel]) -> Dict[str, int]:
+    # Mongo projection returning exactly the model's fields, without _id
+    return {"_id": 0, **{name: 1 for name in model.model_fields}}
+
+
+class TrustedJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
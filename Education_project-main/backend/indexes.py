@@ -0,0 +1,245 @@
+"""MongoDB index registry.
+
+Every collection the API queries declares its indexes here. `ensure_indexes`
+runs at startup and is idempotent: re-creating an identical index is a no-op
+on the server. A TTL index whose retention changed is updated in place with
+`collMod`; other option conflicts are logged instead of failing startup.
+"""
+import os
+import logging
+from datetime import datetime
+from typing import List, Dict, Any
+
+from pymongo import IndexModel, ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+INDEX_OPTIONS_CONFLICT = 85
+
+
+def _ttl_index(field: str, env_var: str, name: str) -> List[IndexModel]:
+    # TTL indexes are opt-in: set the env var to the retention in seconds
+    seconds = os.environ.get(env_var)
+    if not seconds:
+        return []
+    return [IndexModel([(field, ASCENDING)], name=name, expireAfterSeconds=int(seconds))]
+
+
+def index_registry() -> Dict[str, List[IndexModel]]:
+    return {
+        "students": [
+            IndexModel([("id", ASCENDING)], name="students_id_unique", unique=True),
+            IndexModel([("email", ASCENDING)], name="students_email"),
+            # Incremental exports walk (watermark, id) in order
+            IndexModel([("updated_at", ASCENDING), ("id", ASCENDING)], name="students_updated_at_id"),
+        ],
+        "chat_messages": [
+            IndexModel([("id", ASCENDING)], name="chat_messages_id_unique", unique=True),
+            IndexModel(
+                [("student_id", ASCENDING), ("timestamp", DESCENDING), ("id", DESCENDING)],
+                name="chat_messages_student_timestamp_id",
+            ),
+            IndexModel([("timestamp", ASCENDING), ("id", ASCENDING)], name="chat_messages_timestamp_id"),
+            *_ttl_index("timestamp", "CHAT_MESSAGES_TTL_SECONDS", "chat_messages_timestamp_ttl"),
+        ],
+        "recommendations": [
+            IndexModel([("id", ASCENDING)], name="recommendations_id_unique", unique=True),
+            IndexModel(
+                [("student_id", ASCENDING), ("generated_at", DESCENDING)],
+                name="recommendations_student_generated_at",
+            ),
+            IndexModel([("generated_at", ASCENDING), ("id", ASCENDING)], name="recommendations_generated_at_id"),
+            *_ttl_index("generated_at", "RECOMMENDATIONS_TTL_SECONDS", "recommendations_generated_at_ttl"),
+        ],
+        "recommendation_jobs": [
+            IndexModel([("id", ASCENDING)], name="recommendation_jobs_id_unique", unique=True),
+            # Periodic recovery looks for queued/running jobs with an expired lease
+            IndexModel([("status", ASCENDING), ("leased_at", ASCENDING)], name="recommendation_jobs_status_leased_at"),
+            *_ttl_index("enqueued_at", "RECOMMENDATION_JOBS_TTL_SECONDS", "recommendation_jobs_enqueued_at_ttl"),
+        ],
+        # Only used when the Mongo tier of the completion cache is enabled
+        "recommendation_cache": [
+            IndexModel(
+                [("created_at", ASCENDING)],
+                name="recommendation_cache_created_at_ttl",
+                expireAfterSeconds=int(os.environ.get("RECOMMENDATION_CACHE_TTL_SECONDS", "86400")),
+            ),
+        ] if os.environ.get("RECOMMENDATION_CACHE_MONGO") else [],
+        "admission_buckets": [
+            IndexModel([("expires_at", ASCENDING)], name="admission_buckets_expires_at_ttl", expireAfterSeconds=0),
+        ],
+        "universities": [
+            IndexModel([("id", ASCENDING)], name="universities_id_unique", unique=True),
+            IndexModel(
+                [("name", ASCENDING), ("country", ASCENDING)],
+                name="universities_natural_key_unique",
+                unique=True,
+            ),
+            IndexModel(
+                [("country", ASCENDING), ("min_gpa", ASCENDING)],
+                name="universities_country_min_gpa",
+            ),
+        ],
+        "scholarships": [
+            IndexModel([("id", ASCENDING)], name="scholarships_id_unique", unique=True),
+            IndexModel(
+                [("name", ASCENDING), ("provider", ASCENDING)],
+                name="scholarships_natural_key_unique",
+                unique=True,
+            ),
+            IndexModel([("countries", ASCENDING)], name="scholarships_countries"),
+        ],
+    }
+
+
+async def ensure_indexes(db) -> Dict[str, List[str]]:
+    created = {}
+    for collection, models in index_registry().items():
+        created[collection] = []
+        for model in models:
+            # One call per index so a single conflict doesn't block the rest
+            try:
+                names = await db[collection].create_indexes([model])
+                created[collection].extend(names)
+            except OperationFailure as e:
+                if e.code == INDEX_OPTIONS_CONFLICT and "expireAfterSeconds" in model.document:
+                    # Raises if the index cannot be changed, so a wrong TTL fails startup
+                    await _update_ttl(db, collection, model.document)
+                    created[collection].append(model.document["name"])
+                else:
+                    logger.warning(
+                        f"Index {model.document['name']} on {collection} not created: {e}"
+                    )
+    return created
+
+
+async def _update_ttl(db, collection: str, index: Dict[str, Any]):
+    await db.command({
+        "collMod": collection,
+        "index": {"keyPattern": dict(index["key"]), "expireAfterSeconds": index["expireAfterSeconds"]},
+    })
+    logger.info(f"Index {index['name']} on {collection}: TTL set to {index['expireAfterSeconds']}s")
+
+
+# Query shapes issued by routes and background tasks, with placeholder values
+# for explain; keep in step with new queries
+QUERY_SHAPES: List[Dict[str, Any]] = [
+    {
+        "route": "GET /api/students/{student_id}",
+        "collection": "students",
+        "filter": {"id": ""},
+    },
+    {
+        "route": "GET /api/chat/{student_id}",
+        "collection": "chat_messages",
+        "filter": {"student_id": ""},
+        "sort": {"timestamp": -1},
+    },
+    {
+        "route": "GET /api/chat/{student_id}/history",
+        "collection": "chat_messages",
+        "filter": {"student_id": "", "$or": [
+            {"timestamp": {"$lt": datetime(1970, 1, 1)}},
+            {"timestamp": datetime(1970, 1, 1), "id": {"$lt": ""}},
+        ]},
+        "sort": {"timestamp": -1, "id": -1},
+    },
+    {
+        "route": "POST /api/recommendations/{student_id} (scholarships)",
+        "collection": "scholarships",
+        "filter": {"countries": {"$in": [""]}},
+    },
+    {
+        "route": "GET /api/recommendations/{student_id}",
+        "collection": "recommendations",
+        "filter": {"student_id": ""},
+        "sort": {"generated_at": -1},
+    },
+    {
+        "route": "GET /api/recommendations/jobs/{job_id}",
+        "collection": "recommendation_jobs",
+        "filter": {"id": ""},
+    },
+    {
+        "route": "job heartbeat (recover expired leases)",
+        "collection": "recommendation_jobs",
+        "filter": {"status": {"$in": ["queued", "running"]}, "leased_at": {"$lt": datetime(1970, 1, 1)}},
+    },
+    {
+        "route": "PATCH /api/students/bulk, GET /api/students/{student_id}/similar",
+        "collection": "students",
+        "filter": {"id": {"$in": [""]}},
+    },
+    {
+        "route": "GET /api/export/students, similarity sync",
+        "collection": "students",
+        "filter": {"updated_at": {"$gt": datetime(1970, 1, 1), "$lte": datetime(1970, 1, 1)}},
+        "sort": {"updated_at": 1, "id": 1},
+    },
+    {
+        "route": "GET /api/export/chat_messages",
+        "collection": "chat_messages",
+        "filter": {"timestamp": {"$gt": datetime(1970, 1, 1), "$lte": datetime(1970, 1, 1)}},
+        "sort": {"timestamp": 1, "id": 1},
+    },
+    {
+        "route": "GET /api/export/recommendations",
+        "collection": "recommendations",
+        "filter": {"generated_at": {"$gt": datetime(1970, 1, 1), "$lte": datetime(1970, 1, 1)}},
+        "sort": {"generated_at": 1, "id": 1},
+    },
+    {
+        "route": "analytics refresh (change marker)",
+        "collection": "students",
+        "filter": {},
+        "sort": {"updated_at": -1, "id": -1},
+    },
+]
+
+
+def _plan_summary(plan: Dict[str, Any], stages: List[str], indexes: List[str]):
+    stages.append(plan.get("stage", "UNKNOWN"))
+    if "indexName" in plan:
+        indexes.append(plan["indexName"])
+    if "inputStage" in plan:
+        _plan_summary(plan["inputStage"], stages, indexes)
+    for child in plan.get("inputStages", []):
+        _plan_summary(child, stages, indexes)
+
+
+async def explain_query_shapes(db) -> List[Dict[str, Any]]:
+    report = []
+    for shape in QUERY_SHAPES:
+        find = {"find": shape["collection"], "filter": shape["filter"]}
+        if "sort" in shape:
+            find["sort"] = shape["sort"]
+        entry = {"route": shape["route"], "collection": shape["collection"]}
+        try:
+            explained = await db.command({"explain": find, "verbosity": "queryPlanner"})
+            stages, indexes = [], []
+            _plan_summary(explained["queryPlanner"]["winningPlan"], stages, indexes)
+            entry.update({
+                "stages": stages,
+                "indexes": indexes,
+                "uses_index": "COLLSCAN" not in stages,
+            })
+        except Exception as e:
+            entry["error"] = str(e)
+        report.append(entry)
+    return report
+
+
+async def index_usage(db) -> Dict[str, List[Dict[str, Any]]]:
+    usage = {}
+    for collection in index_registry():
+        try:
+            stats = await db[collection].aggregate([{"$indexStats": {}}]).to_list(None)
+        except Exception as e:
+            logger.warning(f"$indexStats unavailable for {collection}: {e}")
+            stats = []
+        usage[collection] = [
+            {"name": s["name"], "ops": s.get("accesses", {}).get("ops", 0)}
+            for s in stats
+        ]
+    return usage
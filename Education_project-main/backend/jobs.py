@@ -0,0 +1,235 @@
+"""Background job queue with a bounded worker pool.
+
+Jobs are tracked in a Mongo collection so any worker process can answer
+status polls, while execution happens in the process that accepted the
+job. The in-memory queue is bounded and ordered by priority (higher runs
+first, FIFO within a priority). Failed jobs are retried with exponential
+backoff unless the handler raises a PermanentJobError.
+
+Each job records `leased_at` whenever a worker takes charge of it, and a
+heartbeat renews it every `lease / 3` seconds for every job the process
+still holds: queued, running or waiting out a retry delay. The same
+heartbeat runs `recover()`, which re-queues jobs still queued or running
+whose lease is older than `lease` seconds, since the worker holding them
+went away (crashed, or stopped with retries pending). A job is run twice
+only if its worker's event loop stalls for longer than the lease, which
+only writes a second recommendation.
+"""
+import time
+import uuid
+import asyncio
+import logging
+from collections import deque
+from datetime import datetime, timezone, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+from pymongo import ReturnDocument
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFull(Exception):
+    pass
+
+
+class PermanentJobError(Exception):
+    pass
+
+
+class JobQueue:
+    def __init__(
+        self,
+        collection,
+        handler: Callable[[Dict[str, Any]], Awaitable[Optional[str]]],
+        workers: int = 4,
+        max_depth: int = 1000,
+        max_attempts: int = 3,
+        retry_backoff: float = 2.0,
+        lease: float = 60.0,
+    ):
+        # handler receives the job payload and returns the id of its result
+        self.collection = collection
+        self.handler = handler
+        self.workers = workers
+        self.max_depth = max_depth
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self.lease = lease
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._retries: Set[asyncio.Task] = set()
+        # Ids of jobs this process has taken charge of and not finished
+        self._held: Set[str] = set()
+        self._heartbeat: Optional[asyncio.Task] = None
+        self._sequence = 0
+        self._wait_times = deque(maxlen=500)
+        self.running = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.retried = 0
+        self.recovered = 0
+
+    def start(self):
+        self._queue = asyncio.PriorityQueue(maxsize=self.max_depth)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._heartbeat = asyncio.create_task(self._beat())
+
+    async def stop(self):
+        # Jobs still held stay queued; another worker's recover() takes
+        # them once their lease runs out
+        tasks = self._tasks + list(self._retries) + ([self._heartbeat] if self._heartbeat else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks = []
+        self._retries.clear()
+        self._heartbeat = None
+        self._held.clear()
+
+    async def _beat(self):
+        while True:
+            await asyncio.sleep(self.lease / 3)
+            try:
+                if self._held:
+                    await self.collection.update_many(
+                        {"id": {"$in": list(self._held)}, "status": {"$in": ["queued", "running"]}},
+                        {"$set": {"leased_at": datetime.now(timezone.utc)}},
+                    )
+                await self.recover()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Job heartbeat failed: {str(e)}")
+
+    async def recover(self) -> int:
+        now = datetime.now(timezone.utc)
+        cutoff = now - timedelta(seconds=self.lease)
+        stale = {
+            "status": {"$in": ["queued", "running"]},
+            "$or": [
+                {"leased_at": {"$lt": cutoff}},
+                {"leased_at": {"$exists": False}, "enqueued_at": {"$lt": cutoff}},
+            ],
+        }
+        recovered = 0
+        while True:
+            # Renewing the lease claims the job, so two starting workers never both take it
+            job = await self.collection.find_one_and_update(
+                {**stale, "id": {"$nin": list(self._held)}},
+                {"$set": {"status": "queued", "leased_at": now}},
+                projection={"_id": 0},
+                return_document=ReturnDocument.AFTER,
+            )
+            if job is None:
+                break
+            try:
+                self._put(job)
+                recovered += 1
+            except asyncio.QueueFull:
+                await self._fail(job, "Job queue is full")
+        if recovered:
+            logger.info(f"Recovered {recovered} jobs left by a stopped worker")
+        self.recovered += recovered
+        return recovered
+
+    def _put(self, job: Dict[str, Any]):
+        self._sequence += 1
+        self._queue.put_nowait((-job["priority"], self._sequence, job, time.monotonic()))
+        self._held.add(job["id"])
+
+    async def enqueue(self, payload: Dict[str, Any], priority: int = 0) -> Dict[str, Any]:
+        if self._queue is None or self._queue.full():
+            raise QueueFull("Job queue is full")
+        job = {
+            "id": str(uuid.uuid4()),
+            "status": "queued",
+            "payload": payload,
+            "priority": priority,
+            "attempts": 0,
+            "result_id": None,
+            "error": None,
+            "enqueued_at": datetime.now(timezone.utc),
+            "leased_at": datetime.now(timezone.utc),
+            "started_at": None,
+            "finished_at": None,
+        }
+        await self.collection.insert_one(dict(job))
+        try:
+            self._put(job)
+        except asyncio.QueueFull:
+            # Filled up while the insert was in flight; nothing would run the job
+            await self.collection.delete_one({"id": job["id"]})
+            raise QueueFull("Job queue is full")
+        return job
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return await self.collection.find_one({"id": job_id}, {"_id": 0})
+
+    async def _update(self, job: Dict[str, Any], **fields):
+        job.update(fields)
+        await self.collection.update_one({"id": job["id"]}, {"$set": fields})
+
+    async def _fail(self, job: Dict[str, Any], error: str):
+        self._held.discard(job["id"])
+        self.failed += 1
+        await self._update(job, status="failed", error=error, finished_at=datetime.now(timezone.utc))
+
+    async def _requeue(self, job: Dict[str, Any], delay: float):
+        await asyncio.sleep(delay)
+        try:
+            self._put(job)
+        except asyncio.QueueFull:
+            await self._fail(job, "Job queue is full")
+
+    async def _worker(self):
+        while True:
+            _, _, job, queued_at = await self._queue.get()
+            self._wait_times.append(time.monotonic() - queued_at)
+            self.running += 1
+            try:
+                await self._run(job)
+            except Exception as e:
+                logger.error(f"Job {job['id']} bookkeeping error: {str(e)}")
+            finally:
+                self.running -= 1
+                self._queue.task_done()
+
+    async def _run(self, job: Dict[str, Any]):
+        now = datetime.now(timezone.utc)
+        await self._update(job, status="running", attempts=job["attempts"] + 1, started_at=now, leased_at=now)
+        try:
+            result_id = await self.handler(job["payload"])
+        except Exception as e:
+            permanent = isinstance(e, PermanentJobError)
+            if permanent or job["attempts"] >= self.max_attempts:
+                await self._fail(job, str(e))
+                return
+            self.retried += 1
+            await self._update(job, status="queued", error=str(e), leased_at=datetime.now(timezone.utc))
+            delay = self.retry_backoff * 2 ** (job["attempts"] - 1)
+            # Keep a reference so the task is not collected and stop() can cancel it
+            retry = asyncio.create_task(self._requeue(job, delay))
+            self._retries.add(retry)
+            retry.add_done_callback(self._retries.discard)
+            return
+
+        self._held.discard(job["id"])
+        self.succeeded += 1
+        await self._update(job, status="succeeded", result_id=result_id, error=None, finished_at=datetime.now(timezone.utc))
+
+    def stats(self) -> Dict[str, Any]:
+        waits = sorted(self._wait_times)
+        return {
+            "workers": self.workers,
+            "depth": self._queue.qsize() if self._queue else 0,
+            "max_depth": self.max_depth,
+            "running": self.running,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "retried": self.retried,
+            "recovered": self.recovered,
+            "retry_waiting": len(self._retries),
+            "held": len(self._held),
+            "wait_avg_seconds": round(sum(waits) / len(waits), 4) if waits else None,
+            "wait_p95_seconds": round(waits[min(len(waits) - 1, int(0.95 * len(waits)))], 4) if waits else None,
+        }
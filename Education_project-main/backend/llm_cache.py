@@ -0,0 +1,97 @@
+"""Content-addressed cache for LLM completions.
+
+Keys are hashes of everything that shapes a completion (model, prompts,
+catalog version), so identical inputs map to the same entry and any change
+to them is a miss. The first tier is an in-process LRU with TTL; an
+optional second tier in Mongo shares entries across workers and restarts.
+"""
+import time
+import json
+import hashlib
+from collections import OrderedDict
+from datetime import datetime, timezone, timedelta
+from typing import Any, Optional, Dict
+
+
+def cache_key(*parts: Any) -> str:
+    payload = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class TTLCache:
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any):
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def delete(self, key: str):
+        self._data.pop(key, None)
+
+    def __len__(self):
+        return len(self._data)
+
+
+class CompletionCache:
+    def __init__(self, maxsize: int, ttl: float, collection=None):
+        self.memory = TTLCache(maxsize, ttl)
+        self.ttl = ttl
+        # Optional Mongo collection used as the shared second tier
+        self.collection = collection
+        self.hits = 0
+        self.mongo_hits = 0
+        self.misses = 0
+
+    async def get(self, key: str) -> Optional[str]:
+        value = self.memory.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+        if self.collection is not None:
+            # The TTL monitor only sweeps once a minute, so check age here too
+            cutoff = datetime.now(timezone.utc) - timedelta(seconds=self.ttl)
+            doc = await self.collection.find_one({"_id": key, "created_at": {"$gte": cutoff}})
+            if doc:
+                self.mongo_hits += 1
+                self.memory.set(key, doc["value"])
+                return doc["value"]
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, value: str):
+        self.memory.set(key, value)
+        if self.collection is not None:
+            await self.collection.update_one(
+                {"_id": key},
+                {"$set": {"value": value, "created_at": datetime.now(timezone.utc)}},
+                upsert=True,
+            )
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.mongo_hits + self.misses
+        return {
+            "size": len(self.memory),
+            "maxsize": self.memory.maxsize,
+            "ttl_seconds": self.ttl,
+            "mongo_tier": self.collection is not None,
+            "hits": self.hits,
+            "mongo_hits": self.mongo_hits,
+            "misses": self.misses,
+            "hit_ratio": round((self.hits + self.mongo_hits) / lookups, 4) if lookups else 0.0,
+        }
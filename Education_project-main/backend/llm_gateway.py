@@ -0,0 +1,429 @@
+"""LLM gateway shared by every route that talks to the model.
+
+The gateway owns the provider client and enforces a global and per-route
+concurrency limit with a bounded wait queue, an end-to-end deadline per
+call, and optional hedging: when a call outlives the recent p95 latency a
+second identical request is raised and whichever finishes first wins.
+
+An optional `observer(route, outcome, seconds, prompt_tokens,
+completion_tokens)` is called once per call for metrics.
+
+LLM_BACKEND selects the provider:
+
+- unset: the Emergent client. It returns complete messages only, so its
+  `stream` yields one chunk and /chat/stream is no faster to first token
+  than /chat;
+- "openai": any OpenAI-compatible chat completions endpoint
+  (LLM_BASE_URL, LLM_API_KEY) over httpx, streaming tokens as the model
+  emits them;
+- "stub": the local stub provider (benchmarks and offline testing).
+"""
+import os
+import json
+import time
+import random
+import asyncio
+import logging
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Dict, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+
+class LlmOverloaded(Exception):
+    pass
+
+
+class LlmTimeout(Exception):
+    pass
+
+
+def estimate_tokens(text: str) -> int:
+    # Rough count for accounting; about four characters per token in English
+    return (len(text) + 3) // 4
+
+
+def _outcome(error: BaseException) -> str:
+    if isinstance(error, LlmOverloaded):
+        return "overloaded"
+    if isinstance(error, LlmTimeout):
+        return "timeout"
+    if isinstance(error, (asyncio.CancelledError, GeneratorExit)):
+        return "cancelled"
+    return "error"
+
+
+class EmergentProvider:
+    # LlmChat has no streaming API, so stream() yields the whole completion
+    # as one chunk once it is done
+    streams = False
+
+    def __init__(self, api_key: str, provider: str, model: str):
+        self.api_key = api_key
+        self.provider = provider
+        self.model = model
+
+    def _chat(self, session_id: str, system_message: str):
+        from emergentintegrations.llm.chat import LlmChat
+
+        # LlmChat keeps per-session history, so it is built per call; the
+        # underlying HTTP client is pooled by the library
+        return LlmChat(
+            api_key=self.api_key,
+            session_id=session_id,
+            system_message=system_message
+        ).with_model(self.provider, self.model)
+
+    async def complete(self, session_id: str, system_message: str, text: str) -> str:
+        from emergentintegrations.llm.chat import UserMessage
+
+        return await self._chat(session_id, system_message).send_message(UserMessage(text=text))
+
+    async def stream(self, session_id: str, system_message: str, text: str) -> AsyncIterator[str]:
+        from emergentintegrations.llm.chat import UserMessage
+
+        yield await self._chat(session_id, system_message).send_message(UserMessage(text=text))
+
+
+class OpenAICompatibleProvider:
+    """Chat completions over HTTP; `stream` reads the server-sent deltas."""
+
+    streams = True
+
+    def __init__(self, api_key: str, model: str, base_url: str = "https://api.openai.com/v1", transport=None):
+        self.model = model
+        # One pooled client for the process; the gateway enforces deadlines
+        self._client = httpx.AsyncClient(
+            base_url=base_url.rstrip("/"),
+            headers={"Authorization": f"Bearer {api_key}"},
+            timeout=httpx.Timeout(None, connect=10.0),
+            transport=transport,
+        )
+
+    def _body(self, system_message: str, text: str, stream: bool) -> Dict[str, object]:
+        return {
+            "model": self.model,
+            "messages": [{"role": "system", "content": system_message}, {"role": "user", "content": text}],
+            "stream": stream,
+        }
+
+    async def complete(self, session_id: str, system_message: str, text: str) -> str:
+        response = await self._client.post("/chat/completions", json=self._body(system_message, text, False))
+        response.raise_for_status()
+        return response.json()["choices"][0]["message"]["content"] or ""
+
+    async def stream(self, session_id: str, system_message: str, text: str) -> AsyncIterator[str]:
+        body = self._body(system_message, text, True)
+        async with self._client.stream("POST", "/chat/completions", json=body) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                choices = json.loads(data).get("choices") or []
+                token = choices[0].get("delta", {}).get("content") if choices else None
+                if token:
+                    yield token
+
+    async def aclose(self):
+        await self._client.aclose()
+
+
+class StubProvider:
+    """Deterministic local provider with configurable latency."""
+
+    streams = True
+
+    def __init__(self, latency: float = 0.05, jitter: float = 0.0, chunk_size: int = 8):
+        self.latency = latency
+        self.jitter = jitter
+        self.chunk_size = chunk_size
+        self.model = "stub"
+
+    def _reply(self, system_message: str, text: str) -> str:
+        if "JSON" in system_message:
+            return (
+                '{"universities": [], "scholarships": [], "improvements": [], '
+                '"timeline": "Start applications 6 months before deadline", "probabilities": {}}'
+            )
+        return f"Stub advice for: {text}"
+
+    async def _sleep(self):
+        await asyncio.sleep(self.latency + random.uniform(0, self.jitter))
+
+    async def complete(self, session_id: str, system_message: str, text: str) -> str:
+        await self._sleep()
+        return self._reply(system_message, text)
+
+    async def stream(self, session_id: str, system_message: str, text: str) -> AsyncIterator[str]:
+        await self._sleep()
+        reply = self._reply(system_message, text)
+        for start in range(0, len(reply), self.chunk_size):
+            yield reply[start:start + self.chunk_size]
+
+
+class LlmGateway:
+    def __init__(
+        self,
+        provider,
+        max_concurrency: int = 16,
+        route_concurrency: Optional[Dict[str, int]] = None,
+        default_route_concurrency: int = 8,
+        max_queue: int = 64,
+        timeout: float = 60.0,
+        hedge: bool = False,
+        hedge_min_samples: int = 20,
+        observer: Optional[Callable[[str, str, float, int, int], None]] = None,
+    ):
+        self.provider = provider
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.hedge = hedge
+        self.hedge_min_samples = hedge_min_samples
+        self.observer = observer
+        self.route_concurrency = route_concurrency or {}
+        self.default_route_concurrency = default_route_concurrency
+        self._global = asyncio.Semaphore(max_concurrency)
+        self._routes: Dict[str, asyncio.Semaphore] = {}
+        self._latencies = deque(maxlen=200)
+        self.in_flight = 0
+        self.queued = 0
+        self.completed = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    def _route_semaphore(self, route: str) -> asyncio.Semaphore:
+        if route not in self._routes:
+            limit = self.route_concurrency.get(route, self.default_route_concurrency)
+            self._routes[route] = asyncio.Semaphore(limit)
+        return self._routes[route]
+
+    def _percentile(self, q: float) -> Optional[float]:
+        if not self._latencies:
+            return None
+        ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def _remaining(self, deadline: float) -> float:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            self.timeouts += 1
+            raise LlmTimeout("LLM call exceeded its deadline")
+        return remaining
+
+    async def _acquire(self, semaphore: asyncio.Semaphore, deadline: float):
+        if not semaphore.locked():
+            await semaphore.acquire()
+            return
+        if self.queued >= self.max_queue:
+            self.rejected += 1
+            raise LlmOverloaded("LLM queue is full")
+        self.queued += 1
+        try:
+            await asyncio.wait_for(semaphore.acquire(), self._remaining(deadline))
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise LlmTimeout("Timed out waiting for an LLM slot")
+        finally:
+            self.queued -= 1
+
+    @asynccontextmanager
+    async def _permit(self, route: str, deadline: float):
+        acquired = []
+        try:
+            # Route first, then global, so waiters never hold a global slot
+            for semaphore in (self._route_semaphore(route), self._global):
+                await self._acquire(semaphore, deadline)
+                acquired.append(semaphore)
+        except BaseException:
+            for semaphore in acquired:
+                semaphore.release()
+            raise
+
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            for semaphore in reversed(acquired):
+                semaphore.release()
+
+    def _observe(self, route: str, outcome: str, start: float, system_message: str, text: str, completion: str):
+        if self.observer is not None:
+            self.observer(
+                route,
+                outcome,
+                time.monotonic() - start,
+                estimate_tokens(system_message) + estimate_tokens(text),
+                estimate_tokens(completion),
+            )
+
+    async def _timed_complete(self, session_id: str, system_message: str, text: str) -> str:
+        start = time.monotonic()
+        result = await self.provider.complete(session_id, system_message, text)
+        self._latencies.append(time.monotonic() - start)
+        return result
+
+    async def _hedged_complete(self, route: str, session_id: str, system_message: str, text: str) -> str:
+        primary = asyncio.ensure_future(self._timed_complete(session_id, system_message, text))
+        hedge = None
+        held = []
+        try:
+            delay = self._percentile(0.95)
+            if not self.hedge or delay is None or len(self._latencies) < self.hedge_min_samples:
+                return await primary
+
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            # Only hedge when both a route and a global slot are free; hedges
+            # never queue, and acquiring an unlocked semaphore does not wait
+            route_semaphore = self._route_semaphore(route)
+            if done or route_semaphore.locked() or self._global.locked():
+                return await primary
+            for semaphore in (route_semaphore, self._global):
+                await semaphore.acquire()
+                held.append(semaphore)
+
+            self.hedged += 1
+            hedge = asyncio.ensure_future(self._timed_complete(session_id, system_message, text))
+            tasks = {primary, hedge}
+            while True:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                winner = next(iter(done))
+                if winner.exception() is None or not tasks:
+                    break
+            if winner is hedge:
+                self.hedge_wins += 1
+            return winner.result()
+        finally:
+            # Also runs when the caller is cancelled mid-wait
+            for task in (primary, hedge):
+                if task is not None:
+                    task.cancel()
+            for semaphore in held:
+                semaphore.release()
+
+    async def complete(
+        self,
+        route: str,
+        session_id: str,
+        system_message: str,
+        text: str,
+        timeout: Optional[float] = None,
+    ) -> str:
+        start = time.monotonic()
+        deadline = start + (timeout or self.timeout)
+        try:
+            async with self._permit(route, deadline):
+                try:
+                    result = await asyncio.wait_for(
+                        self._hedged_complete(route, session_id, system_message, text),
+                        self._remaining(deadline),
+                    )
+                except asyncio.TimeoutError:
+                    self.timeouts += 1
+                    raise LlmTimeout("LLM call exceeded its deadline")
+        except BaseException as e:
+            self._observe(route, _outcome(e), start, system_message, text, "")
+            raise
+        self.completed += 1
+        self._observe(route, "ok", start, system_message, text, result)
+        return result
+
+    async def stream(
+        self,
+        route: str,
+        session_id: str,
+        system_message: str,
+        text: str,
+        timeout: Optional[float] = None,
+    ) -> AsyncIterator[str]:
+        requested = time.monotonic()
+        deadline = requested + (timeout or self.timeout)
+        received = []
+        try:
+            async with self._permit(route, deadline):
+                start = time.monotonic()
+                chunks = self.provider.stream(session_id, system_message, text).__aiter__()
+                try:
+                    while True:
+                        try:
+                            chunk = await asyncio.wait_for(chunks.__anext__(), self._remaining(deadline))
+                        except StopAsyncIteration:
+                            break
+                        except asyncio.TimeoutError:
+                            self.timeouts += 1
+                            raise LlmTimeout("LLM stream exceeded its deadline")
+                        received.append(chunk)
+                        yield chunk
+                finally:
+                    await chunks.aclose()
+                self._latencies.append(time.monotonic() - start)
+        except BaseException as e:
+            self._observe(route, _outcome(e), requested, system_message, text, "".join(received))
+            raise
+        self.completed += 1
+        self._observe(route, "ok", requested, system_message, text, "".join(received))
+
+    async def close(self):
+        if hasattr(self.provider, "aclose"):
+            await self.provider.aclose()
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "model": self.provider.model,
+            "streaming": self.provider.streams,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "timeout_seconds": self.timeout,
+            "hedge": self.hedge,
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "latency_p50": self._percentile(0.5),
+            "latency_p95": self._percentile(0.95),
+        }
+
+
+def create_gateway_from_env(provider: str, model: str) -> LlmGateway:
+    if os.environ.get("LLM_BACKEND") == "stub":
+        backend = StubProvider(
+            latency=float(os.environ.get("LLM_STUB_LATENCY_SECONDS", "0.05")),
+            jitter=float(os.environ.get("LLM_STUB_JITTER_SECONDS", "0")),
+        )
+    elif os.environ.get("LLM_BACKEND") == "openai":
+        backend = OpenAICompatibleProvider(
+            os.environ['LLM_API_KEY'],
+            model,
+            base_url=os.environ.get("LLM_BASE_URL", "https://api.openai.com/v1"),
+        )
+    else:
+        backend = EmergentProvider(os.environ['EMERGENT_LLM_KEY'], provider, model)
+
+    # LLM_ROUTE_CONCURRENCY looks like "chat=8,recommendations=4"
+    route_concurrency = {}
+    for item in os.environ.get("LLM_ROUTE_CONCURRENCY", "").split(","):
+        if "=" in item:
+            route, limit = item.split("=", 1)
+            route_concurrency[route.strip()] = int(limit)
+
+    return LlmGateway(
+        backend,
+        max_concurrency=int(os.environ.get("LLM_MAX_CONCURRENCY", "16")),
+        route_concurrency=route_concurrency,
+        default_route_concurrency=int(os.environ.get("LLM_DEFAULT_ROUTE_CONCURRENCY", "8")),
+        max_queue=int(os.environ.get("LLM_MAX_QUEUE", "64")),
+        timeout=float(os.environ.get("LLM_TIMEOUT_SECONDS", "60")),
+        hedge=os.environ.get("LLM_HEDGE", "").lower() in ("1", "true", "yes"),
+    )
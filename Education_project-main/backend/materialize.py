@@ -0,0 +1,78 @@
+"""Coalescing background refresh queue.
+
+Profile writes call `schedule(student_id)`; workers run the refresh handler
+for each scheduled key. A key that is already waiting is not queued twice,
+so a burst of edits to one student costs one refresh. Keys are removed
+from the waiting set before the handler runs, so a change that lands
+during a refresh schedules another one.
+
+Refreshes rebuild derived data, so pending keys are not persisted: after a
+restart the next profile change (or an on-demand request) catches up.
+"""
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+
+class RefreshQueue:
+    def __init__(self, handler: Callable[[str], Awaitable[Any]], workers: int = 2, max_depth: int = 10000):
+        self.handler = handler
+        self.workers = workers
+        self.max_depth = max_depth
+        self._queue: Optional[asyncio.Queue] = None
+        self._waiting: Set[str] = set()
+        self._tasks: List[asyncio.Task] = []
+        self.scheduled = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.refreshed = 0
+        self.failed = 0
+
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def schedule(self, key: str):
+        if self._queue is None:
+            return
+        if key in self._waiting:
+            self.coalesced += 1
+            return
+        if len(self._waiting) >= self.max_depth:
+            self.dropped += 1
+            return
+        self._waiting.add(key)
+        self._queue.put_nowait(key)
+        self.scheduled += 1
+
+    async def _worker(self):
+        while True:
+            key = await self._queue.get()
+            self._waiting.discard(key)
+            try:
+                await self.handler(key)
+                self.refreshed += 1
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"Refresh of {key} failed: {str(e)}")
+            finally:
+                self._queue.task_done()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "waiting": len(self._waiting),
+            "scheduled": self.scheduled,
+            "coalesced": self.coalesced,
+            "dropped": self.dropped,
+            "refreshed": self.refreshed,
+            "failed": self.failed,
+        }
@@ -0,0 +1,282 @@
+"""Prometheus-style metrics with a small in-process registry.
+
+Instruments are plain Python objects guarded by a lock (pymongo reports
+command events from its own threads), and labelled children are cached, so
+recording a sample is a dict lookup, a bisect and two additions. Values
+that already live elsewhere (cache counters, queue depths) are not copied
+on the hot path; collectors read them when /api/metrics is scraped.
+
+Sources:
+
+- `MetricsMiddleware`: request latency by method, route template and
+  status, plus an in-flight gauge;
+- `MongoCommandMetrics`: a pymongo command listener timing every command
+  issued through the client, i.e. every `db.*` call;
+- `observe_llm`: the LLM gateway's per-call hook (latency, outcome and
+  estimated tokens);
+- `timed`: spans around one-off work such as startup catalog loads.
+"""
+import time
+import bisect
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Sequence, Tuple
+
+from pymongo import monitoring
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+Sample = Tuple[Dict[str, str], float]
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric(ABC):
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values: str):
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    @abstractmethod
+    def _new_child(self):
+        ...
+
+    @abstractmethod
+    def _render_child(self, labels: Dict[str, str], child) -> List[str]:
+        ...
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in list(self._children.items()):
+            lines.extend(self._render_child(dict(zip(self.labelnames, values)), child))
+        return lines
+
+
+class _Value:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self, lock: threading.Lock):
+        self.value = 0.0
+        self._lock = lock
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value(self._lock)
+
+    def _render_child(self, labels, child):
+        return [f"{self.name}{_format_labels(labels)} {_format_value(child.value)}"]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+
+class _HistogramChild:
+    __slots__ = ("buckets", "counts", "sum", "count", "_lock")
+
+    def __init__(self, buckets: Sequence[float], lock: threading.Lock):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = lock
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets, self._lock)
+
+    def _render_child(self, labels, child):
+        lines, cumulative = [], 0
+        for bound, count in zip(self.buckets + (float("inf"),), child.counts):
+            cumulative += count
+            lines.append(
+                f"{self.name}_bucket{_format_labels({**labels, 'le': _format_value(bound)})} {cumulative}"
+            )
+        lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(child.sum)}")
+        lines.append(f"{self.name}_count{_format_labels(labels)} {child.count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: List[_Metric] = []
+        # (name, type, help, callable returning samples), read at scrape time
+        self.collectors: List[Tuple[str, str, str, Callable[[], List[Sample]]]] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def collector(self, name: str, kind: str, documentation: str, fn: Callable[[], List[Sample]]):
+        self.collectors.append((name, kind, documentation, fn))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        for name, kind, documentation, fn in self.collectors:
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in fn():
+                if value is not None:
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HTTP_REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "http_request_duration_seconds", "HTTP request latency.", ("method", "route", "status"),
+))
+HTTP_IN_FLIGHT = REGISTRY.register(Gauge(
+    "http_requests_in_flight", "HTTP requests currently being served.",
+))
+MONGO_COMMAND_SECONDS = REGISTRY.register(Histogram(
+    "mongo_command_duration_seconds", "MongoDB command latency.", ("command", "collection", "outcome"),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0),
+))
+MONGO_IN_FLIGHT = REGISTRY.register(Gauge(
+    "mongo_commands_in_flight", "MongoDB commands awaiting a reply.",
+))
+LLM_CALL_SECONDS = REGISTRY.register(Histogram(
+    "llm_call_duration_seconds", "LLM call latency including queueing.", ("route", "outcome"),
+))
+LLM_TOKENS = REGISTRY.register(Counter(
+    "llm_tokens_total", "Estimated LLM tokens (about four characters each).", ("route", "direction"),
+))
+ADMISSION_REJECTED = REGISTRY.register(Counter(
+    "admission_rejected_total", "LLM requests refused by admission control.", ("route", "scope"),
+))
+SPAN_SECONDS = REGISTRY.register(Histogram(
+    "span_duration_seconds", "Duration of named one-off operations.", ("span",),
+))
+
+
+@contextmanager
+def timed(span: str) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        SPAN_SECONDS.labels(span).observe(time.perf_counter() - start)
+
+
+def observe_llm(route: str, outcome: str, seconds: float, prompt_tokens: int, completion_tokens: int):
+    LLM_CALL_SECONDS.labels(route, outcome).observe(seconds)
+    LLM_TOKENS.labels(route, "prompt").inc(prompt_tokens)
+    if completion_tokens:
+        LLM_TOKENS.labels(route, "completion").inc(completion_tokens)
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    def __init__(self):
+        self._pending: Dict[Tuple[Any, int], Tuple[str, str]] = {}
+        self._in_flight = MONGO_IN_FLIGHT.labels()
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        if not isinstance(collection, str):
+            collection = ""
+        self._pending[(event.connection_id, event.request_id)] = (event.command_name, collection)
+        self._in_flight.inc()
+
+    def _finish(self, event, outcome: str):
+        command = self._pending.pop((event.connection_id, event.request_id), None)
+        if command is None:
+            return
+        self._in_flight.dec()
+        MONGO_COMMAND_SECONDS.labels(*command, outcome).observe(event.duration_micros / 1e6)
+
+    def succeeded(self, event):
+        self._finish(event, "ok")
+
+    def failed(self, event):
+        self._finish(event, "error")
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware, so streaming responses are not buffered."""
+
+    def __init__(self, app):
+        self.app = app
+        self._in_flight = HTTP_IN_FLIGHT.labels()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        self._in_flight.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            self._in_flight.dec()
+            # The route template keeps label cardinality bounded
+            route = scope.get("route")
+            HTTP_REQUEST_SECONDS.labels(
+                scope["method"], getattr(route, "path", "unmatched"), str(status)
+            ).observe(time.perf_counter() - start)
+
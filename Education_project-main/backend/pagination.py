@@ -0,0 +1,35 @@
+"""Keyset pagination over (timestamp, id) ordered collections.
+
+Cursors are opaque url-safe tokens holding the sort key of a boundary
+document, so every page is a bounded index range scan no matter how deep
+the client scrolls.
+"""
+import json
+import base64
+from datetime import datetime
+from typing import Any, Dict, Tuple
+
+from fastapi import HTTPException
+
+
+def encode_cursor(timestamp: datetime, doc_id: str) -> str:
+    raw = json.dumps([timestamp.isoformat(), doc_id]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        timestamp, doc_id = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.fromisoformat(timestamp), doc_id
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def keyset_filter(field: str, cursor: str, direction: str) -> Dict[str, Any]:
+    # direction "$lt" pages towards older documents, "$gt" towards newer ones
+    timestamp, doc_id = decode_cursor(cursor)
+    return {"$or": [
+        {field: {direction: timestamp}},
+        {field: timestamp, "id": {direction: doc_id}},
+    ]}
@@ -0,0 +1,147 @@
+"""Read-through cache of student profiles.
+
+Profiles are read on every chat turn and recommendation, so they are kept
+in an LRU with TTL and shared by all routes. Concurrent misses for the
+same student share one Mongo read. Writers go through `update`, which uses
+a single find-one-and-update round-trip, returns the profile as it was
+before and after the write, and refreshes the cached copy.
+
+With PROFILE_CACHE_CHANGE_STREAM set, a change stream on `students` evicts
+entries written by other workers (requires a replica set); otherwise the
+TTL bounds how stale another worker's copy can be. Cached documents are
+shared, so callers must treat them as read-only.
+
+A read that overlaps a write to the same profile is returned to its caller
+but not cached, so it cannot overwrite the fresher copy. Datetimes are
+stored as aware UTC whichever path filled the entry (Mongo returns naive).
+"""
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional, Tuple
+
+from pymongo import ReturnDocument
+
+from llm_cache import TTLCache
+from singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+
+def _normalize(student: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        k: v.replace(tzinfo=timezone.utc) if isinstance(v, datetime) and v.tzinfo is None else v
+        for k, v in student.items()
+        if k != "_id"
+    }
+
+
+class ProfileCache:
+    def __init__(self, collection, maxsize: int = 10000, ttl: float = 300.0):
+        self.collection = collection
+        self.cache = TTLCache(maxsize, ttl)
+        self._flight = SingleFlight()
+        self._watcher: Optional[asyncio.Task] = None
+        # Ids with a read in flight -> whether a write landed during it
+        self._loading: Dict[str, bool] = {}
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    async def get(self, student_id: str) -> Optional[Dict[str, Any]]:
+        student = self.cache.get(student_id)
+        if student is not None:
+            self.hits += 1
+            return student
+        self.misses += 1
+        return await self._flight.do(student_id, lambda: self._load(student_id))
+
+    async def _load(self, student_id: str) -> Optional[Dict[str, Any]]:
+        self._loading[student_id] = False
+        try:
+            student = await self.collection.find_one({"id": student_id}, {"_id": 0})
+        finally:
+            overlapped = self._loading.pop(student_id)
+        if student is None:
+            return None
+        student = _normalize(student)
+        if overlapped:
+            # The writer's copy, if it cached one, is at least as new
+            return self.cache.get(student_id) or student
+        self.cache.set(student_id, student)
+        return student
+
+    def _written(self, student_id: str):
+        if student_id in self._loading:
+            self._loading[student_id] = True
+
+    def put(self, student: Dict[str, Any]):
+        student = _normalize(student)
+        self._written(student["id"])
+        self.cache.set(student["id"], student)
+
+    async def update(
+        self, student_id: str, fields: Dict[str, Any]
+    ) -> Optional[Tuple[Dict[str, Any], Dict[str, Any]]]:
+        # `fields` are top-level, so the new document is the old one plus them
+        previous = await self.collection.find_one_and_update(
+            {"id": student_id},
+            {"$set": fields},
+            projection={"_id": 0},
+            return_document=ReturnDocument.BEFORE,
+        )
+        if previous is None:
+            self.invalidate(student_id)
+            return None
+        previous = _normalize(previous)
+        student = _normalize({**previous, **fields})
+        self._written(student_id)
+        self.cache.set(student_id, student)
+        return previous, student
+
+    def invalidate(self, student_id: str):
+        self.invalidations += 1
+        self._written(student_id)
+        self.cache.delete(student_id)
+
+    def start_watching(self):
+        self._watcher = asyncio.create_task(self._watch())
+
+    async def stop_watching(self):
+        if self._watcher is not None:
+            self._watcher.cancel()
+            await asyncio.gather(self._watcher, return_exceptions=True)
+            self._watcher = None
+
+    async def _watch(self):
+        pipeline = [{"$match": {"operationType": {"$in": ["update", "replace", "delete"]}}}]
+        while True:
+            try:
+                async with self.collection.watch(pipeline, full_document="updateLookup") as stream:
+                    async for change in stream:
+                        document = change.get("fullDocument") or {}
+                        student_id = document.get("id")
+                        if student_id:
+                            self.invalidate(student_id)
+                        else:
+                            # Deletes only carry _id, so drop everything
+                            self.cache = TTLCache(self.cache.maxsize, self.cache.ttl)
+                            self._loading = dict.fromkeys(self._loading, True)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Profile cache change stream unavailable: {str(e)}")
+                await asyncio.sleep(30)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.cache),
+            "maxsize": self.cache.maxsize,
+            "ttl_seconds": self.cache.ttl,
+            "watching": self._watcher is not None,
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
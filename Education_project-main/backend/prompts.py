@@ -0,0 +1,159 @@
+"""Prompt assembly under a token budget.
+
+The student-context block is rendered once per profile revision and cached
+by (id, updated_at), so chat turns and recommendations reuse it until the
+profile changes. Long list fields, recent chat history and catalog
+snippets are each fitted to their own token budget: whole lines are kept
+in priority order and the remainder is summarized as "... N more".
+
+Token counts use the gateway's estimate (about four characters per token),
+which is what /api/metrics reports as well.
+"""
+from typing import Any, Dict, List, Optional
+
+from llm_cache import TTLCache
+from llm_gateway import estimate_tokens
+
+CHAT_INSTRUCTIONS = """You are an expert career guidance counselor specializing in helping university students with graduate school applications, scholarships, and career planning.
+
+Provide personalized, actionable advice. Be encouraging but realistic. Focus on:
+1. University and program recommendations
+2. Scholarship opportunities
+3. Application strategies
+4. Profile improvement suggestions
+5. Timeline planning
+
+Keep responses concise but comprehensive."""
+
+RECOMMENDATION_REQUEST = """Please provide:
+1. Top 3 university recommendations with acceptance probability (%)
+2. Top 3 scholarship opportunities with success probability (%)
+3. 5 specific profile improvement suggestions
+4. Application timeline with key deadlines
+
+Format as JSON with keys: universities, scholarships, improvements, timeline, probabilities"""
+
+# Per-turn caps so one long answer cannot take the whole history budget
+HISTORY_MESSAGE_TOKENS = 60
+HISTORY_RESPONSE_TOKENS = 150
+
+
+def clip(text: str, max_tokens: int) -> str:
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    return text[:max_tokens * 4 - 3].rstrip() + "..."
+
+
+def fit_lines(lines: List[str], budget: int, label: str) -> List[str]:
+    kept, used = [], 0
+    for line in lines:
+        cost = estimate_tokens(line) + 1
+        if used + cost > budget:
+            kept.append(f"... {len(lines) - len(kept)} more {label}")
+            break
+        kept.append(line)
+        used += cost
+    return kept
+
+
+class PromptBuilder:
+    def __init__(
+        self,
+        context_tokens: int = 300,
+        history_tokens: int = 600,
+        catalog_tokens: int = 450,
+        history_messages: int = 6,
+        cache_size: int = 10000,
+    ):
+        self.context_tokens = context_tokens
+        self.history_tokens = history_tokens
+        self.catalog_tokens = catalog_tokens
+        self.history_messages = history_messages
+        # Keys include updated_at, so entries never go stale; the TTL only
+        # bounds how long an idle student's block is kept
+        self._contexts = TTLCache(cache_size, ttl=86400)
+        self.hits = 0
+        self.misses = 0
+
+    def student_context(self, student: Dict[str, Any]) -> str:
+        key = (student["id"], str(student.get("updated_at")))
+        block = self._contexts.get(key)
+        if block is not None:
+            self.hits += 1
+            return block
+        self.misses += 1
+        block = self._render_context(student)
+        self._contexts.set(key, block)
+        return block
+
+    def _render_context(self, student: Dict[str, Any]) -> str:
+        # Lists grow without bound, so each gets a share of the context budget
+        list_budget = self.context_tokens // 4
+        achievements = fit_lines(student.get("achievements", []), list_budget, "achievements")
+        extracurriculars = fit_lines(student.get("extracurriculars", []), list_budget, "activities")
+        return f"""Student Profile:
+- Name: {student['name']}
+- University: {student['university']}
+- Faculty: {student['faculty']}
+- GPA: {student['gpa']}
+- Credits: {student['completed_credits']}/{student['total_credits']}
+- Achievements: {'; '.join(achievements) or 'none listed'}
+- Extracurriculars: {'; '.join(extracurriculars) or 'none listed'}
+- Preferred Countries: {', '.join(student['preferred_countries'])}
+- Financial Situation: {student['financial_situation']}
+- Career Goals: {clip(student['career_goals'], list_budget)}"""
+
+    def chat_system_message(self, student: Dict[str, Any], history: Optional[List[Dict[str, Any]]] = None) -> str:
+        sections = [CHAT_INSTRUCTIONS, self.student_context(student)]
+        if history:
+            # history is newest first; keep the most recent turns that fit
+            turns = [
+                f"Student: {clip(turn['message'], HISTORY_MESSAGE_TOKENS)}\n"
+                f"Counselor: {clip(turn['response'], HISTORY_RESPONSE_TOKENS)}"
+                for turn in history
+            ]
+            kept = fit_lines(turns, self.history_tokens, "earlier turns")
+            sections.append("Recent Conversation (oldest first):\n" + "\n".join(reversed(kept)))
+        return "\n\n".join(sections)
+
+    def recommendation_prompt(
+        self,
+        student: Dict[str, Any],
+        universities: List[Dict[str, Any]],
+        scholarships: List[Dict[str, Any]],
+        deadlines: List[Dict[str, Any]],
+    ) -> str:
+        section_budget = self.catalog_tokens // 3
+        university_lines = fit_lines(
+            [f"- {u['name']} ({u['country']}): estimated {u['probability']}% acceptance" for u in universities],
+            section_budget, "universities",
+        )
+        scholarship_lines = fit_lines(
+            [f"- {s['name']} ({s['provider']}, {s['amount']:.0f}): {', '.join(s['countries'])}" for s in scholarships],
+            section_budget, "scholarships",
+        )
+        deadline_lines = fit_lines(
+            [f"- {d['name']}: {d['due_date'].isoformat()}" for d in deadlines],
+            section_budget, "deadlines",
+        )
+        return "\n\n".join([
+            "Generate comprehensive career recommendations for this student:",
+            self.student_context(student),
+            "Candidate Universities:\n" + "\n".join(university_lines or ["- none"]),
+            "Candidate Scholarships:\n" + "\n".join(scholarship_lines or ["- none"]),
+            "Upcoming Deadlines:\n" + "\n".join(deadline_lines or ["- none"]),
+            RECOMMENDATION_REQUEST,
+        ])
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._contexts),
+            "context_tokens": self.context_tokens,
+            "history_tokens": self.history_tokens,
+            "catalog_tokens": self.catalog_tokens,
+            "history_messages": self.history_messages,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
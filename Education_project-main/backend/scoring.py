@@ -0,0 +1,103 @@
+"""Vectorized acceptance-probability scoring over the university catalog.
+
+The catalog is kept as column arrays so one student, or a whole matrix of
+students, is scored against every university in a single NumPy pass:
+
+    probability = min(95, acceptance_rate * 100
+                          + max(0, (gpa - min_gpa) * 10)
+                          + achievements * 2)
+"""
+from typing import List, Dict, Any, Optional, Sequence
+
+import numpy as np
+
+MAX_PROBABILITY = 95.0
+
+
+class AcceptanceScorer:
+    def __init__(self, universities: List[Dict[str, Any]]):
+        self.universities = universities
+        self.ids = np.array([u["id"] for u in universities], dtype=object)
+        self.names = np.array([u["name"] for u in universities], dtype=object)
+        self.countries = np.array([u["country"] for u in universities], dtype=object)
+        self.acceptance_rate = np.array([u["acceptance_rate"] for u in universities], dtype=np.float64)
+        self.min_gpa = np.array([u["min_gpa"] for u in universities], dtype=np.float64)
+
+    def __len__(self):
+        return len(self.universities)
+
+    def score(self, gpa: float, achievements: int) -> np.ndarray:
+        gpa_bonus = np.maximum(0.0, (gpa - self.min_gpa) * 10)
+        return np.minimum(MAX_PROBABILITY, self.acceptance_rate * 100 + gpa_bonus + achievements * 2)
+
+    def score_matrix(self, gpas: Sequence[float], achievements: Sequence[int]) -> np.ndarray:
+        gpas = np.asarray(gpas, dtype=np.float64)[:, None]
+        achievements = np.asarray(achievements, dtype=np.float64)[:, None]
+        gpa_bonus = np.maximum(0.0, (gpas - self.min_gpa[None, :]) * 10)
+        return np.minimum(
+            MAX_PROBABILITY,
+            self.acceptance_rate[None, :] * 100 + gpa_bonus + achievements * 2,
+        )
+
+    def mask(
+        self, gpa: float, countries: Optional[Sequence[str]] = None, eligible_only: bool = True
+    ) -> np.ndarray:
+        mask = np.ones(len(self), dtype=bool)
+        if countries is not None:
+            mask &= np.isin(self.countries, list(countries))
+        if eligible_only:
+            mask &= self.min_gpa <= gpa
+        return mask
+
+    def top_k(self, scores: np.ndarray, mask: np.ndarray, k: int) -> List[Dict[str, Any]]:
+        candidates = np.flatnonzero(mask)
+        if candidates.size == 0:
+            return []
+        candidate_scores = scores[candidates]
+        if candidates.size > k:
+            part = np.argpartition(-candidate_scores, k - 1)[:k]
+        else:
+            part = np.arange(candidates.size)
+        # Stable ordering: highest probability first, catalog order on ties
+        order = part[np.lexsort((candidates[part], -candidate_scores[part]))]
+        return [
+            {
+                "university_id": self.ids[candidates[i]],
+                "name": self.names[candidates[i]],
+                "country": self.countries[candidates[i]],
+                "probability": round(float(candidate_scores[i]), 1),
+            }
+            for i in order
+        ]
+
+    def rank_student(
+        self,
+        student: Dict[str, Any],
+        k: int = 10,
+        preferred_only: bool = True,
+        eligible_only: bool = True,
+    ) -> List[Dict[str, Any]]:
+        countries = student["preferred_countries"] if preferred_only else None
+        scores = self.score(student["gpa"], len(student["achievements"]))
+        return self.top_k(scores, self.mask(student["gpa"], countries, eligible_only), k)
+
+    def rank_students(
+        self,
+        students: List[Dict[str, Any]],
+        k: int = 10,
+        preferred_only: bool = True,
+        eligible_only: bool = True,
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        if not students:
+            return {}
+        matrix = self.score_matrix(
+            [s["gpa"] for s in students], [len(s["achievements"]) for s in students]
+        )
+        return {
+            student["id"]: self.top_k(
+                matrix[row],
+                self.mask(student["gpa"], student["preferred_countries"] if preferred_only else None, eligible_only),
+                k,
+            )
+            for row, student in enumerate(students)
+        }
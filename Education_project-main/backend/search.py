@@ -0,0 +1,293 @@
+"""In-process BM25 search over the university and scholarship catalogs.
+
+Documents are tokenized into one inverted index keyed by (kind, id). When a
+catalog reloads, `sync` diffs the new documents against what is indexed by
+the values of their searchable fields, so only added, changed or removed
+documents are tokenized again; other documents just have their stored copy
+swapped for the new one. Per-term postings are scored once into impact-ordered lists. A small
+change only rescores the terms it touches; the rest are rescored once the
+document count drifts by more than 10%.
+
+Typeahead (prefix mode) matches the last query token as a prefix, caps its
+expansion to the most common matching terms and merges their impact
+lists best first, stopping after PREFIX_CANDIDATES documents. Those are
+the candidates: the complete tokens before it are scored against the
+candidates alone rather than walked in full, which keeps multi-word
+typeahead in the low milliseconds on large catalogs.
+
+`CatalogSearch` keeps a sync off the event loop and off the request path:
+a reload is applied to a copy of the index in a worker thread, queries
+keep reading the current index meanwhile, and the copy is swapped in when
+it is done.
+"""
+import re
+import math
+import heapq
+import bisect
+import asyncio
+import logging
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+# Fields indexed per catalog, with a weight applied as a term-frequency boost
+SEARCH_FIELDS = {
+    "universities": {"name": 3, "country": 1, "programs": 1, "language_requirements": 1},
+    "scholarships": {
+        "name": 3, "provider": 2, "countries": 1, "fields": 1, "requirements": 1, "description": 1,
+    },
+}
+
+MAX_PREFIX_EXPANSIONS = 50
+# Candidates read in prefix mode, best first across the expansions' lists
+PREFIX_CANDIDATES = 1000
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_RE.findall(text.lower())
+
+
+def _signature(kind: str, doc: Dict[str, Any]) -> Tuple[Any, ...]:
+    # The index depends on these values only
+    return tuple(doc.get(field) for field in SEARCH_FIELDS[kind])
+
+
+class SearchIndex:
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, Dict[Tuple[str, str], int]] = {}
+        self.doc_terms: Dict[Tuple[str, str], Counter] = {}
+        self.doc_lengths: Dict[Tuple[str, str], int] = {}
+        self.documents: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self.signatures: Dict[Tuple[str, str], Tuple[Any, ...]] = {}
+        self._total_length = 0
+        self._sorted_terms: List[str] = []
+        self._terms_dirty = False
+        self._sources: Dict[str, List[Dict[str, Any]]] = {}
+        self._impacts: Dict[Tuple[str, Optional[str]], List[Tuple[float, Tuple[str, str]]]] = {}
+        self._scored_count = 0
+
+    def __len__(self):
+        return len(self.documents)
+
+    def copy(self) -> "SearchIndex":
+        # Posting dicts are edited in place, so they are copied; everything
+        # else is replaced rather than mutated and can be shared
+        clone = SearchIndex(self.k1, self.b)
+        clone.postings = {term: dict(postings) for term, postings in self.postings.items()}
+        clone.doc_terms = dict(self.doc_terms)
+        clone.doc_lengths = dict(self.doc_lengths)
+        clone.documents = dict(self.documents)
+        clone.signatures = dict(self.signatures)
+        clone._total_length = self._total_length
+        clone._sorted_terms = self._sorted_terms
+        clone._terms_dirty = self._terms_dirty
+        clone._sources = dict(self._sources)
+        clone._impacts = dict(self._impacts)
+        clone._scored_count = self._scored_count
+        return clone
+
+    def _terms_for(self, kind: str, doc: Dict[str, Any]) -> Counter:
+        terms = Counter()
+        for field, weight in SEARCH_FIELDS[kind].items():
+            value = doc.get(field) or ""
+            text = " ".join(value) if isinstance(value, list) else str(value)
+            for token in tokenize(text):
+                terms[token] += weight
+        return terms
+
+    def add(self, kind: str, doc: Dict[str, Any]):
+        key = (kind, doc["id"])
+        if key in self.documents:
+            self.remove(kind, doc["id"])
+        terms = self._terms_for(kind, doc)
+        for term, tf in terms.items():
+            if term not in self.postings:
+                self.postings[term] = {}
+                self._terms_dirty = True
+            self.postings[term][key] = tf
+        length = sum(terms.values())
+        self.doc_terms[key] = terms
+        self.doc_lengths[key] = length
+        self.documents[key] = doc
+        self.signatures[key] = _signature(kind, doc)
+        self._total_length += length
+        self._invalidate_terms(terms)
+
+    def remove(self, kind: str, doc_id: str):
+        key = (kind, doc_id)
+        if key not in self.documents:
+            return
+        terms = self.doc_terms.pop(key)
+        self._invalidate_terms(terms)
+        for term in terms:
+            postings = self.postings[term]
+            del postings[key]
+            if not postings:
+                del self.postings[term]
+                self._terms_dirty = True
+        self._total_length -= self.doc_lengths.pop(key)
+        del self.documents[key]
+        del self.signatures[key]
+
+    def sync(self, kind: str, documents: List[Dict[str, Any]]) -> Dict[str, int]:
+        # The same list object means the catalog has not reloaded
+        if self._sources.get(kind) is documents:
+            return {"added": 0, "updated": 0, "removed": 0}
+        changes = {"added": 0, "updated": 0, "removed": 0}
+        seen = set()
+        for doc in documents:
+            key = (kind, doc["id"])
+            seen.add(key)
+            if key not in self.documents:
+                changes["added"] += 1
+                self.add(kind, doc)
+            elif self.signatures[key] != _signature(kind, doc):
+                changes["updated"] += 1
+                self.add(kind, doc)
+            else:
+                self.documents[key] = doc
+        for key in [k for k in self.documents if k[0] == kind and k not in seen]:
+            changes["removed"] += 1
+            self.remove(*key)
+        self._sources[kind] = documents
+        if any(changes.values()):
+            self.warm()
+        return changes
+
+    def _invalidate_terms(self, terms):
+        for term in terms:
+            for kind in (None, *SEARCH_FIELDS):
+                self._impacts.pop((term, kind), None)
+
+    def warm(self):
+        # Precompute missing unfiltered impact lists and the sorted vocabulary
+        # so the first queries after a change are fast too
+        if abs(len(self.documents) - self._scored_count) > 0.1 * max(self._scored_count, 1):
+            self._impacts = {}
+            self._scored_count = len(self.documents)
+        for term in self.postings:
+            if (term, None) not in self._impacts:
+                self._impact_list(term, None)
+        self._expand_prefix("")
+
+    def _expand_prefix(self, prefix: str) -> List[str]:
+        if self._terms_dirty:
+            self._sorted_terms = sorted(self.postings)
+            self._terms_dirty = False
+        start = bisect.bisect_left(self._sorted_terms, prefix)
+        end = bisect.bisect_left(self._sorted_terms, prefix + "\uffff")
+        matches = self._sorted_terms[start:end]
+        if len(matches) > MAX_PREFIX_EXPANSIONS:
+            matches = heapq.nlargest(MAX_PREFIX_EXPANSIONS, matches, key=lambda t: len(self.postings[t]))
+        return matches
+
+    def _idf(self, postings: Dict[Tuple[str, str], int]) -> float:
+        n = len(self.documents)
+        return math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+
+    def _bm25(self, tf: int, key: Tuple[str, str], idf: float, avgdl: float) -> float:
+        return idf * tf * (self.k1 + 1) / (tf + self.k1 * (1 - self.b + self.b * self.doc_lengths[key] / avgdl))
+
+    def _impact_list(self, term: str, kind: Optional[str]) -> List[Tuple[float, Tuple[str, str]]]:
+        cached = self._impacts.get((term, kind))
+        if cached is None:
+            postings = self.postings.get(term, {})
+            avgdl = self._total_length / len(self.documents)
+            idf = self._idf(postings)
+            cached = sorted(
+                (
+                    (self._bm25(tf, key, idf, avgdl), key)
+                    for key, tf in postings.items()
+                    if kind is None or key[0] == kind
+                ),
+                reverse=True,
+            )
+            self._impacts[(term, kind)] = cached
+        return cached
+
+    def search(
+        self, query: str, kind: Optional[str] = None, limit: int = 10, prefix: bool = False
+    ) -> List[Dict[str, Any]]:
+        tokens = tokenize(query)
+        if not tokens or not self.documents:
+            return []
+
+        scores: Dict[Tuple[str, str], float] = {}
+        if prefix:
+            # A document's first entry in the merge is its best matching
+            # term; complete tokens only add their score to the candidates,
+            # so a query costs the same however common its other words are
+            *complete, partial = tokens
+            merged = heapq.merge(*(self._impact_list(t, kind) for t in self._expand_prefix(partial)), reverse=True)
+            for score, key in merged:
+                if key not in scores:
+                    scores[key] = score
+                    if len(scores) >= PREFIX_CANDIDATES:
+                        break
+            avgdl = self._total_length / len(self.documents)
+            for token in complete:
+                postings = self.postings.get(token)
+                if not postings:
+                    continue
+                idf = self._idf(postings)
+                for key in scores:
+                    tf = postings.get(key)
+                    if tf:
+                        scores[key] += self._bm25(tf, key, idf, avgdl)
+        else:
+            for token in tokens:
+                for score, key in self._impact_list(token, kind):
+                    scores[key] = scores.get(key, 0.0) + score
+
+        top = heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+        return [
+            {
+                "kind": key[0],
+                "id": key[1],
+                "name": self.documents[key]["name"],
+                "score": round(score, 4),
+                "document": self.documents[key],
+            }
+            for key, score in top
+        ]
+
+
+class CatalogSearch:
+    def __init__(self):
+        self.index = SearchIndex()
+        self._task: Optional[asyncio.Task] = None
+        self.syncs = 0
+
+    def _current(self, sources: Dict[str, List[Dict[str, Any]]]) -> bool:
+        return all(self.index._sources.get(kind) is documents for kind, documents in sources.items())
+
+    def refresh(self, sources: Dict[str, List[Dict[str, Any]]]) -> Optional[asyncio.Task]:
+        # Starts a background sync if the catalogs reloaded; returns the sync
+        # in progress, if any. Sources must be replaced, never mutated.
+        if self._task is None and not self._current(sources):
+            self._task = asyncio.create_task(self._sync(sources))
+        return self._task
+
+    async def _sync(self, sources: Dict[str, List[Dict[str, Any]]]):
+        def synced_copy(index: SearchIndex) -> SearchIndex:
+            index = index.copy()
+            for kind, documents in sources.items():
+                changes = index.sync(kind, documents)
+                logger.info(f"Catalog search synced {kind}: {changes}")
+            return index
+
+        try:
+            self.index = await asyncio.to_thread(synced_copy, self.index)
+            self.syncs += 1
+        except Exception as e:
+            logger.error(f"Catalog search sync failed: {str(e)}")
+        finally:
+            self._task = None
+
+    def search(self, query: str, kind: Optional[str] = None, limit: int = 10, prefix: bool = False):
+        return self.index.search(query, kind=kind, limit=limit, prefix=prefix)
@@ -1,28 +1,126 @@
-from fastapi import FastAPI, APIRouter, HTTPException
+from fastapi import FastAPI, APIRouter, HTTPException, Query, Request
 from dotenv import load_dotenv
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse, Response
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
 import os
+import asyncio
 import logging
 from pathlib import Path
-from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any
+from pydantic import BaseModel, Field, ValidationError
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from typing import List, Optional, Dict, Any, Tuple, Literal
 import uuid
-from datetime import datetime, timezone
-from emergentintegrations.llm.chat import LlmChat, UserMessage
+from datetime import datetime, timezone, date
 import json
+import math
+from indexes import ensure_indexes, explain_query_shapes, index_usage
+from catalog import CatalogEngine
+from catalog_loader import load_catalog
+from llm_cache import CompletionCache, cache_key
+from singleflight import SingleFlight
+from llm_gateway import LlmOverloaded, LlmTimeout, create_gateway_from_env
+from pagination import encode_cursor, keyset_filter
+from scoring import AcceptanceScorer
+from jobs import JobQueue, QueueFull, PermanentJobError
+from profile_cache import ProfileCache
+from fast_json import TrustedJSONResponse, model_projection
+from search import CatalogSearch
+from eligibility import EligibilityMatcher
+from deadlines import DeadlineIndex
+from metrics import REGISTRY, ADMISSION_REJECTED, MetricsMiddleware, MongoCommandMetrics, observe_llm, timed
+from admission import AdmissionDenied, create_admission_from_env
+from prompts import PromptBuilder
+from write_behind import create_write_buffer_from_env
+from materialize import RefreshQueue
+from export import export_ndjson, export_upper_bound, gzip_stream
+from analytics import ROLLUPS, AnalyticsRollups
+from similarity import ENCODED_FIELDS, create_similarity_index_from_env
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+# Every command issued through the client is timed for /api/metrics
+client = AsyncIOMotorClient(mongo_url, event_listeners=[MongoCommandMetrics()])
 db = client[os.environ['DB_NAME']]
 
+LLM_PROVIDER = "openai"
+LLM_MODEL = "gpt-4o-mini"
+BULK_CHUNK_SIZE = int(os.environ.get('STUDENT_BULK_CHUNK_SIZE', '1000'))
+# "off", "deterministic" (scores and eligibility) or "full" (also queues the LLM part).
+# Refreshes merge into the latest LLM-backed recommendation rather than
+# replacing it with a deterministic-only row
+RECOMMENDATION_MATERIALIZE = os.environ.get('RECOMMENDATION_MATERIALIZE', 'deterministic')
+# Profile fields that feed recommendations; edits to others refresh nothing
+RECOMMENDATION_FIELDS = {
+    "faculty", "gpa", "total_credits", "completed_credits", "achievements",
+    "extracurriculars", "preferred_countries", "financial_situation", "career_goals",
+}
+SIMILARITY_FIELDS = set(ENCODED_FIELDS)
+DEFAULT_IMPROVEMENTS = [
+    "Increase GPA through focused study",
+    "Gain research experience in your field",
+    "Develop leadership skills through extracurriculars",
+    "Improve language proficiency",
+    "Build professional network",
+]
+
 # Create the main app without a prefix
 app = FastAPI()
 
+# BM25 index over both catalogs, synced incrementally on catalog reloads
+catalog_search = CatalogSearch()
+
+# Cache of recommendation completions keyed by their prompt inputs
+recommendation_cache = CompletionCache(
+    maxsize=int(os.environ.get('RECOMMENDATION_CACHE_SIZE', '1024')),
+    ttl=float(os.environ.get('RECOMMENDATION_CACHE_TTL_SECONDS', '86400')),
+    collection=db.recommendation_cache if os.environ.get('RECOMMENDATION_CACHE_MONGO') else None,
+)
+
+# Read-through student profile cache shared by all routes
+student_profiles = ProfileCache(
+    db.students,
+    maxsize=int(os.environ.get('PROFILE_CACHE_SIZE', '10000')),
+    ttl=float(os.environ.get('PROFILE_CACHE_TTL_SECONDS', '300')),
+)
+
+# Shared LLM client with concurrency limits, deadlines and hedging
+llm_gateway = create_gateway_from_env(LLM_PROVIDER, LLM_MODEL)
+llm_gateway.observer = observe_llm
+
+# Budgeted prompt assembly with cached per-student context blocks
+prompt_builder = PromptBuilder(
+    context_tokens=int(os.environ.get('PROMPT_CONTEXT_TOKENS', '300')),
+    history_tokens=int(os.environ.get('PROMPT_HISTORY_TOKENS', '600')),
+    catalog_tokens=int(os.environ.get('PROMPT_CATALOG_TOKENS', '450')),
+    history_messages=int(os.environ.get('PROMPT_HISTORY_MESSAGES', '6')),
+)
+
+# Append-only records are written in batches behind the response
+chat_writes = create_write_buffer_from_env(db.chat_messages)
+recommendation_writes = create_write_buffer_from_env(db.recommendations)
+
+# Coalesces concurrent identical LLM requests
+llm_flight = SingleFlight()
+
+# Per-student and global token buckets in front of the LLM routes
+llm_admission = create_admission_from_env(db.admission_buckets)
+
+# Cohort analytics, served from rollup collections refreshed on a schedule
+analytics_rollups = AnalyticsRollups(
+    db,
+    interval=float(os.environ.get('ANALYTICS_REFRESH_SECONDS', '300')),
+    lease=float(os.environ.get('ANALYTICS_LEASE_SECONDS', '600')),
+)
+
+# Profile feature vectors for similar-student lookups, updated on every write
+similar_students = create_similarity_index_from_env()
+
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
 
@@ -58,6 +156,31 @@ class StudentProfileCreate(BaseModel):
     financial_situation: str
     career_goals: str
 
+class StudentProfilePatch(BaseModel):
+    id: str
+    name: Optional[str] = None
+    university: Optional[str] = None
+    faculty: Optional[str] = None
+    gpa: Optional[float] = None
+    total_credits: Optional[int] = None
+    completed_credits: Optional[int] = None
+    achievements: Optional[List[str]] = None
+    extracurriculars: Optional[List[str]] = None
+    preferred_countries: Optional[List[str]] = None
+    financial_situation: Optional[str] = None
+    career_goals: Optional[str] = None
+
+class BulkRowResult(BaseModel):
+    index: int
+    id: Optional[str] = None
+    status: str  # "created", "updated", "not_found", "invalid", "failed"
+    errors: List[str] = []
+
+class BulkResult(BaseModel):
+    succeeded: int
+    failed: int
+    results: List[BulkRowResult]
+
 class StudentProfileUpdate(BaseModel):
     name: Optional[str] = None
     university: Optional[str] = None
@@ -108,6 +231,11 @@ class ChatRequest(BaseModel):
     student_id: str
     message: str
 
+class ChatHistoryPage(BaseModel):
+    messages: List[Dict[str, Any]]
+    next_cursor: Optional[str] = None
+    prev_cursor: Optional[str] = None
+
 # Career Recommendation Models
 class CareerRecommendation(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -117,106 +245,69 @@ class CareerRecommendation(BaseModel):
     suggested_improvements: List[str]
     generated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
-# Initialize sample data
-async def initialize_sample_data():
-    # Check if universities already exist
-    existing_universities = await db.universities.count_documents({})
-    if existing_universities == 0:
-        sample_universities = [
-            {
-                "id": str(uuid.uuid4()),
-                "name": "MIT",
-                "country": "USA",
-                "ranking": 1,
-                "programs": ["Computer Science", "Engineering", "Business"],
-                "acceptance_rate": 0.07,
-                "tuition_fee": 55000,
-                "scholarships_available": True,
-                "language_requirements": ["English"],
-                "min_gpa": 3.8,
-                "application_deadline": "January 1"
-            },
-            {
-                "id": str(uuid.uuid4()),
-                "name": "Oxford University",
-                "country": "UK",
-                "ranking": 2,
-                "programs": ["Computer Science", "Engineering", "Medicine", "Law"],
-                "acceptance_rate": 0.15,
-                "tuition_fee": 45000,
-                "scholarships_available": True,
-                "language_requirements": ["English"],
-                "min_gpa": 3.7,
-                "application_deadline": "October 15"
-            },
-            {
-                "id": str(uuid.uuid4()),
-                "name": "TU Munich",
-                "country": "Germany",
-                "ranking": 15,
-                "programs": ["Engineering", "Computer Science", "Physics"],
-                "acceptance_rate": 0.30,
-                "tuition_fee": 0,
-                "scholarships_available": True,
-                "language_requirements": ["German", "English"],
-                "min_gpa": 3.5,
-                "application_deadline": "March 15"
-            },
-            {
-                "id": str(uuid.uuid4()),
-                "name": "University of Toronto",
-                "country": "Canada",
-                "ranking": 20,
-                "programs": ["Computer Science", "Engineering", "Business", "Medicine"],
-                "acceptance_rate": 0.25,
-                "tuition_fee": 30000,
-                "scholarships_available": True,
-                "language_requirements": ["English"],
-                "min_gpa": 3.6,
-                "application_deadline": "January 15"
-            }
-        ]
-        await db.universities.insert_many(sample_universities)
-
-    # Check if scholarships already exist
-    existing_scholarships = await db.scholarships.count_documents({})
-    if existing_scholarships == 0:
-        sample_scholarships = [
-            {
-                "id": str(uuid.uuid4()),
-                "name": "Fulbright Scholarship",
-                "provider": "US Government",
-                "countries": ["USA"],
-                "fields": ["All"],
-                "amount": 50000,
-                "requirements": ["GPA > 3.5", "English Proficiency", "Leadership Experience"],
-                "deadline": "October 1",
-                "description": "Full scholarship for graduate studies in the USA"
-            },
-            {
-                "id": str(uuid.uuid4()),
-                "name": "DAAD Scholarship",
-                "provider": "German Government",
-                "countries": ["Germany"],
-                "fields": ["Engineering", "Science", "Technology"],
-                "amount": 25000,
-                "requirements": ["GPA > 3.0", "German or English Proficiency"],
-                "deadline": "January 31",
-                "description": "Scholarship for international students in Germany"
-            },
-            {
-                "id": str(uuid.uuid4()),
-                "name": "Rhodes Scholarship",
-                "provider": "Rhodes Trust",
-                "countries": ["UK"],
-                "fields": ["All"],
-                "amount": 70000,
-                "requirements": ["Exceptional Academic Record", "Leadership", "Character"],
-                "deadline": "September 1",
-                "description": "Prestigious scholarship for Oxford University"
-            }
-        ]
-        await db.scholarships.insert_many(sample_scholarships)
+class RecommendationJob(BaseModel):
+    id: str
+    student_id: str
+    status: str  # "queued", "running", "succeeded", "failed"
+    priority: int
+    attempts: int
+    error: Optional[str] = None
+    enqueued_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    recommendation: Optional[CareerRecommendation] = None
+
+# Acceptance Probability Models
+class AcceptanceScore(BaseModel):
+    university_id: str
+    name: str
+    country: str
+    probability: float
+
+class AcceptanceBatchRequest(BaseModel):
+    student_ids: List[str]
+    k: int = Field(10, ge=1, le=100)
+    preferred_only: bool = True
+    eligible_only: bool = True
+
+# Scholarship Eligibility Models
+class ScholarshipMatch(BaseModel):
+    scholarship_id: str
+    name: str
+    provider: str
+    amount: float
+    deadline: str
+    met_requirements: List[str]
+    unverified_requirements: List[str]
+
+# Deadline Models
+class UpcomingDeadline(BaseModel):
+    kind: str  # "universities" or "scholarships"
+    id: str
+    name: str
+    countries: List[str]
+    deadline: str
+    due_date: date
+    days_left: int
+
+# Similar Student Models
+class SimilarStudent(BaseModel):
+    id: str
+    name: str
+    university: str
+    faculty: str
+    gpa: float
+    preferred_countries: List[str]
+    distance: float
+
+# In-memory catalogs serving the university and scholarship filters; they are
+# served without revalidation, so only model fields are loaded
+university_catalog = CatalogEngine(
+    "universities", {"country": "country", "program": "programs"}, projection=model_projection(University)
+)
+scholarship_catalog = CatalogEngine(
+    "scholarships", {"country": "countries", "field": "fields"}, projection=model_projection(Scholarship)
+)
 
 # API Routes
 @api_router.get("/")
@@ -228,13 +319,16 @@ async def root():
 async def create_student_profile(student: StudentProfileCreate):
     student_dict = student.dict()
     student_obj = StudentProfile(**student_dict)
-    await db.students.insert_one(student_obj.dict())
-    await initialize_sample_data()  # Initialize sample data when first student is created
+    student_doc = student_obj.dict()
+    await db.students.insert_one(student_doc)
+    student_profiles.put(student_doc)
+    similar_students.upsert(student_doc)
+    recommendation_refresh.schedule(student_obj.id)
     return student_obj
 
 @api_router.get("/students/{student_id}", response_model=StudentProfile)
 async def get_student_profile(student_id: str):
-    student = await db.students.find_one({"id": student_id})
+    student = await student_profiles.get(student_id)
     if not student:
         raise HTTPException(status_code=404, detail="Student not found")
     return StudentProfile(**student)
@@ -244,149 +338,369 @@ async def update_student_profile(student_id: str, updates: StudentProfileUpdate)
     update_dict = {k: v for k, v in updates.dict().items() if v is not None}
     update_dict["updated_at"] = datetime.now(timezone.utc)
     
-    result = await db.students.update_one(
-        {"id": student_id}, 
-        {"$set": update_dict}
-    )
-    if result.matched_count == 0:
+    updated = await student_profiles.update(student_id, update_dict)
+    if updated is None:
         raise HTTPException(status_code=404, detail="Student not found")
+    previous, updated_student = updated
+    similar_students.upsert(updated_student)
+    # Only real changes to recommendation inputs trigger a refresh
+    if any(previous.get(f) != updated_student.get(f) for f in RECOMMENDATION_FIELDS):
+        recommendation_refresh.schedule(student_id)
     
-    updated_student = await db.students.find_one({"id": student_id})
     return StudentProfile(**updated_student)
 
+# Bulk Student Routes
+class MalformedRow:
+    # Stands in for an NDJSON line that is not valid JSON
+    def __init__(self, line: int, error: Exception):
+        self.error = f"line {line}: Invalid JSON: {str(error)}"
+
+def parse_ndjson_line(number: int, line: bytes) -> Any:
+    try:
+        return json.loads(line)
+    except (ValueError, UnicodeDecodeError) as e:
+        return MalformedRow(number, e)
+
+async def read_json_rows(request: Request) -> List[Any]:
+    body = await request.body()
+    if "ndjson" in request.headers.get("content-type", ""):
+        # Lines are parsed independently so one bad line only fails its row
+        return [
+            parse_ndjson_line(number, line)
+            for number, line in enumerate(body.splitlines(), start=1) if line.strip()
+        ]
+    try:
+        rows = json.loads(body)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid JSON body: {str(e)}")
+    if not isinstance(rows, list):
+        raise HTTPException(status_code=400, detail="Expected a JSON array or NDJSON rows")
+    return rows
+
+def validate_rows(rows: List[Any], model) -> Tuple[List[Tuple[int, BaseModel]], List[BulkRowResult]]:
+    valid, invalid = [], []
+    for index, row in enumerate(rows):
+        if isinstance(row, MalformedRow):
+            invalid.append(BulkRowResult(index=index, status="invalid", errors=[row.error]))
+            continue
+        try:
+            valid.append((index, model.model_validate(row)))
+        except ValidationError as e:
+            errors = [f"{'.'.join(str(p) for p in err['loc'])}: {err['msg']}" for err in e.errors()]
+            invalid.append(BulkRowResult(index=index, status="invalid", errors=errors))
+    return valid, invalid
+
+def bulk_write_errors(e: BulkWriteError) -> Dict[int, str]:
+    return {err["index"]: err.get("errmsg", "write failed") for err in e.details.get("writeErrors", [])}
+
+@api_router.post("/students/bulk", response_model=BulkResult)
+async def bulk_create_student_profiles(
+    request: Request,
+    chunk_size: int = Query(BULK_CHUNK_SIZE, ge=1, le=10000),
+    refresh_recommendations: bool = False,
+):
+    # Imports do not precompute recommendations unless asked: one refresh
+    # per row would fill the refresh queue and drop everyone else's
+    valid, results = validate_rows(await read_json_rows(request), StudentProfileCreate)
+
+    for start in range(0, len(valid), chunk_size):
+        chunk = valid[start:start + chunk_size]
+        docs = [StudentProfile(**student.dict()).dict() for _, student in chunk]
+        failures = {}
+        try:
+            await db.students.insert_many(docs, ordered=False)
+        except BulkWriteError as e:
+            failures = bulk_write_errors(e)
+        created = []
+        for position, ((index, _), doc) in enumerate(zip(chunk, docs)):
+            if position in failures:
+                results.append(BulkRowResult(index=index, id=doc["id"], status="failed", errors=[failures[position]]))
+            else:
+                results.append(BulkRowResult(index=index, id=doc["id"], status="created"))
+                created.append(doc)
+                if refresh_recommendations:
+                    recommendation_refresh.schedule(doc["id"])
+        similar_students.upsert_many(created)
+
+    return bulk_result(results, "created")
+
+@api_router.patch("/students/bulk", response_model=BulkResult)
+async def bulk_update_student_profiles(
+    request: Request,
+    chunk_size: int = Query(BULK_CHUNK_SIZE, ge=1, le=10000),
+    refresh_recommendations: bool = False,
+):
+    valid, results = validate_rows(await read_json_rows(request), StudentProfilePatch)
+
+    for start in range(0, len(valid), chunk_size):
+        chunk = valid[start:start + chunk_size]
+        existing = {
+            doc["id"] for doc in await db.students.find(
+                {"id": {"$in": [patch.id for _, patch in chunk]}}, {"_id": 0, "id": 1}
+            ).to_list(None)
+        }
+        updates, targets = [], []
+        for index, patch in chunk:
+            if patch.id not in existing:
+                results.append(BulkRowResult(index=index, id=patch.id, status="not_found"))
+                continue
+            update_dict = {k: v for k, v in patch.dict().items() if v is not None and k != "id"}
+            updates.append((patch.id, update_dict))
+            targets.append((
+                index, patch.id, bool(RECOMMENDATION_FIELDS & update_dict.keys()), bool(SIMILARITY_FIELDS & update_dict.keys())
+            ))
+
+        # Stamped from the app clock like every other profile write, once
+        # per chunk just before it is sent, so a row's updated_at trails its
+        # commit by at most one chunk's write, never the whole request
+        now = datetime.now(timezone.utc)
+        operations = [
+            UpdateOne({"id": student_id}, {"$set": {**fields, "updated_at": now}}) for student_id, fields in updates
+        ]
+        failures = {}
+        if operations:
+            try:
+                await db.students.bulk_write(operations, ordered=False)
+            except BulkWriteError as e:
+                failures = bulk_write_errors(e)
+        reindex = []
+        for position, (index, student_id, affects_recommendations, affects_similarity) in enumerate(targets):
+            student_profiles.invalidate(student_id)
+            if position in failures:
+                results.append(BulkRowResult(index=index, id=student_id, status="failed", errors=[failures[position]]))
+            else:
+                results.append(BulkRowResult(index=index, id=student_id, status="updated"))
+                if affects_recommendations and refresh_recommendations:
+                    recommendation_refresh.schedule(student_id)
+                if affects_similarity:
+                    reindex.append(student_id)
+        if reindex:
+            # Patches are partial, so re-read the encoded fields in one query
+            similar_students.upsert_many(await db.students.find(
+                {"id": {"$in": reindex}}, {"_id": 0, "id": 1, "updated_at": 1, **{f: 1 for f in ENCODED_FIELDS}}
+            ).to_list(None))
+
+    return bulk_result(results, "updated")
+
+def bulk_result(results: List[BulkRowResult], ok_status: str) -> BulkResult:
+    results.sort(key=lambda r: r.index)
+    succeeded = sum(1 for r in results if r.status == ok_status)
+    return BulkResult(succeeded=succeeded, failed=len(results) - succeeded, results=results)
+
 # Universities and Scholarships Routes
 @api_router.get("/universities", response_model=List[University])
-async def get_universities(country: Optional[str] = None, program: Optional[str] = None):
-    filter_query = {}
-    if country:
-        filter_query["country"] = {"$regex": country, "$options": "i"}
-    if program:
-        filter_query["programs"] = {"$regex": program, "$options": "i"}
-    
-    universities = await db.universities.find(filter_query).to_list(100)
-    return [University(**uni) for uni in universities]
+async def get_universities(
+    country: Optional[str] = None,
+    program: Optional[str] = None,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+):
+    await university_catalog.ensure_fresh(db)
+    total, universities = university_catalog.query(
+        {"country": country, "program": program}, skip=skip, limit=limit
+    )
+    # Catalog documents are server-written and already _id-free
+    return TrustedJSONResponse(universities, headers={"X-Total-Count": str(total)})
 
 @api_router.get("/scholarships", response_model=List[Scholarship])
-async def get_scholarships(country: Optional[str] = None, field: Optional[str] = None):
-    filter_query = {}
-    if country:
-        filter_query["countries"] = {"$regex": country, "$options": "i"}
-    if field:
-        filter_query["fields"] = {"$regex": field, "$options": "i"}
-    
-    scholarships = await db.scholarships.find(filter_query).to_list(100)
-    return [Scholarship(**scholarship) for scholarship in scholarships]
+async def get_scholarships(
+    country: Optional[str] = None,
+    field: Optional[str] = None,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+):
+    await scholarship_catalog.ensure_fresh(db)
+    total, scholarships = scholarship_catalog.query(
+        {"country": country, "field": field}, skip=skip, limit=limit
+    )
+    return TrustedJSONResponse(scholarships, headers={"X-Total-Count": str(total)})
+
+# Catalog Search Routes
+async def refresh_catalog_search(wait: bool = False):
+    # Requests keep searching the current index while a reload syncs in a
+    # worker thread; only startup waits for it
+    await university_catalog.ensure_fresh(db)
+    await scholarship_catalog.ensure_fresh(db)
+    sync = catalog_search.refresh({
+        "universities": university_catalog.documents,
+        "scholarships": scholarship_catalog.documents,
+    })
+    if wait and sync is not None:
+        await asyncio.shield(sync)
+
+@api_router.get("/search")
+async def search_catalog(
+    q: str = Query(..., min_length=1, max_length=200),
+    kind: Optional[Literal["universities", "scholarships"]] = None,
+    limit: int = Query(10, ge=1, le=100),
+    prefix: bool = False,
+):
+    await refresh_catalog_search()
+    return TrustedJSONResponse(catalog_search.search(q, kind=kind, limit=limit, prefix=prefix))
+
+@api_router.get("/search/suggest")
+async def suggest_catalog(
+    q: str = Query(..., min_length=1, max_length=100),
+    kind: Optional[Literal["universities", "scholarships"]] = None,
+    limit: int = Query(8, ge=1, le=20),
+):
+    await refresh_catalog_search()
+    results = catalog_search.search(q, kind=kind, limit=limit, prefix=True)
+    return TrustedJSONResponse([
+        {"kind": r["kind"], "id": r["id"], "name": r["name"], "score": r["score"]} for r in results
+    ])
 
 # AI Chat Route
+async def recent_chat_history(student_id: str) -> List[Dict[str, Any]]:
+    # Newest first, served by the (student_id, timestamp, id) index
+    limit = prompt_builder.history_messages
+    if limit <= 0:
+        return []
+    return await db.chat_messages.find(
+        {"student_id": student_id}, {"_id": 0, "message": 1, "response": 1}
+    ).sort([("timestamp", -1), ("id", -1)]).limit(limit).to_list(limit)
+
+def llm_error_to_http(e: Exception) -> HTTPException:
+    if isinstance(e, LlmOverloaded):
+        return HTTPException(status_code=503, detail="AI service is busy, please retry", headers={"Retry-After": "5"})
+    return HTTPException(status_code=504, detail="AI service timed out")
+
+async def admit_llm_request(route: str, student_id: str):
+    # Runs before any DB or LLM work so overload is shed cheaply
+    try:
+        await llm_admission.admit(student_id)
+    except AdmissionDenied as e:
+        ADMISSION_REJECTED.labels(route, e.scope).inc()
+        detail = "Too many requests for this student" if e.scope == "student" else "AI service is at capacity"
+        retry_after = str(max(1, math.ceil(e.retry_after)))
+        raise HTTPException(status_code=429, detail=f"{detail}, please retry", headers={"Retry-After": retry_after})
+
 @api_router.post("/chat", response_model=ChatMessage)
 async def chat_with_ai(chat_request: ChatRequest):
+    await admit_llm_request("chat", chat_request.student_id)
     try:
         # Get student profile for context
-        student = await db.students.find_one({"id": chat_request.student_id})
+        student = await student_profiles.get(chat_request.student_id)
         if not student:
             raise HTTPException(status_code=404, detail="Student not found")
         
-        # Create system message with student context
-        system_message = f"""You are an expert career guidance counselor specializing in helping university students with graduate school applications, scholarships, and career planning.
-
-Student Profile:
-- Name: {student['name']}
-- University: {student['university']}
-- Faculty: {student['faculty']}
-- GPA: {student['gpa']}
-- Credits: {student['completed_credits']}/{student['total_credits']}
-- Achievements: {', '.join(student['achievements'])}
-- Extracurriculars: {', '.join(student['extracurriculars'])}
-- Preferred Countries: {', '.join(student['preferred_countries'])}
-- Financial Situation: {student['financial_situation']}
-- Career Goals: {student['career_goals']}
-
-Provide personalized, actionable advice. Be encouraging but realistic. Focus on:
-1. University and program recommendations
-2. Scholarship opportunities
-3. Application strategies
-4. Profile improvement suggestions
-5. Timeline planning
-
-Keep responses concise but comprehensive."""
-
-        # Initialize AI chat
-        chat = LlmChat(
-            api_key=os.environ['EMERGENT_LLM_KEY'],
-            session_id=f"student_{chat_request.student_id}",
-            system_message=system_message
-        ).with_model("openai", "gpt-4o-mini")
-
-        # Send message to AI
-        user_message = UserMessage(text=chat_request.message)
-        response = await chat.send_message(user_message)
-
-        # Save chat to database
-        chat_message = ChatMessage(
-            student_id=chat_request.student_id,
-            message=chat_request.message,
-            response=response
-        )
-        await db.chat_messages.insert_one(chat_message.dict())
+        # Create system message with student context and recent turns
+        history = await recent_chat_history(chat_request.student_id)
+        system_message = prompt_builder.chat_system_message(student, history)
+
+        async def produce_chat_message() -> ChatMessage:
+            # Send message to AI
+            response = await llm_gateway.complete(
+                "chat", f"student_{chat_request.student_id}", system_message, chat_request.message
+            )
+
+            # Save chat to database
+            chat_message = ChatMessage(
+                student_id=chat_request.student_id,
+                message=chat_request.message,
+                response=response
+            )
+            await chat_writes.add(chat_message.dict())
+
+            return chat_message
 
-        return chat_message
+        # Duplicate submissions of the same message share one reply and row
+        key = cache_key(chat_request.student_id, system_message, chat_request.message)
+        return await llm_flight.do(f"chat:{key}", produce_chat_message)
 
+    except (LlmOverloaded, LlmTimeout) as e:
+        raise llm_error_to_http(e)
     except Exception as e:
         logging.error(f"Chat error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Chat service error: {str(e)}")
 
+def sse_event(data: Dict[str, Any], event: Optional[str] = None) -> str:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(jsonable_encoder(data))}\n\n"
+
+@api_router.post("/chat/stream")
+async def stream_chat_with_ai(chat_request: ChatRequest):
+    """Chat over Server-Sent Events: `token` data events, then `done` or `error`.
+
+    Tokens arrive incrementally only with a provider that streams
+    (LLM_BACKEND=openai or stub). The default Emergent client has no
+    streaming API and delivers the whole reply as one token event once it
+    is complete, so with it this route is no faster to first token than
+    /chat; /diagnostics/llm reports which applies.
+    """
+    await admit_llm_request("chat", chat_request.student_id)
+    student = await student_profiles.get(chat_request.student_id)
+    if not student:
+        raise HTTPException(status_code=404, detail="Student not found")
+
+    history = await recent_chat_history(chat_request.student_id)
+    system_message = prompt_builder.chat_system_message(student, history)
+
+    async def event_stream():
+        chunks = []
+        try:
+            async for token in llm_gateway.stream(
+                "chat", f"student_{chat_request.student_id}", system_message, chat_request.message
+            ):
+                chunks.append(token)
+                yield sse_event({"token": token})
+
+            # Persist the full exchange once the stream completes
+            chat_message = ChatMessage(
+                student_id=chat_request.student_id,
+                message=chat_request.message,
+                response="".join(chunks)
+            )
+            await chat_writes.add(chat_message.dict())
+            yield sse_event(chat_message.dict(), event="done")
+        except Exception as e:
+            logging.error(f"Chat stream error: {str(e)}")
+            yield sse_event({"detail": f"Chat service error: {str(e)}"}, event="error")
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 # Career Recommendations Route
-@api_router.post("/recommendations/{student_id}", response_model=CareerRecommendation)
-async def generate_career_recommendations(student_id: str):
-    try:
-        # Get student profile
-        student = await db.students.find_one({"id": student_id})
-        if not student:
-            raise HTTPException(status_code=404, detail="Student not found")
+async def build_career_recommendation(student_id: str) -> CareerRecommendation:
+    # Get student profile
+    student = await student_profiles.get(student_id)
+    if not student:
+        raise HTTPException(status_code=404, detail="Student not found")
+
+    # Rank the whole catalog rather than the first rows Mongo returns
+    await university_catalog.ensure_fresh(db)
+    scorer = university_catalog.derived("acceptance_scorer", AcceptanceScorer)
+    universities = scorer.rank_student(student, k=10)
+
+    # Get relevant scholarships, only the fields the prompt and fallback use
+    scholarships = await db.scholarships.find(
+        {"countries": {"$in": student['preferred_countries']}},
+        {"_id": 0, "name": 1, "provider": 1, "amount": 1, "countries": 1},
+    ).to_list(10)
+
+    # Precomputed deadlines so the timeline does not rely on the model's guesses
+    deadlines = await upcoming_deadlines(365, student['preferred_countries'])
+
+    # Create AI prompt for recommendations
+    prompt = prompt_builder.recommendation_prompt(student, universities, scholarships, deadlines)
+
+    system_message = "You are an expert career counselor. Provide detailed, realistic recommendations in JSON format."
+
+    # Identical prompt inputs reuse the cached completion
+    key = cache_key(LLM_PROVIDER, LLM_MODEL, university_catalog.version, system_message, prompt)
+
+    async def produce_recommendation() -> CareerRecommendation:
+        ai_response = await recommendation_cache.get(key)
 
-        # Get relevant universities and scholarships
-        universities = await db.universities.find({
-            "country": {"$in": student['preferred_countries']},
-            "min_gpa": {"$lte": student['gpa']}
-        }).to_list(10)
-
-        scholarships = await db.scholarships.find({
-            "countries": {"$in": student['preferred_countries']}
-        }).to_list(10)
-
-        # Create AI prompt for recommendations
-        prompt = f"""Generate comprehensive career recommendations for this student:
-
-Student Profile:
-- GPA: {student['gpa']}
-- Field: {student['faculty']}
-- Progress: {student['completed_credits']}/{student['total_credits']} credits
-- Achievements: {', '.join(student['achievements'])}
-- Extracurriculars: {', '.join(student['extracurriculars'])}
-- Preferred Countries: {', '.join(student['preferred_countries'])}
-- Financial Situation: {student['financial_situation']}
-- Career Goals: {student['career_goals']}
-
-Available Universities: {[uni['name'] + ' (' + uni['country'] + ')' for uni in universities]}
-Available Scholarships: {[sch['name'] for sch in scholarships]}
-
-Please provide:
-1. Top 3 university recommendations with acceptance probability (%)
-2. Top 3 scholarship opportunities with success probability (%)
-3. 5 specific profile improvement suggestions
-4. Application timeline with key deadlines
-
-Format as JSON with keys: universities, scholarships, improvements, timeline, probabilities"""
-
-        # Get AI recommendations
-        chat = LlmChat(
-            api_key=os.environ['EMERGENT_LLM_KEY'],
-            session_id=f"recommendations_{student_id}",
-            system_message="You are an expert career counselor. Provide detailed, realistic recommendations in JSON format."
-        ).with_model("openai", "gpt-4o-mini")
-
-        user_message = UserMessage(text=prompt)
-        ai_response = await chat.send_message(user_message)
+        if ai_response is None:
+            # Get AI recommendations
+            ai_response = await llm_gateway.complete(
+                "recommendations", f"recommendations_{student_id}", system_message, prompt
+            )
+            await recommendation_cache.set(key, ai_response)
 
         try:
             # Parse AI response as JSON
@@ -402,40 +716,391 @@ Format as JSON with keys: universities, scholarships, improvements, timeline, pr
             }
 
         # Calculate acceptance probabilities based on student profile
-        acceptance_probabilities = {}
-        for uni in universities[:5]:
-            base_prob = uni['acceptance_rate'] * 100
-            gpa_bonus = max(0, (student['gpa'] - uni['min_gpa']) * 10)
-            achievement_bonus = len(student['achievements']) * 2
-            final_prob = min(95, base_prob + gpa_bonus + achievement_bonus)
-            acceptance_probabilities[uni['name']] = round(final_prob, 1)
+        acceptance_probabilities = {uni['name']: uni['probability'] for uni in universities[:5]}
 
         # Create and save recommendation
         recommendation = CareerRecommendation(
             student_id=student_id,
             recommendations=recommendations_data,
             acceptance_probabilities=acceptance_probabilities,
-            suggested_improvements=[
-                "Increase GPA through focused study",
-                "Gain research experience in your field",
-                "Develop leadership skills through extracurriculars",
-                "Improve language proficiency",
-                "Build professional network"
-            ]
+            suggested_improvements=DEFAULT_IMPROVEMENTS
         )
 
-        await db.recommendations.insert_one(recommendation.dict())
+        await recommendation_writes.add(recommendation.dict())
         return recommendation
 
+    # Concurrent identical requests share one LLM call and one stored row
+    return await llm_flight.do(f"recommendations:{student_id}:{key}", produce_recommendation)
+
+@api_router.post("/recommendations/{student_id}", response_model=CareerRecommendation)
+async def generate_career_recommendations(student_id: str):
+    await admit_llm_request("recommendations", student_id)
+    try:
+        return await build_career_recommendation(student_id)
+    except (LlmOverloaded, LlmTimeout) as e:
+        raise llm_error_to_http(e)
     except Exception as e:
         logging.error(f"Recommendations error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Recommendations service error: {str(e)}")
 
+# Recommendation jobs: enqueue now, poll for the result
+async def run_recommendation_job(payload: Dict[str, Any]) -> str:
+    try:
+        recommendation = await build_career_recommendation(payload["student_id"])
+    except HTTPException as e:
+        raise PermanentJobError(e.detail)
+    # Pollers read the stored row, so it must be written before success
+    await recommendation_writes.sync()
+    return recommendation.id
+
+recommendation_jobs = JobQueue(
+    db.recommendation_jobs,
+    run_recommendation_job,
+    workers=int(os.environ.get('RECOMMENDATION_JOB_WORKERS', '4')),
+    max_depth=int(os.environ.get('RECOMMENDATION_JOB_MAX_DEPTH', '1000')),
+    max_attempts=int(os.environ.get('RECOMMENDATION_JOB_MAX_ATTEMPTS', '3')),
+    lease=float(os.environ.get('RECOMMENDATION_JOB_LEASE_SECONDS', '60')),
+)
+
+def job_response(job: Dict[str, Any], recommendation: Optional[Dict[str, Any]] = None) -> RecommendationJob:
+    return RecommendationJob(
+        student_id=job["payload"]["student_id"],
+        recommendation=recommendation,
+        **{k: v for k, v in job.items() if k in RecommendationJob.model_fields and k != "recommendation"},
+    )
+
+@api_router.post("/recommendations/{student_id}/jobs", response_model=RecommendationJob, status_code=202)
+async def enqueue_career_recommendations(student_id: str, priority: int = Query(0, ge=-10, le=10)):
+    await admit_llm_request("recommendations", student_id)
+    if not await student_profiles.get(student_id):
+        raise HTTPException(status_code=404, detail="Student not found")
+    try:
+        job = await recommendation_jobs.enqueue({"student_id": student_id}, priority=priority)
+    except QueueFull:
+        raise HTTPException(status_code=503, detail="Recommendation queue is full, please retry", headers={"Retry-After": "10"})
+    return job_response(job)
+
+@api_router.get("/recommendations/jobs/{job_id}", response_model=RecommendationJob)
+async def get_recommendation_job(job_id: str):
+    job = await recommendation_jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    recommendation = None
+    if job["status"] == "succeeded" and job.get("result_id"):
+        recommendation = await db.recommendations.find_one({"id": job["result_id"]}, {"_id": 0})
+    return job_response(job, recommendation)
+
+# Materialized recommendations, refreshed in the background on profile changes
+async def materialize_recommendation(student_id: str):
+    student = await student_profiles.get(student_id)
+    if not student:
+        return
+
+    await university_catalog.ensure_fresh(db)
+    await scholarship_catalog.ensure_fresh(db)
+    universities = university_catalog.derived("acceptance_scorer", AcceptanceScorer).rank_student(student, k=10)
+    scholarships = scholarship_catalog.derived("eligibility_matcher", EligibilityMatcher).match(student)
+
+    # A newer row is what GET /recommendations/{id} serves, so it must not
+    # drop the model's advice: keep the latest LLM-backed content and only
+    # refresh the deterministic parts
+    await recommendation_writes.sync()
+    latest = await db.recommendations.find_one(
+        {"student_id": student_id}, {"_id": 0, "recommendations": 1, "suggested_improvements": 1},
+        sort=[("generated_at", -1)],
+    )
+    if latest and latest["recommendations"].get("source") != "precomputed":
+        recommendations = {**latest["recommendations"], "source": "llm+precomputed"}
+        improvements = latest.get("suggested_improvements") or DEFAULT_IMPROVEMENTS
+    else:
+        recommendations = {
+            "universities": [uni['name'] for uni in universities[:3]],
+            "scholarships": [sch['name'] for sch in scholarships[:3]],
+            "source": "precomputed",
+        }
+        improvements = DEFAULT_IMPROVEMENTS
+    recommendations["eligible_scholarships"] = scholarships
+
+    recommendation = CareerRecommendation(
+        student_id=student_id,
+        recommendations=recommendations,
+        acceptance_probabilities={uni['name']: uni['probability'] for uni in universities[:5]},
+        suggested_improvements=improvements,
+    )
+    await recommendation_writes.add(recommendation.dict())
+
+    if RECOMMENDATION_MATERIALIZE == "full":
+        # The LLM part runs as a low-priority job and lands as a newer row
+        try:
+            await recommendation_jobs.enqueue({"student_id": student_id}, priority=-5)
+        except QueueFull:
+            logging.warning(f"Recommendation queue full; skipped LLM refresh for {student_id}")
+
+recommendation_refresh = RefreshQueue(
+    materialize_recommendation,
+    workers=int(os.environ.get('RECOMMENDATION_REFRESH_WORKERS', '2')),
+)
+
+@api_router.get("/recommendations/{student_id}", response_model=CareerRecommendation)
+async def get_latest_recommendation(student_id: str):
+    recommendation = await db.recommendations.find_one(
+        {"student_id": student_id}, model_projection(CareerRecommendation), sort=[("generated_at", -1)]
+    )
+    if not recommendation:
+        raise HTTPException(status_code=404, detail="No recommendation found")
+    return TrustedJSONResponse(recommendation)
+
+# Similar students, nearest first by profile feature distance
+@api_router.get("/students/{student_id}/similar", response_model=List[SimilarStudent])
+async def get_similar_students(student_id: str, k: int = Query(10, ge=1, le=50)):
+    student = await student_profiles.get(student_id)
+    if not student:
+        raise HTTPException(status_code=404, detail="Student not found")
+    if not similar_students.ready:
+        raise HTTPException(status_code=503, detail="Similarity index is still loading")
+
+    neighbours = similar_students.query(similar_students.encode(student), k=k, exclude=student_id)
+    profiles = {
+        doc["id"]: doc for doc in await db.students.find(
+            {"id": {"$in": [n["id"] for n in neighbours]}},
+            {"_id": 0, "id": 1, "name": 1, "university": 1, "faculty": 1, "gpa": 1, "preferred_countries": 1},
+        ).to_list(None)
+    }
+    return TrustedJSONResponse([
+        {**profiles[n["id"]], "distance": n["distance"]} for n in neighbours if n["id"] in profiles
+    ])
+
+# Acceptance probability routes (no LLM involved)
+@api_router.get("/students/{student_id}/acceptance", response_model=List[AcceptanceScore])
+async def get_acceptance_probabilities(
+    student_id: str,
+    k: int = Query(10, ge=1, le=100),
+    preferred_only: bool = True,
+    eligible_only: bool = True,
+):
+    student = await student_profiles.get(student_id)
+    if not student:
+        raise HTTPException(status_code=404, detail="Student not found")
+
+    await university_catalog.ensure_fresh(db)
+    scorer = university_catalog.derived("acceptance_scorer", AcceptanceScorer)
+    return scorer.rank_student(student, k=k, preferred_only=preferred_only, eligible_only=eligible_only)
+
+@api_router.post("/acceptance/batch", response_model=Dict[str, List[AcceptanceScore]])
+async def get_acceptance_probabilities_batch(batch: AcceptanceBatchRequest):
+    students = await db.students.find(
+        {"id": {"$in": batch.student_ids}},
+        {"_id": 0, "id": 1, "gpa": 1, "achievements": 1, "preferred_countries": 1},
+    ).to_list(None)
+
+    await university_catalog.ensure_fresh(db)
+    scorer = university_catalog.derived("acceptance_scorer", AcceptanceScorer)
+    return scorer.rank_students(
+        students, k=batch.k, preferred_only=batch.preferred_only, eligible_only=batch.eligible_only
+    )
+
+# Scholarship eligibility (rules compiled once per catalog load, no LLM involved)
+@api_router.get("/scholarships/eligible/{student_id}", response_model=List[ScholarshipMatch])
+async def get_eligible_scholarships(student_id: str, preferred_only: bool = True):
+    student = await student_profiles.get(student_id)
+    if not student:
+        raise HTTPException(status_code=404, detail="Student not found")
+
+    await scholarship_catalog.ensure_fresh(db)
+    matcher = scholarship_catalog.derived("eligibility_matcher", EligibilityMatcher)
+    return matcher.match(student, preferred_only=preferred_only)
+
+# Upcoming deadlines (parsed once per catalog load)
+async def upcoming_deadlines(
+    days: int, countries: Optional[List[str]], kind: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    today = datetime.now(timezone.utc).date()
+    deadlines = []
+    for catalog in (university_catalog, scholarship_catalog):
+        if kind and catalog.collection != kind:
+            continue
+        await catalog.ensure_fresh(db)
+        index = catalog.derived("deadline_index", lambda docs: DeadlineIndex(docs, catalog.collection))
+        deadlines.extend(index.upcoming(days, countries, today=today))
+    deadlines.sort(key=lambda d: (d["due_date"], d["name"]))
+    return deadlines
+
+@api_router.get("/students/{student_id}/deadlines", response_model=List[UpcomingDeadline])
+async def get_upcoming_deadlines(
+    student_id: str,
+    days: int = Query(90, ge=0, le=365),
+    kind: Optional[Literal["universities", "scholarships"]] = None,
+    preferred_only: bool = True,
+):
+    student = await student_profiles.get(student_id)
+    if not student:
+        raise HTTPException(status_code=404, detail="Student not found")
+
+    countries = student['preferred_countries'] if preferred_only else None
+    return TrustedJSONResponse(await upcoming_deadlines(days, countries, kind))
+
 # Get chat history
 @api_router.get("/chat/{student_id}", response_model=List[ChatMessage])
 async def get_chat_history(student_id: str):
-    messages = await db.chat_messages.find({"student_id": student_id}).sort("timestamp", -1).to_list(50)
-    return [ChatMessage(**msg) for msg in messages]
+    messages = await db.chat_messages.find(
+        {"student_id": student_id}, model_projection(ChatMessage)
+    ).sort("timestamp", -1).to_list(50)
+    return TrustedJSONResponse(messages)
+
+CHAT_HISTORY_FIELDS = set(ChatMessage.model_fields)
+
+@api_router.get("/chat/{student_id}/history", response_model=ChatHistoryPage)
+async def get_chat_history_page(
+    student_id: str,
+    limit: int = Query(50, ge=1, le=500),
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    fields: Optional[str] = None,
+):
+    if before and after:
+        raise HTTPException(status_code=400, detail="Use either before or after, not both")
+
+    # id and timestamp are always returned because cursors are built from them
+    projection = model_projection(ChatMessage)
+    if fields:
+        requested = {f.strip() for f in fields.split(",") if f.strip()}
+        unknown = requested - CHAT_HISTORY_FIELDS
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+        projection = {"_id": 0, **{f: 1 for f in requested | {"id", "timestamp"}}}
+
+    query = {"student_id": student_id}
+    if after:
+        # Walk forward in time, then flip so pages are always newest first
+        query.update(keyset_filter("timestamp", after, "$gt"))
+        sort = [("timestamp", 1), ("id", 1)]
+    else:
+        if before:
+            query.update(keyset_filter("timestamp", before, "$lt"))
+        sort = [("timestamp", -1), ("id", -1)]
+
+    messages = await db.chat_messages.find(query, projection).sort(sort).limit(limit + 1).to_list(limit + 1)
+    has_more = len(messages) > limit
+    messages = messages[:limit]
+    if after:
+        messages.reverse()
+
+    page = {"messages": messages, "next_cursor": None, "prev_cursor": None}
+    if messages:
+        newest, oldest = messages[0], messages[-1]
+        # next_cursor pages to older messages; prev_cursor polls for newer ones
+        if has_more or after:
+            page["next_cursor"] = encode_cursor(oldest["timestamp"], oldest["id"])
+        page["prev_cursor"] = encode_cursor(newest["timestamp"], newest["id"])
+    return TrustedJSONResponse(page)
+
+# Streaming NDJSON exports for analytics; pass X-Export-Watermark as the next `since`
+@api_router.get("/export/{collection}")
+async def export_collection(
+    collection: Literal["students", "chat_messages", "recommendations"],
+    since: Optional[datetime] = None,
+    batch_size: int = Query(1000, ge=1, le=10000),
+    gzip: bool = False,
+):
+    until = export_upper_bound()
+    chunks = export_ndjson(db, collection, since, until, batch_size)
+    headers = {"X-Export-Watermark": until.isoformat()}
+    if gzip:
+        headers["Content-Disposition"] = f'attachment; filename="{collection}.ndjson.gz"'
+        return StreamingResponse(gzip_stream(chunks), media_type="application/gzip", headers=headers)
+    return StreamingResponse(chunks, media_type="application/x-ndjson", headers=headers)
+
+# Cohort analytics
+async def refresh_analytics(force: bool = False) -> bool:
+    await university_catalog.ensure_fresh(db)
+    return await analytics_rollups.refresh(
+        lambda: university_catalog.derived("acceptance_scorer", AcceptanceScorer),
+        catalog_version=university_catalog.version,
+        force=force,
+    )
+
+@api_router.get("/analytics")
+async def get_analytics():
+    return TrustedJSONResponse({"refreshed_at": analytics_rollups.refreshed_at, **analytics_rollups.snapshot})
+
+@api_router.get("/analytics/{rollup}")
+async def get_analytics_rollup(rollup: str, limit: int = Query(100, ge=1, le=1000)):
+    if rollup not in ROLLUPS:
+        raise HTTPException(status_code=404, detail="Unknown rollup")
+    return TrustedJSONResponse(analytics_rollups.snapshot[rollup][:limit])
+
+@api_router.post("/analytics/refresh")
+async def refresh_analytics_rollups(force: bool = False):
+    refreshed = await refresh_analytics(force)
+    return {"refreshed": refreshed, **analytics_rollups.stats()}
+
+# Index diagnostics
+@api_router.get("/diagnostics/indexes")
+async def get_index_diagnostics():
+    return {
+        "query_shapes": await explain_query_shapes(db),
+        "index_usage": await index_usage(db),
+    }
+
+@api_router.get("/diagnostics/cache")
+async def get_cache_diagnostics():
+    return {
+        "recommendations": recommendation_cache.stats(),
+        "profiles": student_profiles.stats(),
+        "prompt_contexts": prompt_builder.stats(),
+        "similar_students": similar_students.stats(),
+    }
+
+@api_router.get("/diagnostics/writes")
+async def get_write_diagnostics():
+    return {"chat_messages": chat_writes.stats(), "recommendations": recommendation_writes.stats()}
+
+@api_router.get("/diagnostics/llm")
+async def get_llm_diagnostics():
+    return {"gateway": llm_gateway.stats(), "single_flight": llm_flight.stats(), "admission": llm_admission.stats()}
+
+@api_router.get("/diagnostics/jobs")
+async def get_job_diagnostics():
+    return {
+        "recommendations": recommendation_jobs.stats(),
+        "refresh": recommendation_refresh.stats(),
+        "analytics": analytics_rollups.stats(),
+    }
+
+# Prometheus metrics; component counters are read at scrape time
+REGISTRY.collector("cache_hit_ratio", "gauge", "Cache hit ratio since start.", lambda: [
+    ({"cache": "recommendations"}, recommendation_cache.stats()["hit_ratio"]),
+    ({"cache": "profiles"}, student_profiles.stats()["hit_ratio"]),
+    ({"cache": "prompt_contexts"}, prompt_builder.stats()["hit_ratio"]),
+])
+REGISTRY.collector("cache_entries", "gauge", "Entries held in memory.", lambda: [
+    ({"cache": "recommendations"}, len(recommendation_cache.memory)),
+    ({"cache": "profiles"}, len(student_profiles.cache)),
+])
+REGISTRY.collector("llm_gateway_requests", "gauge", "LLM calls holding or waiting for a slot.", lambda: [
+    ({"state": "in_flight"}, llm_gateway.in_flight),
+    ({"state": "queued"}, llm_gateway.queued),
+])
+REGISTRY.collector("llm_single_flight_coalesced_total", "counter", "LLM requests served by an identical in-flight call.", lambda: [
+    ({}, llm_flight.coalesced),
+])
+REGISTRY.collector("write_behind_pending", "gauge", "Documents buffered for a batched insert.", lambda: [
+    ({"collection": "chat_messages"}, chat_writes.stats()["pending"]),
+    ({"collection": "recommendations"}, recommendation_writes.stats()["pending"]),
+])
+REGISTRY.collector("recommendation_jobs", "gauge", "Recommendation jobs by state.", lambda: [
+    ({"state": "queued"}, recommendation_jobs.stats()["depth"]),
+    ({"state": "running"}, recommendation_jobs.running),
+])
+REGISTRY.collector("catalog_documents", "gauge", "Documents loaded in the in-memory catalogs.", lambda: [
+    ({"catalog": "universities"}, len(university_catalog.documents)),
+    ({"catalog": "scholarships"}, len(scholarship_catalog.documents)),
+])
+
+@api_router.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    return Response(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
 
 # Include the router in the main app
 app.include_router(api_router)
@@ -446,8 +1111,12 @@ app.add_middleware(
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Total-Count", "X-Export-Watermark"],
 )
 
+# Added last so it wraps everything, including CORS preflights
+app.add_middleware(MetricsMiddleware)
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -455,6 +1124,81 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def create_db_indexes():
+    with timed("startup_ensure_indexes"):
+        await ensure_indexes(db)
+
+@app.on_event("startup")
+async def load_catalog_data():
+    # Skipped when the catalog sources are unchanged since the last load
+    with timed("startup_load_catalog"):
+        result = await load_catalog(db)
+        if result.get("loaded"):
+            university_catalog.invalidate()
+            scholarship_catalog.invalidate()
+        await refresh_catalog_search(wait=True)
+
+@app.on_event("startup")
+async def start_write_buffers():
+    chat_writes.start()
+    recommendation_writes.start()
+
+@app.on_event("startup")
+async def start_job_workers():
+    recommendation_jobs.start()
+    await recommendation_jobs.recover()
+
+@app.on_event("startup")
+async def start_recommendation_refresh():
+    if RECOMMENDATION_MATERIALIZE != "off":
+        recommendation_refresh.start()
+
+@app.on_event("startup")
+async def start_analytics_refresh():
+    if analytics_rollups.interval > 0:
+        analytics_rollups.start(refresh_analytics)
+
+@app.on_event("startup")
+async def load_similarity_index():
+    # Loads in the background; /similar answers 503 until the first sync ends
+    similar_students.start(db.students)
+
+@app.on_event("startup")
+async def watch_profile_changes():
+    if os.environ.get('PROFILE_CACHE_CHANGE_STREAM'):
+        student_profiles.start_watching()
+
+@app.on_event("shutdown")
+async def stop_profile_watcher():
+    await student_profiles.stop_watching()
+
+@app.on_event("shutdown")
+async def stop_similarity_sync():
+    await similar_students.stop()
+
+@app.on_event("shutdown")
+async def stop_analytics_refresh():
+    await analytics_rollups.stop()
+
+@app.on_event("shutdown")
+async def stop_recommendation_refresh():
+    await recommendation_refresh.stop()
+
+@app.on_event("shutdown")
+async def stop_job_workers():
+    await recommendation_jobs.stop()
+
+@app.on_event("shutdown")
+async def drain_write_buffers():
+    # After the job workers, which may still add recommendations
+    await chat_writes.stop()
+    await recommendation_writes.stop()
+
+@app.on_event("shutdown")
+async def close_llm_gateway():
+    await llm_gateway.close()
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
     client.close()
\ No newline at end of file
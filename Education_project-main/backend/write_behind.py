@@ -0,0 +1,203 @@
+"""Write-behind buffers for append-only records.
+
+Chat messages and recommendations are written once and never updated, so
+routes hand them to a buffer instead of awaiting `insert_one`. A background
+task flushes the buffer with one unordered `insert_many` once it holds
+`max_batch` documents or `flush_interval` seconds after the last flush,
+and `stop()` lets the flush in progress finish, then drains whatever is
+left on shutdown.
+
+Durability is chosen per buffer (WRITE_BEHIND_MODE):
+
+- "async": `add` returns immediately; a crash can lose the last interval;
+- "ack": `add` returns once the batch holding the document is written, so
+  concurrent requests share one round-trip (group commit).
+
+Failed batches are retried up to `max_attempts` times. Documents carry
+unique ids, so duplicate-key errors from a retried batch count as written.
+Readers that need their own write, such as job polling, call `sync()`.
+"""
+import os
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo.errors import BulkWriteError, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+DUPLICATE_KEY = 11000
+
+
+class WriteBehindBuffer:
+    def __init__(
+        self,
+        collection,
+        max_batch: int = 500,
+        flush_interval: float = 0.05,
+        ack: bool = False,
+        max_pending: int = 10000,
+        max_attempts: int = 3,
+    ):
+        self.collection = collection
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.ack = ack
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        self._pending: List[Tuple[Dict[str, Any], int]] = []
+        self._batch_done: Optional[asyncio.Future] = None
+        self._flushing: Optional[asyncio.Future] = None
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self.written = 0
+        self.batches = 0
+        self.retried = 0
+        self.dropped = 0
+
+    def start(self):
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        # Never cancel mid-insert: _run finishes its flush and drains
+        self._stopping = True
+        self._wake.set()
+        if self._task is not None:
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        # Never started (or _run died): drain here, retrying failed batches
+        # until they are written or dropped
+        while self._pending:
+            await self._flush()
+
+    def _current_batch(self) -> asyncio.Future:
+        if self._batch_done is None:
+            self._batch_done = asyncio.get_running_loop().create_future()
+        return self._batch_done
+
+    async def add(self, doc: Dict[str, Any], wait: Optional[bool] = None):
+        if len(self._pending) >= self.max_pending:
+            # Backpressure: wait for the backlog rather than grow without bound
+            await self.sync()
+        self._pending.append((doc, 0))
+        done = self._current_batch()
+        if len(self._pending) >= self.max_batch or self._task is None:
+            self._wake.set()
+        if self._task is None:
+            # Not started (e.g. scripts): behave like a direct write
+            await self._flush()
+        if self.ack if wait is None else wait:
+            await asyncio.shield(done)
+
+    async def sync(self):
+        # Wait until everything added so far is written
+        waits = [f for f in (self._flushing, self._batch_done) if f is not None]
+        if not waits:
+            return
+        self._wake.set()
+        if self._task is None:
+            await self._flush()
+        await asyncio.gather(*(asyncio.shield(f) for f in waits), return_exceptions=True)
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self._flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Write-behind flush to {self.collection.name} failed: {str(e)}")
+        while self._pending:
+            await self._flush()
+
+    async def _flush(self):
+        if not self._pending:
+            return
+        # The whole backlog goes in one call; the driver splits it into
+        # wire-sized batches, and every waiter resolves together
+        batch, done = self._pending, self._current_batch()
+        self._pending, self._batch_done = [], None
+        self._flushing = done
+        error: Optional[Exception] = None
+        try:
+            error = await self._insert(batch)
+        except asyncio.CancelledError:
+            # Interrupted mid-insert: a later flush writes the batch again,
+            # and ids turn whatever already landed into duplicate keys
+            error = RuntimeError("write-behind flush was cancelled; batch requeued")
+            self._pending = batch + self._pending
+            self._current_batch()
+            raise
+        except Exception as e:
+            # e.g. bson.errors.InvalidDocument: not a PyMongoError
+            self._requeue(batch, e)
+            error = e
+        finally:
+            self._flushing = None
+            if error is None:
+                done.set_result(len(batch))
+            else:
+                done.set_exception(error)
+                # Nobody may be waiting in async mode; mark it retrieved
+                done.exception()
+
+    async def _insert(self, batch: List[Tuple[Dict[str, Any], int]]) -> Optional[Exception]:
+        docs = [doc for doc, _ in batch]
+        try:
+            await self.collection.insert_many(docs, ordered=False)
+        except BulkWriteError as e:
+            failed = {err["index"] for err in e.details.get("writeErrors", []) if err.get("code") != DUPLICATE_KEY}
+            if not failed:
+                self.written += len(batch)
+                self.batches += 1
+                return None
+            self._requeue([batch[i] for i in sorted(failed)], e)
+            self.written += len(batch) - len(failed)
+            return e
+        except PyMongoError as e:
+            self._requeue(batch, e)
+            return e
+        self.written += len(batch)
+        self.batches += 1
+        return None
+
+    def _requeue(self, items: List[Tuple[Dict[str, Any], int]], error: Exception):
+        retry = [(doc, attempts + 1) for doc, attempts in items if attempts + 1 < self.max_attempts]
+        self.retried += len(retry)
+        self.dropped += len(items) - len(retry)
+        logger.error(
+            f"Write-behind flush to {self.collection.name} failed ({str(error)}); "
+            f"retrying {len(retry)}, dropping {len(items) - len(retry)}"
+        )
+        self._pending = retry + self._pending
+        if self._pending:
+            self._current_batch()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "mode": "ack" if self.ack else "async",
+            "pending": len(self._pending),
+            "max_batch": self.max_batch,
+            "flush_interval_seconds": self.flush_interval,
+            "written": self.written,
+            "batches": self.batches,
+            "retried": self.retried,
+            "dropped": self.dropped,
+        }
+
+
+def create_write_buffer_from_env(collection) -> WriteBehindBuffer:
+    return WriteBehindBuffer(
+        collection,
+        max_batch=int(os.environ.get("WRITE_BEHIND_BATCH_SIZE", "500")),
+        flush_interval=float(os.environ.get("WRITE_BEHIND_FLUSH_SECONDS", "0.05")),
+        ack=os.environ.get("WRITE_BEHIND_MODE", "async") == "ack",
+        max_pending=int(os.environ.get("WRITE_BEHIND_MAX_PENDING", "10000")),
+    )
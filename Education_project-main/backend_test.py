@@ -1,6 +1,9 @@
 import requests
 import sys
 import json
+import time
+import asyncio
+from pathlib import Path
 from datetime import datetime
 
 class StudyPathAPITester:
@@ -24,9 +27,11 @@ class StudyPathAPITester:
             if method == 'GET':
                 response = requests.get(url, headers=headers, params=params)
             elif method == 'POST':
-                response = requests.post(url, json=data, headers=headers)
+                response = requests.post(url, json=data, headers=headers, params=params)
             elif method == 'PUT':
                 response = requests.put(url, json=data, headers=headers)
+            elif method == 'PATCH':
+                response = requests.patch(url, json=data, headers=headers)
 
             success = response.status_code == expected_status
             if success:
@@ -89,6 +94,45 @@ class StudyPathAPITester:
             return True
         return False
 
+    def test_bulk_student_import(self):
+        """Test bulk creating and patching student profiles"""
+        students = [
+            {
+                "name": f"Bulk Student {i}",
+                "email": f"bulk{i}@example.com",
+                "university": "TU Munich",
+                "faculty": "Engineering",
+                "gpa": 3.2 + i * 0.1,
+                "total_credits": 120,
+                "completed_credits": 60,
+                "preferred_countries": ["Germany"],
+                "financial_situation": "good",
+                "career_goals": "Become a mechanical engineer"
+            }
+            for i in range(3)
+        ]
+        students.append({"name": "Missing fields"})
+        
+        success, response = self.run_test(
+            "Bulk Create Students",
+            "POST",
+            "students/bulk",
+            200,
+            data=students
+        )
+        if not success or response.get('succeeded') != 3:
+            return False
+        
+        created = [r['id'] for r in response['results'] if r['status'] == 'created']
+        success, response = self.run_test(
+            "Bulk Patch Students",
+            "PATCH",
+            "students/bulk",
+            200,
+            data=[{"id": student_id, "completed_credits": 90} for student_id in created]
+        )
+        return success and response.get('succeeded') == len(created)
+
     def test_get_student_profile(self):
         """Test retrieving a student profile"""
         if not self.student_id:
@@ -121,6 +165,86 @@ class StudyPathAPITester:
             data=update_data
         )[0]
 
+    def test_acceptance_probabilities(self):
+        """Test ranked acceptance probabilities over the catalog"""
+        if not self.student_id:
+            print("❌ Skipping - No student ID available")
+            return False
+        
+        success, response = self.run_test(
+            "Acceptance Probabilities",
+            "GET",
+            f"students/{self.student_id}/acceptance",
+            200,
+            params={"k": 5}
+        )
+        
+        if success and isinstance(response, list):
+            for score in response:
+                print(f"   {score['name']} ({score['country']}): {score['probability']}%")
+            return True
+        return success
+
+    def test_eligible_scholarships(self):
+        """Test rule-based scholarship eligibility"""
+        if not self.student_id:
+            print("❌ Skipping - No student ID available")
+            return False
+        
+        success, response = self.run_test(
+            "Eligible Scholarships",
+            "GET",
+            f"scholarships/eligible/{self.student_id}",
+            200,
+            params={"preferred_only": "false"}
+        )
+        
+        if success and isinstance(response, list):
+            for match in response:
+                print(f"   {match['name']}: met {match['met_requirements']}, unverified {match['unverified_requirements']}")
+            return True
+        return success
+
+    def test_upcoming_deadlines(self):
+        """Test upcoming deadlines for the student's preferred countries"""
+        if not self.student_id:
+            print("❌ Skipping - No student ID available")
+            return False
+        
+        success, response = self.run_test(
+            "Upcoming Deadlines",
+            "GET",
+            f"students/{self.student_id}/deadlines",
+            200,
+            params={"days": 365}
+        )
+        
+        if success and isinstance(response, list):
+            for deadline in response:
+                print(f"   {deadline['name']}: {deadline['due_date']} ({deadline['days_left']} days)")
+            return True
+        return success
+
+    def test_similar_students(self):
+        """Test nearest-neighbour lookup of similar students"""
+        if not self.student_id:
+            print("❌ Skipping - No student ID available")
+            return False
+        
+        success, response = self.run_test(
+            "Similar Students",
+            "GET",
+            f"students/{self.student_id}/similar",
+            200,
+            params={"k": 5}
+        )
+        
+        if success and isinstance(response, list):
+            for peer in response:
+                print(f"   {peer['name']} ({peer['faculty']}, GPA {peer['gpa']}): distance {peer['distance']}")
+            return True
+        return success
+
     def test_get_universities(self):
         """Test retrieving universities"""
         success, response = self.run_test(
@@ -162,6 +286,30 @@ class StudyPathAPITester:
         
         return success1 and success2
 
+    def test_get_universities_paginated(self):
+        """Test paging through universities with skip/limit"""
+        success1, page1 = self.run_test(
+            "Get Universities (Page 1)",
+            "GET",
+            "universities",
+            200,
+            params={"skip": 0, "limit": 2}
+        )
+        success2, page2 = self.run_test(
+            "Get Universities (Page 2)",
+            "GET",
+            "universities",
+            200,
+            params={"skip": 2, "limit": 2}
+        )
+        
+        if success1 and success2:
+            ids1 = {uni.get('id') for uni in page1}
+            ids2 = {uni.get('id') for uni in page2}
+            print(f"   Page sizes: {len(page1)}, {len(page2)}; overlap: {len(ids1 & ids2)}")
+            return len(page1) <= 2 and not (ids1 & ids2)
+        return False
+
     def test_get_scholarships(self):
         """Test retrieving scholarships"""
         success, response = self.run_test(
@@ -203,6 +351,29 @@ class StudyPathAPITester:
         
         return success1 and success2
 
+    def test_catalog_search(self):
+        """Test ranked search and typeahead over both catalogs"""
+        success1, results = self.run_test(
+            "Catalog Search",
+            "GET",
+            "search",
+            200,
+            params={"q": "engineering scholarship"}
+        )
+        success2, suggestions = self.run_test(
+            "Catalog Typeahead",
+            "GET",
+            "search/suggest",
+            200,
+            params={"q": "oxf"}
+        )
+        
+        if success1 and success2:
+            print(f"   Top results: {[r['name'] for r in results[:3]]}")
+            print(f"   Suggestions: {[s['name'] for s in suggestions]}")
+            return True
+        return False
+
     def test_ai_chat(self):
         """Test AI chat functionality"""
         if not self.student_id:
@@ -229,6 +400,55 @@ class StudyPathAPITester:
             return True
         return success
 
+    def test_ai_chat_stream(self):
+        """Test streaming AI chat over Server-Sent Events"""
+        if not self.student_id:
+            print("❌ Skipping - No student ID available")
+            return False
+        
+        url = f"{self.api_url}/chat/stream"
+        chat_data = {
+            "student_id": self.student_id,
+            "message": "Which scholarships fit my profile?"
+        }
+        
+        self.tests_run += 1
+        print("\n🔍 Testing AI Chat Stream...")
+        print(f"   URL: {url}")
+        
+        try:
+            start = datetime.now()
+            first_token_at = None
+            tokens = 0
+            done = False
+            event = None
+            with requests.post(url, json=chat_data, stream=True) as response:
+                if response.status_code != 200:
+                    print(f"❌ Failed - Expected 200, got {response.status_code}")
+                    return False
+                for line in response.iter_lines(decode_unicode=True):
+                    if line.startswith("event: "):
+                        event = line[len("event: "):]
+                    elif line.startswith("data: "):
+                        if event == "done":
+                            done = True
+                        elif event is None:
+                            tokens += 1
+                            if first_token_at is None:
+                                first_token_at = datetime.now()
+                        event = None
+            
+            if done and tokens > 0:
+                self.tests_passed += 1
+                print(f"✅ Passed - {tokens} chunks, first chunk after {(first_token_at - start).total_seconds():.2f}s")
+                return True
+            print("❌ Failed - Stream ended without tokens or done event")
+            return False
+        
+        except Exception as e:
+            print(f"❌ Failed - Error: {str(e)}")
+            return False
+
     def test_get_chat_history(self):
         """Test retrieving chat history"""
         if not self.student_id:
@@ -267,6 +487,122 @@ class StudyPathAPITester:
             return True
         return success
 
+    def test_metrics(self):
+        """Test the Prometheus metrics endpoint"""
+        success, _ = self.run_test(
+            "Metrics",
+            "GET",
+            "metrics",
+            200
+        )
+        
+        if success:
+            text = requests.get(f"{self.api_url}/metrics").text
+            routes = {line.split('route="')[1].split('"')[0] for line in text.splitlines() if 'route="' in line}
+            print(f"   Routes with latency histograms: {len(routes)}")
+        return success
+
+    def test_export_students(self):
+        """Test the streaming NDJSON export"""
+        url = f"{self.api_url}/export/students"
+        self.tests_run += 1
+        print("\n🔍 Testing Export Students...")
+        print(f"   URL: {url}")
+        response = requests.get(url, params={"batch_size": 100}, stream=True)
+        if response.status_code != 200:
+            print(f"❌ Failed - Expected 200, got {response.status_code}")
+            return False
+        rows = sum(1 for line in response.iter_lines() if line)
+        self.tests_passed += 1
+        print(f"✅ Passed - {rows} rows, watermark {response.headers.get('X-Export-Watermark')}")
+        return True
+
+    def test_analytics(self):
+        """Test cohort analytics served from the rollups"""
+        success, response = self.run_test(
+            "Refresh Analytics",
+            "POST",
+            "analytics/refresh",
+            200,
+            params={"force": "true"}
+        )
+        if not success:
+            return False
+
+        success, response = self.run_test(
+            "Cohort Analytics",
+            "GET",
+            "analytics",
+            200
+        )
+        if success:
+            for faculty in response.get('gpa_by_faculty', [])[:3]:
+                print(f"   {faculty['key']}: {faculty['students']} students, avg GPA {faculty['avg_gpa']:.2f}")
+        return success
+
+    def test_index_diagnostics(self):
+        """Test index diagnostics for route query shapes"""
+        success, response = self.run_test(
+            "Index Diagnostics",
+            "GET",
+            "diagnostics/indexes",
+            200
+        )
+        
+        if success and 'query_shapes' in response:
+            for shape in response['query_shapes']:
+                print(f"   {shape['route']}: uses_index={shape.get('uses_index')}")
+            return True
+        return success
+
+    def test_latest_recommendation(self):
+        """Test reading the latest stored recommendation"""
+        if not self.student_id:
+            print("❌ Skipping - No student ID available")
+            return False
+        
+        success, response = self.run_test(
+            "Latest Recommendation",
+            "GET",
+            f"recommendations/{self.student_id}",
+            200
+        )
+        
+        if success and 'acceptance_probabilities' in response:
+            source = response['recommendations'].get('source', 'llm')
+            print(f"   Source: {source}, generated at {response['generated_at']}")
+            return True
+        return success
+
+    def test_recommendation_job(self):
+        """Test enqueueing a recommendation job and polling its status"""
+        if not self.student_id:
+            print("❌ Skipping - No student ID available")
+            return False
+        
+        success, job = self.run_test(
+            "Enqueue Recommendation Job",
+            "POST",
+            f"recommendations/{self.student_id}/jobs",
+            202
+        )
+        if not success or 'id' not in job:
+            return False
+        
+        for _ in range(30):
+            success, job = self.run_test(
+                "Poll Recommendation Job",
+                "GET",
+                f"recommendations/jobs/{job['id']}",
+                200
+            )
+            if not success or job.get('status') in ('succeeded', 'failed'):
+                break
+            time.sleep(2)
+        
+        print(f"   Job status: {job.get('status')}")
+        return job.get('status') == 'succeeded'
+
     def run_all_tests(self):
         """Run all API tests"""
         print("🚀 Starting StudyPath API Tests")
@@ -279,19 +615,36 @@ class StudyPathAPITester:
         if self.test_create_student_profile():
             self.test_get_student_profile()
             self.test_update_student_profile()
+            self.test_acceptance_probabilities()
+            self.test_eligible_scholarships()
+            self.test_upcoming_deadlines()
+        
+        self.test_bulk_student_import()
+        self.test_similar_students()
         
         # Universities and scholarships tests
         self.test_get_universities()
         self.test_get_universities_with_filters()
+        self.test_get_universities_paginated()
         self.test_get_scholarships()
         self.test_get_scholarships_with_filters()
+        self.test_catalog_search()
         
         # AI functionality tests (these take longer)
         if self.student_id:
             print("\n🤖 Testing AI Features (may take time)...")
             self.test_ai_chat()
+            self.test_ai_chat_stream()
             self.test_get_chat_history()
             self.test_generate_recommendations()
+            self.test_recommendation_job()
+            self.test_latest_recommendation()
+        
+        # Diagnostics tests
+        self.test_index_diagnostics()
+        self.test_export_students()
+        self.test_analytics()
+        self.test_metrics()
         
         # Print final results
         print("\n" + "=" * 50)
@@ -304,9 +657,667 @@ class StudyPathAPITester:
             print(f"⚠️  {self.tests_run - self.tests_passed} tests failed")
             return 1
 
+class ComponentTester:
+    """In-process checks of backend building blocks; no server needed"""
+
+    def __init__(self):
+        sys.path.insert(0, str(Path(__file__).parent / "backend"))
+        self.tests_run = 0
+        self.tests_passed = 0
+
+    def check(self, name, test):
+        """Run one check; `test` raises AssertionError on failure and may be async"""
+        self.tests_run += 1
+        print(f"\n🔍 Testing {name}...")
+        try:
+            result = test()
+            if asyncio.iscoroutine(result):
+                asyncio.run(result)
+        except Exception as e:
+            print(f"❌ Failed - {type(e).__name__}: {str(e)}")
+            return False
+        self.tests_passed += 1
+        print("✅ Passed")
+        return True
+
+    def test_ttl_cache(self):
+        from llm_cache import TTLCache
+
+        cache = TTLCache(maxsize=2, ttl=0.05)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        assert cache.get("a") == 1  # "a" is now most recently used
+        cache.set("c", 3)
+        assert cache.get("b") is None, "least recently used entry should be evicted"
+        assert cache.get("a") == 1 and cache.get("c") == 3
+        time.sleep(0.06)
+        assert cache.get("a") is None, "entry should expire after the TTL"
+        assert len(cache) == 1
+
+    async def test_completion_cache(self):
+        from llm_cache import CompletionCache, cache_key
+
+        cache = CompletionCache(maxsize=10, ttl=60)
+        key = cache_key("model", "system", "prompt", 1)
+        assert key == cache_key("model", "system", "prompt", 1)
+        assert key != cache_key("model", "system", "prompt", 2), "catalog version must change the key"
+        assert await cache.get(key) is None
+        await cache.set(key, "completion")
+        assert await cache.get(key) == "completion"
+        stats = cache.stats()
+        assert stats["hits"] == 1 and stats["misses"] == 1, stats
+
+    async def test_single_flight(self):
+        from singleflight import SingleFlight
+
+        flight = SingleFlight()
+        calls = 0
+
+        async def slow():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.02)
+            return "result"
+
+        results = await asyncio.gather(*(flight.do("key", slow) for _ in range(5)))
+        assert results == ["result"] * 5 and calls == 1, (results, calls)
+        assert flight.stats() == {"issued": 1, "coalesced": 4, "in_flight": 0}, flight.stats()
+
+        async def failing():
+            await asyncio.sleep(0.01)
+            raise ValueError("boom")
+
+        errors = await asyncio.gather(*(flight.do("bad", failing) for _ in range(3)), return_exceptions=True)
+        assert all(isinstance(e, ValueError) for e in errors), errors
+        # A finished key is forgotten, so the next call runs again
+        assert await flight.do("key", slow) == "result" and calls == 2
+
+    async def test_llm_gateway_limits(self):
+        from llm_gateway import LlmGateway, LlmOverloaded, LlmTimeout, StubProvider
+
+        # Route limit of one with no wait queue: the second call is refused
+        gateway = LlmGateway(StubProvider(latency=0.05), route_concurrency={"chat": 1}, max_queue=0)
+        results = await asyncio.gather(
+            gateway.complete("chat", "s1", "system", "hi"),
+            gateway.complete("chat", "s2", "system", "hi"),
+            return_exceptions=True,
+        )
+        assert isinstance(results[1], LlmOverloaded), results
+        # Other routes have their own limit
+        assert await gateway.complete("recommendations", "s3", "system", "hi")
+
+        # A call that outlives its deadline times out and frees its slots
+        gateway = LlmGateway(StubProvider(latency=0.2), max_concurrency=2)
+        try:
+            await gateway.complete("chat", "s1", "system", "hi", timeout=0.05)
+            raise AssertionError("expected LlmTimeout")
+        except LlmTimeout:
+            pass
+        assert gateway._global._value == 2 and gateway.in_flight == 0
+
+    async def test_openai_streaming(self):
+        import httpx
+        from llm_gateway import LlmGateway, OpenAICompatibleProvider
+
+        release = asyncio.Event()
+
+        def event(token):
+            return f'data: {json.dumps({"choices": [{"delta": {"content": token}}]})}\n\n'.encode()
+
+        async def body():
+            yield event("Hello")
+            # The rest of the reply is held back until the first token is seen
+            await release.wait()
+            yield event(", world")
+            yield b"data: [DONE]\n\n"
+
+        def handler(request):
+            assert json.loads(request.content)["stream"] is True
+            return httpx.Response(200, content=body(), headers={"content-type": "text/event-stream"})
+
+        provider = OpenAICompatibleProvider("key", "model", transport=httpx.MockTransport(handler))
+        gateway = LlmGateway(provider)
+        tokens = []
+        async for token in gateway.stream("chat", "session", "system", "hi"):
+            tokens.append(token)
+            release.set()
+        assert tokens == ["Hello", ", world"], tokens
+        assert gateway.stats()["streaming"] is True
+        await gateway.close()
+
+    async def test_llm_gateway_hedging(self):
+        from llm_gateway import LlmGateway, StubProvider
+
+        class SlowFirstProvider(StubProvider):
+            def __init__(self):
+                super().__init__(latency=0.01)
+                self.calls = 0
+
+            async def complete(self, session_id, system_message, text):
+                self.calls += 1
+                await asyncio.sleep(1.0 if self.calls == 1 else 0.01)
+                return f"reply {self.calls}"
+
+        def primed(provider, **limits):
+            gateway = LlmGateway(provider, hedge=True, hedge_min_samples=5, **limits)
+            gateway._latencies.extend([0.01] * 5)
+            return gateway
+
+        # The hedge fires after the p95 delay and wins
+        gateway = primed(SlowFirstProvider())
+        assert await gateway.complete("chat", "s", "system", "hi") == "reply 2"
+        assert gateway.hedged == 1 and gateway.hedge_wins == 1
+
+        # No hedge when the route is at its limit
+        gateway = primed(SlowFirstProvider(), route_concurrency={"chat": 1})
+        assert await gateway.complete("chat", "s", "system", "hi") == "reply 1"
+        assert gateway.hedged == 0
+
+        # Cancelling the caller cancels the primary and releases every slot
+        provider = SlowFirstProvider()
+        gateway = primed(provider, max_concurrency=1)
+        call = asyncio.ensure_future(gateway.complete("chat", "s", "system", "hi"))
+        await asyncio.sleep(0.05)
+        call.cancel()
+        await asyncio.gather(call, return_exceptions=True)
+        await asyncio.sleep(0)
+        assert gateway._global._value == 1 and gateway._route_semaphore("chat")._value == 8
+        assert provider.calls == 1
+
+    def test_keyset_cursor(self):
+        from datetime import timedelta
+        from fastapi import HTTPException
+        from pagination import decode_cursor, encode_cursor, keyset_filter
+
+        base = datetime(2025, 1, 1, 12, 0, 0)
+        # Several messages share a timestamp, so the id must break ties
+        docs = [
+            {"id": f"m{i}", "timestamp": base + timedelta(seconds=i // 3)}
+            for i in range(8)
+        ]
+        newest_first = sorted(docs, key=lambda d: (d["timestamp"], d["id"]), reverse=True)
+
+        def matches(doc, condition):
+            (field, bound), = ((k, v) for k, v in condition.items() if k != "id")
+            if isinstance(bound, dict):
+                (op, value), = bound.items()
+                return doc[field] < value if op == "$lt" else doc[field] > value
+            (op, value), = condition["id"].items()
+            return doc[field] == bound and (doc["id"] < value if op == "$lt" else doc["id"] > value)
+
+        pages, cursor = [], None
+        while True:
+            rows = newest_first
+            if cursor:
+                query = keyset_filter("timestamp", cursor, "$lt")
+                rows = [d for d in rows if any(matches(d, c) for c in query["$or"])]
+            page = rows[:3]
+            if not page:
+                break
+            pages.append([d["id"] for d in page])
+            cursor = encode_cursor(page[-1]["timestamp"], page[-1]["id"])
+
+        walked = [doc_id for page in pages for doc_id in page]
+        assert walked == [d["id"] for d in newest_first], pages
+        assert decode_cursor(encode_cursor(base, "m1")) == (base, "m1")
+        try:
+            decode_cursor("not-a-cursor")
+            raise AssertionError("expected HTTP 400")
+        except HTTPException as e:
+            assert e.status_code == 400
+
+    def test_search_prefix(self):
+        from search import SearchIndex
+
+        index = SearchIndex()
+        # Many short names rank ahead of the long one on "university"
+        for i in range(300):
+            index.add("universities", {"id": f"u{i}", "name": f"University {'x' * (i % 7)}", "country": "Germany"})
+        long_name = "Zurich University of Applied Sciences and Arts of the Canton"
+        index.add("universities", {"id": "zurich", "name": long_name, "country": "Switzerland"})
+        index.add("universities", {"id": "zug", "name": "Zug Polytechnic", "country": "Switzerland"})
+
+        # Candidates come from the typed prefix; complete words score in full
+        results = {r["id"]: r["score"] for r in index.search("university zu", limit=50, prefix=True)}
+        assert set(results) == {"zurich", "zug"}, results
+        exact = index.search("university zurich", limit=1)[0]
+        assert exact["id"] == "zurich" and results["zurich"] == exact["score"], (results, exact)
+
+        # Common complete words must not make typeahead walk their postings
+        words = ["engineering", "science", "technology", "business", "medicine", "arts"]
+        index = SearchIndex()
+        for i in range(20000):
+            name = f"University of {words[i % 6]} {words[i // 6 % 6]} {'unit' if i % 50 == 0 else 'campus'} {i}"
+            index.add("universities", {"id": f"u{i}", "name": name})
+        index.warm()
+        timings = []
+        for _ in range(3):
+            started = time.perf_counter()
+            results = index.search("university engineering science un", limit=8, prefix=True)
+            timings.append(time.perf_counter() - started)
+        assert results and all("unit" in r["name"] for r in results), results
+        assert min(timings) < 0.01, f"typeahead took {min(timings) * 1000:.1f} ms"
+
+    async def test_catalog_search_refresh(self):
+        from search import CatalogSearch
+
+        search = CatalogSearch()
+        first = [{"id": "u1", "name": "Oxford University"}]
+        await search.refresh({"universities": first})
+        assert search.refresh({"universities": first}) is None, "an unchanged catalog should not resync"
+
+        # A reload syncs a copy in the background; queries use the old index until it lands
+        second = [{"id": "u1", "name": "Oxford University", "country": "UK"}, {"id": "u2", "name": "Cambridge University"}]
+        sync = search.refresh({"universities": second})
+        old = search.index
+        assert [r["id"] for r in search.search("cambridge")] == []
+        await sync
+        assert search.index is not old and len(old) == 1, "the old index must not be modified"
+        assert [r["id"] for r in search.search("cambridge")] == ["u2"]
+        assert search.search("oxford")[0]["document"]["country"] == "UK"
+
+    async def test_admission(self):
+        from admission import AdmissionController, AdmissionDenied, MemoryBucketStore
+
+        store = MemoryBucketStore()
+        admission = AdmissionController(store, student_rate=0.1, student_burst=2, global_rate=0.01, global_burst=3)
+        await admission.admit("s1")
+        await admission.admit("s1")
+        try:
+            await admission.admit("s1")
+            raise AssertionError("expected the student bucket to refuse")
+        except AdmissionDenied as e:
+            assert e.scope == "student", e.scope
+            # One token at 0.1/s is about ten seconds away
+            assert 9 < e.retry_after <= 10, e.retry_after
+
+        # The global budget runs out; the refused student keeps its token
+        await admission.admit("s2")
+        try:
+            await admission.admit("s3")
+            raise AssertionError("expected the global bucket to refuse")
+        except AdmissionDenied as e:
+            assert e.scope == "global", e.scope
+            assert 99 < e.retry_after <= 100, e.retry_after
+        assert store._buckets["student:s3"][0] == 2, "student token should be refunded"
+        assert admission.stats()["admitted"] == 3
+        assert admission.stats()["rejected"] == {"student": 1, "global": 1}
+
+        # Pruning judges each bucket by its own rate and burst
+        store = MemoryBucketStore(max_buckets=2)
+        await store.take("fast", rate=1000.0, burst=1.0)
+        await store.take("slow", rate=0.001, burst=100.0)
+        time.sleep(0.01)
+        await store.take("new", rate=0.001, burst=100.0)
+        assert "fast" not in store._buckets and "slow" in store._buckets, list(store._buckets)
+
+    def test_prompt_context_cache(self):
+        from prompts import PromptBuilder
+
+        builder = PromptBuilder(context_tokens=40)
+        student = {
+            "id": "s1", "name": "Ada", "university": "ETH", "faculty": "CS", "gpa": 3.5,
+            "completed_credits": 90, "total_credits": 120, "achievements": [f"Award {i}" for i in range(50)],
+            "extracurriculars": [], "preferred_countries": ["Germany"], "financial_situation": "moderate",
+            "career_goals": "Research", "updated_at": datetime(2025, 1, 1),
+        }
+        first = builder.student_context(student)
+        assert builder.student_context(dict(student)) is first
+        assert "more achievements" in first, "long lists should be fitted to the budget"
+
+        # A new revision renders again, even for a field edited in place
+        student["gpa"] = 3.9
+        student["updated_at"] = datetime(2025, 2, 1)
+        second = builder.student_context(student)
+        assert "GPA: 3.9" in second and "GPA: 3.5" in first
+        assert builder.stats()["hits"] == 1 and builder.stats()["misses"] == 2
+
+    def test_eligibility_matching(self):
+        from eligibility import EligibilityMatcher
+
+        def scholarship(id, fields, requirements):
+            return {
+                "id": id, "name": id, "provider": "P", "amount": 1000, "deadline": "2026-01-01",
+                "countries": ["Germany"], "fields": fields, "requirements": requirements,
+            }
+
+        matcher = EligibilityMatcher([
+            scholarship("lead", ["Engineering"], ["Leadership Experience"]),
+            scholarship("lab", ["Data Science"], ["Research Experience"]),
+            scholarship("any", ["All"], []),
+        ])
+        student = {
+            "gpa": 3.5, "completed_credits": 90, "preferred_countries": ["Germany"],
+            "faculty": "Mechanical Engineering",
+            "achievements": ["Misleading overhead on my laptop"], "extracurriculars": ["Collaborated on a mural"],
+        }
+        matches = {m["scholarship_id"]: m for m in matcher.match(student)}
+        assert set(matches) == {"lead", "any"}, "fields match on whole words only"
+        assert matches["lead"]["unverified_requirements"] == ["Leadership Experience"], "no substring keyword hits"
+
+        student["achievements"] = ["Team leader of the robotics club"]
+        assert matcher.match(student)[0]["met_requirements"] == ["Leadership Experience"]
+
+        # An unset faculty does not filter; a broader one still matches its sub-fields
+        assert len(matcher.match({**student, "faculty": ""})) == 3
+        assert {m["scholarship_id"] for m in matcher.match({**student, "faculty": "Science"})} == {"lab", "any"}
+        assert matcher._field_mask("science") is matcher._field_mask("Science")
+
+    async def test_write_behind(self):
+        from pymongo.errors import BulkWriteError
+        from write_behind import WriteBehindBuffer
+
+        class FakeCollection:
+            """Records insert_many batches; `errors` are raised one per call first"""
+            name = "records"
+
+            def __init__(self, errors=()):
+                self.batches = []
+                self.errors = list(errors)
+                self.gate = None
+
+            async def insert_many(self, docs, ordered=True):
+                if self.gate is not None:
+                    await self.gate.wait()
+                if self.errors:
+                    raise self.errors.pop(0)
+                self.batches.append([d["id"] for d in docs])
+
+        # A full batch wakes the flusher before the interval runs out
+        records = FakeCollection()
+        buffer = WriteBehindBuffer(records, max_batch=3, flush_interval=30)
+        buffer.start()
+        for i in range(3):
+            await buffer.add({"id": i})
+        assert records.batches == [], "async adds should not wait for the write"
+        await buffer.sync()
+        assert records.batches == [[0, 1, 2]], records.batches
+
+        # In ack mode concurrent adds share one insert and return once it lands
+        buffer.ack = True
+        await asyncio.gather(*(buffer.add({"id": i}) for i in range(3, 6)))
+        assert records.batches[1:] == [[3, 4, 5]], records.batches
+        await buffer.stop()
+
+        # Duplicate keys from a retried batch count as written; other errors retry
+        duplicate = BulkWriteError({"writeErrors": [
+            {"index": 0, "code": 11000, "errmsg": "duplicate key"},
+            {"index": 1, "code": 2, "errmsg": "bad value"},
+        ]})
+        records = FakeCollection([duplicate])
+        buffer = WriteBehindBuffer(records, flush_interval=30)
+        buffer.start()
+        await buffer.add({"id": "a"})
+        await buffer.add({"id": "b"})
+        await buffer.sync()
+        await buffer.sync()
+        assert records.batches == [["b"]], records.batches
+        assert buffer.stats()["written"] == 2 and buffer.stats()["retried"] == 1, buffer.stats()
+
+        # Errors outside pymongo fail the waiters, not the flusher
+        records.errors.append(ValueError("cannot encode object"))
+        try:
+            await buffer.add({"id": "c"}, wait=True)
+            raise AssertionError("expected the insert error")
+        except ValueError:
+            pass
+        assert not buffer._task.done(), "flusher should survive an unexpected error"
+        await buffer.stop()
+        assert records.batches[-1] == ["c"], records.batches
+
+        # stop() lets an insert in flight finish, then drains the rest
+        records = FakeCollection()
+        records.gate = asyncio.Event()
+        buffer = WriteBehindBuffer(records, max_batch=1, flush_interval=30)
+        buffer.start()
+        first = asyncio.ensure_future(buffer.add({"id": 1}, wait=True))
+        await asyncio.sleep(0.01)
+        await buffer.add({"id": 2})
+        stopping = asyncio.ensure_future(buffer.stop())
+        await asyncio.sleep(0.01)
+        records.gate.set()
+        await asyncio.wait_for(stopping, 1)
+        await asyncio.wait_for(first, 1)
+        assert records.batches == [[1], [2]], records.batches
+
+        # Cancelled mid-insert anyway: the batch is requeued and waiters fail
+        records = FakeCollection()
+        records.gate = asyncio.Event()
+        buffer = WriteBehindBuffer(records, flush_interval=30)
+        buffer.start()
+        waiter = asyncio.ensure_future(buffer.add({"id": 1}, wait=True))
+        buffer._wake.set()
+        await asyncio.sleep(0.01)
+        buffer._task.cancel()
+        await asyncio.gather(buffer._task, return_exceptions=True)
+        buffer._task = None
+        try:
+            await asyncio.wait_for(waiter, 1)
+            raise AssertionError("expected the interrupted batch to fail its waiters")
+        except RuntimeError:
+            pass
+        records.gate.set()
+        await buffer.stop()
+        assert records.batches == [[1]], records.batches
+
+    async def test_similarity_retrain(self):
+        import numpy as np
+        from similarity import FACULTY_SLOTS, FeatureEncoder, SimilarityIndex
+
+        encoder = FeatureEncoder()
+        for i in range(FACULTY_SLOTS * 4):
+            encoder.encode({"faculty": f"Faculty {i}"})
+        assert len(encoder.faculties) == FACULTY_SLOTS, "hashed values should not be stored"
+
+        def student(i, gpa, day=1):
+            return {
+                "id": f"s{i}", "gpa": gpa, "faculty": ["CS", "Bio", "Math", "Law"][i % 4],
+                "preferred_countries": ["USA"], "updated_at": datetime(2025, 1, day),
+            }
+
+        rng = np.random.default_rng(1)
+        index = SimilarityIndex(partitions=4, probes=4)
+        for i in range(400):
+            index.upsert(student(i, float(rng.uniform(2, 4))))
+        training = asyncio.ensure_future(index.retrain())
+        await asyncio.sleep(0)
+        # Written while k-means runs in its thread
+        index.upsert(student(3, 4.0, day=2))
+        index.upsert(student(400, 4.0, day=2))
+        await training
+        assert index.trained_size == 400 and index.offsets is not None
+        assert {index.rows["s3"], index.rows["s400"]} <= index.strays
+        assert all(index.ids[row] == student_id for student_id, row in index.rows.items())
+
+        # With every partition probed, results match a brute-force scan
+        vector = index.encode(student(3, 4.0))
+        distances = ((index.vectors[:len(index)] - vector) ** 2).sum(axis=1)
+        expected = {index.ids[row] for row in np.argsort(distances)[:5]}
+        assert {r["id"] for r in index.query(vector, k=5)} == expected
+
+    def test_similarity_batch_load(self):
+        import numpy as np
+        from similarity import SimilarityIndex
+
+        students = [
+            {
+                "id": f"s{i % 90}", "gpa": 2 + (i % 7) / 4, "completed_credits": i % 130, "total_credits": [0, 120][i % 2],
+                "achievements": ["x"] * (i % 12), "faculty": ["CS", "", "Bio", " cs "][i % 4],
+                "preferred_countries": [["USA"], [], ["UK", "USA"], ["usa", "USA "]][i % 4],
+                "updated_at": datetime(2025, 1, 1 + i // 90),
+            }
+            for i in range(180)
+        ]
+        one_by_one, batched = SimilarityIndex(), SimilarityIndex()
+        for student in students:
+            one_by_one.upsert(student)
+        # Stale copies in the batch or behind the index are skipped
+        assert batched.upsert_many(students[::-1]) == 90
+        assert batched.upsert_many(students[:90]) == 0
+        rows = [batched.rows[student_id] for student_id in one_by_one.ids]
+        assert np.array_equal(one_by_one.vectors[:90], batched.vectors[rows])
+        assert np.allclose(one_by_one.norms[:90], batched.norms[rows])
+
+        # Partitioned automatically once exact scans get slow, unless disabled
+        assert SimilarityIndex()._partitions_for(50000) == 0
+        assert SimilarityIndex()._partitions_for(1000000) == 1000
+        assert SimilarityIndex(partitions=0)._partitions_for(1000000) == 0
+
+    async def test_job_recovery(self):
+        from jobs import JobQueue
+
+        def matches(doc, query):
+            for field, condition in query.items():
+                if field == "$or":
+                    if not any(matches(doc, q) for q in condition):
+                        return False
+                    continue
+                value = doc.get(field)
+                if not isinstance(condition, dict):
+                    condition = {"$eq": condition}
+                for op, operand in condition.items():
+                    ok = {
+                        "$eq": lambda: value == operand,
+                        "$in": lambda: value in operand,
+                        "$nin": lambda: value not in operand,
+                        "$lt": lambda: value is not None and value < operand,
+                        "$exists": lambda: (field in doc) == operand,
+                    }[op]()
+                    if not ok:
+                        return False
+            return True
+
+        class FakeJobs:
+            """The few collection calls JobQueue makes, over a list of dicts"""
+
+            def __init__(self):
+                self.docs = []
+
+            async def insert_one(self, doc):
+                self.docs.append(dict(doc))
+
+            async def find_one(self, query, projection=None):
+                return next((dict(d) for d in self.docs if matches(d, query)), None)
+
+            async def update_one(self, query, update):
+                await self.find_one_and_update(query, update)
+
+            async def update_many(self, query, update):
+                for doc in self.docs:
+                    if matches(doc, query):
+                        doc.update(update["$set"])
+
+            async def find_one_and_update(self, query, update, projection=None, return_document=None):
+                for doc in self.docs:
+                    if matches(doc, query):
+                        doc.update(update["$set"])
+                        return dict(doc)
+                return None
+
+        collection = FakeJobs()
+        release = asyncio.Event()
+        runs = []
+
+        async def handler(payload):
+            runs.append(payload["n"])
+            await release.wait()
+            return "result"
+
+        # Worker A takes a job and keeps it past several lease lengths
+        a = JobQueue(collection, handler, workers=1, lease=0.15)
+        b = JobQueue(collection, handler, workers=1, lease=0.15)
+        a.start()
+        b.start()
+        job = await a.enqueue({"n": 1})
+        await asyncio.sleep(0.5)
+        assert runs == [1], "a live worker's heartbeat should keep its job"
+
+        # A dies mid-job; B reclaims the job once the lease runs out
+        await a.stop()
+        await asyncio.sleep(0.4)
+        assert runs == [1, 1] and b.stats()["recovered"] == 1, (runs, b.stats())
+        release.set()
+        await asyncio.sleep(0.05)
+        assert (await b.get(job["id"]))["status"] == "succeeded"
+        assert b.stats()["held"] == 0
+        await b.stop()
+
+    async def test_profile_cache_race(self):
+        from datetime import timezone
+        from profile_cache import ProfileCache
+
+        class SlowStudents:
+            """Stands in for the students collection; reads wait for `release`"""
+
+            def __init__(self):
+                self.doc = {"id": "s1", "gpa": 3.0, "updated_at": datetime(2025, 1, 1)}
+                self.release = asyncio.Event()
+
+            async def find_one(self, query, projection=None):
+                snapshot = dict(self.doc)
+                await self.release.wait()
+                return snapshot
+
+            async def find_one_and_update(self, query, update, projection=None, return_document=None):
+                previous = dict(self.doc)
+                self.doc.update(update["$set"])
+                return dict(self.doc) if return_document else previous
+
+        students = SlowStudents()
+        cache = ProfileCache(students)
+        # A miss starts reading the old document, then an update lands
+        read = asyncio.ensure_future(cache.get("s1"))
+        await asyncio.sleep(0)
+        previous, fresh = await cache.update(
+            "s1", {"gpa": 3.9, "updated_at": datetime(2025, 2, 1, tzinfo=timezone.utc)}
+        )
+        students.release.set()
+        await read
+        assert (await cache.get("s1"))["gpa"] == 3.9, "stale read overwrote the update"
+        assert fresh["updated_at"].tzinfo is not None
+        assert previous["gpa"] == 3.0 and previous["updated_at"].tzinfo is not None
+
+        # Loaded and written entries carry the same aware datetimes
+        cache = ProfileCache(students)
+        loaded = await cache.get("s1")
+        assert loaded["updated_at"] == fresh["updated_at"] and loaded["updated_at"].tzinfo is not None
+        cache.put({"id": "s2", "updated_at": datetime(2025, 1, 1)})
+        assert (await cache.get("s2"))["updated_at"].tzinfo is not None
+
+    def run_all_tests(self):
+        """Run all component checks"""
+        print("🧩 Starting component checks")
+        print("=" * 50)
+
+        self.check("LRU + TTL cache", self.test_ttl_cache)
+        self.check("Completion cache", self.test_completion_cache)
+        self.check("Single-flight", self.test_single_flight)
+        self.check("LLM gateway limits and deadlines", self.test_llm_gateway_limits)
+        self.check("LLM gateway hedging", self.test_llm_gateway_hedging)
+        self.check("OpenAI-compatible streaming", self.test_openai_streaming)
+        self.check("Keyset cursor round-trip", self.test_keyset_cursor)
+        self.check("Profile cache read/update race", self.test_profile_cache_race)
+        self.check("Search typeahead", self.test_search_prefix)
+        self.check("Catalog search background sync", self.test_catalog_search_refresh)
+        self.check("Token-bucket admission", self.test_admission)
+        self.check("Prompt context cache", self.test_prompt_context_cache)
+        self.check("Scholarship eligibility matching", self.test_eligibility_matching)
+        self.check("Write-behind buffer", self.test_write_behind)
+        self.check("Similarity index retraining", self.test_similarity_retrain)
+        self.check("Similarity batch load", self.test_similarity_batch_load)
+        self.check("Job heartbeat and recovery", self.test_job_recovery)
+
+        print("\n" + "=" * 50)
+        print(f"📊 Component Results: {self.tests_passed}/{self.tests_run} checks passed")
+        return 0 if self.tests_passed == self.tests_run else 1
+
 def main():
+    # --components runs only the in-process checks
+    components = ComponentTester().run_all_tests()
+    if "--components" in sys.argv:
+        return components
     tester = StudyPathAPITester()
-    return tester.run_all_tests()
+    return tester.run_all_tests() or components
 
 if __name__ == "__main__":
     sys.exit(main())
\ No newline at end of file